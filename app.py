@@ -1,70 +1,82 @@
-from flask import Flask, request, jsonify, render_template_string
+from flask import Flask, request, jsonify, render_template_string, has_request_context
 import yaml
 import os
-from datetime import datetime, timedelta
-import uuid
+
+from household import FORECAST_LIMIT, Household, UnknownReference, sample_data
+from idempotency import FlaskIdempotency, IdempotencyCache
+from schema import empty_document
+from snapshot import SnapshotFile
+from store import YamlStore
+from tenancy import FlaskTenancy, HouseholdPool
+from transfer import MIMETYPES, export_stream, import_stream, read_chunks
 
 app = Flask(__name__)
-DATA_FILE = 'chores.yaml'
+# CHORES_DATA_FILE may point at chore_app.py's file too; both are migrated to schema.py's layout
+DATA_FILE = os.environ.get('CHORES_DATA_FILE', 'chores.yaml')
+# Write-behind: set CHORES_FLUSH_MS to return from POSTs before the YAML is written,
+# flushing every N ms or after CHORES_FLUSH_EVERY mutations, whichever comes first
+FLUSH_MS = int(os.environ.get('CHORES_FLUSH_MS', '0'))
+FLUSH_EVERY = int(os.environ.get('CHORES_FLUSH_EVERY', '0'))
+# Workers share a memory-mapped snapshot at CHORES_SNAPSHOT instead of each
+# re-reading the YAML (see snapshot.py); hand edits then need a SIGHUP to serve.py
+SNAPSHOT_FILE = os.environ.get('CHORES_SNAPSHOT')
+store = YamlStore(
+    DATA_FILE,
+    default=sample_data,
+    watch=not SNAPSHOT_FILE,
+    flush_interval=FLUSH_MS / 1000 or None,
+    flush_every=FLUSH_EVERY or None,
+)
+household = Household(store, dumps=app.json.dumps,
+                      snapshot=SnapshotFile(SNAPSHOT_FILE) if SNAPSHOT_FILE else None)
+
+# Hosted households under /h/<household_id>/, one file each in CHORES_HOUSEHOLDS_DIR
+HOUSEHOLDS_DIR = os.environ.get('CHORES_HOUSEHOLDS_DIR', 'households')
+MAX_HOUSEHOLDS = int(os.environ.get('CHORES_MAX_HOUSEHOLDS', '1000'))
+HOUSEHOLD_MEMORY_MB = int(os.environ.get('CHORES_HOUSEHOLD_MEMORY_MB', '256'))
+
+def open_household(path):
+    return Household(YamlStore(
+        path,
+        default=empty_document,
+        watch=False,
+        flush_interval=FLUSH_MS / 1000 or None,
+        flush_every=FLUSH_EVERY or None,
+    ), dumps=app.json.dumps)
+
+pool = HouseholdPool(HOUSEHOLDS_DIR, open_household, MAX_HOUSEHOLDS, HOUSEHOLD_MEMORY_MB * 1024 * 1024)
+tenancy = FlaskTenancy(app, pool, default=household)
+# The household the current request is for
+current_household = tenancy.current
+# Retried POSTs carrying an Idempotency-Key get the first response back (see idempotency.py)
+idempotency = FlaskIdempotency(app, IdempotencyCache(), lambda: current_household().store.path,
+                               streamed=('import_rows',))
 
 # Initialize sample data if file doesn't exist
 def init_data():
     if not os.path.exists(DATA_FILE):
-        sample_data = {
-            'family_members': ['Alice', 'Bob'],
-            'rooms': [
-                {
-                    'id': str(uuid.uuid4()),
-                    'name': 'Kitchen',
-                    'frequency': 'weekly',
-                    'assigned_to': None,
-                    'tasks': [
-                        {'id': str(uuid.uuid4()), 'name': 'Wash dishes', 'frequency': 'daily', 'assigned_to': 'Alice', 'history': []},
-                        {'id': str(uuid.uuid4()), 'name': 'Clean counters', 'frequency': 'weekly', 'assigned_to': 'Bob', 'history': []}
-                    ]
-                },
-                {
-                    'id': str(uuid.uuid4()),
-                    'name': 'Living Room',
-                    'frequency': 'weekly',
-                    'assigned_to': None,
-                    'tasks': [
-                        {'id': str(uuid.uuid4()), 'name': 'Vacuum floor', 'frequency': 'weekly', 'assigned_to': 'Alice', 'history': []}
-                    ]
-                }
-            ]
-        }
         with open(DATA_FILE, 'w') as f:
-            yaml.safe_dump(sample_data, f)
+            yaml.safe_dump(sample_data(), f)
 
-# Load data from YAML
+# Load data from the in-memory store (reloaded by the watcher when the YAML changes)
 def load_data():
-    if not os.path.exists(DATA_FILE):
+    if current_household() is household and not store.loaded:
         init_data()
-    with open(DATA_FILE, 'r') as f:
-        return yaml.safe_load(f) or {'family_members': [], 'rooms': []}
+    return current_household().load()
 
-# Save data to YAML
+# Save data to YAML (callers can force a durable write with ?sync=1 or "sync": true)
 def save_data(data):
-    with open(DATA_FILE, 'w') as f:
-        yaml.safe_dump(data, f)
+    current_household().save(data, sync=wants_sync())
 
-# Check if task is due
-def is_task_due(task):
-    if not task['history']:
+def wants_sync():
+    if not has_request_context():
+        return False
+    if request.args.get('sync', '').lower() in ('1', 'true'):
         return True
-    last_completed = datetime.fromisoformat(task['history'][-1])
-    frequency_map = {
-        'daily': timedelta(days=1),
-        'weekly': timedelta(weeks=1),
-        'monthly': timedelta(days=30)
-    }
-    delta = frequency_map.get(task['frequency'], timedelta(days=1))
-    return datetime.now() >= last_completed + delta
+    body = request.get_json(silent=True)
+    return isinstance(body, dict) and bool(body.get('sync'))
 
-@app.route('/')
-def index():
-    return render_template_string('''
+INDEX_HTML = '''
 <!DOCTYPE html>
 <html lang="en">
 <head>
@@ -111,26 +123,28 @@ def index():
 
         // Load initial data
         async function loadData() {
-            const response = await fetch('/data');
+            const filterPerson = document.getElementById('filter-person').value;
+            const response = await fetch(filterPerson ? `data?person=${encodeURIComponent(filterPerson)}` : 'data');
             data = await response.json();
-            renderFilterOptions();
-            renderRooms();
+            renderFilterOptions(filterPerson);
+            renderRooms(filterPerson);
         }
 
         // Render filter dropdown
-        function renderFilterOptions() {
+        function renderFilterOptions(selected = '') {
             const filterSelect = document.getElementById('filter-person');
             filterSelect.innerHTML = `<option value="">All Members</option>` + 
-                data.family_members.map(member => 
-                    `<option value="${member}">${member}</option>`
+                data.members.map(member => 
+                    `<option value="${member.id}">${member.name}</option>`
                 ).join('');
+            filterSelect.value = selected;
         }
 
         // Render rooms and tasks
         function renderRooms(filterPerson = '') {
             const roomsDiv = document.getElementById('rooms');
             roomsDiv.innerHTML = data.rooms.map(room => {
-                const tasksDue = room.tasks.filter(task => task.is_due && (!filterPerson || task.assigned_to === filterPerson));
+                const tasksDue = room.tasks.filter(task => task.is_due && (!filterPerson || task.assigned_to_id === filterPerson));
                 if (tasksDue.length === 0 && filterPerson) return '';
                 return `
                     <div class="bg-white p-4 rounded shadow" draggable="true" 
@@ -141,8 +155,8 @@ def index():
                         <div class="mt-2">
                             <select onchange="assignRoom('${room.id}', this.value)" class="border p-1 rounded">
                                 <option value="">Assign Room</option>
-                                ${data.family_members.map(member => 
-                                    `<option value="${member}" ${room.assigned_to === member ? 'selected' : ''}>${member}</option>`
+                                ${data.members.map(member => 
+                                    `<option value="${member.id}" ${room.assigned_to_id === member.id ? 'selected' : ''}>${member.name}</option>`
                                 ).join('')}
                             </select>
                         </div>
@@ -153,8 +167,8 @@ def index():
                                         onchange="completeTask('${room.id}', '${task.id}', this.checked)">
                                     <span>${task.name} (${task.frequency}) - Assigned to: </span>
                                     <select onchange="reassignTask('${room.id}', '${task.id}', this.value)" class="border p-1 rounded">
-                                        ${data.family_members.map(member => 
-                                            `<option value="${member}" ${task.assigned_to === member ? 'selected' : ''}>${member}</option>`
+                                        ${data.members.map(member => 
+                                            `<option value="${member.id}" ${task.assigned_to_id === member.id ? 'selected' : ''}>${member.name}</option>`
                                         ).join('')}
                                     </select>
                                     <button onclick="toggleHistory('${task.id}')" class="text-blue-500 hover:underline">History</button>
@@ -176,10 +190,13 @@ def index():
                                 <option value="daily">Daily</option>
                                 <option value="weekly">Weekly</option>
                                 <option value="monthly">Monthly</option>
+                                <option value="weekdays">Weekdays</option>
+                                <option value="every 2nd tuesday">Every 2nd Tuesday</option>
+                                <option value="1st of the month">1st of the month</option>
                             </select>
                             <select id="task-assigned-${room.id}" class="border p-1 rounded">
-                                ${data.family_members.map(member => 
-                                    `<option value="${member}">${member}</option>`
+                                ${data.members.map(member => 
+                                    `<option value="${member.id}">${member.name}</option>`
                                 ).join('')}
                             </select>
                             <button onclick="addTask('${room.id}')" 
@@ -202,19 +219,21 @@ def index():
         async function drop(event, targetRoomId) {
             event.preventDefault();
             if (draggedRoomId && draggedRoomId !== targetRoomId) {
-                await fetch('/reorder_rooms', {
+                // Dropped on the top half of a room: land before it, otherwise after it
+                const box = event.currentTarget.getBoundingClientRect();
+                const side = event.clientY < box.top + box.height / 2 ? 'before_id' : 'after_id';
+                await fetch('move_room', {
                     method: 'POST',
                     headers: {'Content-Type': 'application/json'},
-                    body: JSON.stringify({dragged_id: draggedRoomId, target_id: targetRoomId})
+                    body: JSON.stringify({room_id: draggedRoomId, [side]: targetRoomId})
                 });
                 await loadData();
             }
         }
 
-        // Filter tasks by person
-        function filterTasks() {
-            const filterPerson = document.getElementById('filter-person').value;
-            renderRooms(filterPerson);
+        // Filter tasks by person (the server only sends that person's tasks)
+        async function filterTasks() {
+            await loadData();
         }
 
         // Add room
@@ -226,7 +245,7 @@ def index():
             const frequency = frequencySelect.value;
             const assigned_to = assignedSelect.value || null;
             if (name) {
-                await fetch('/add_room', {
+                await fetch('add_room', {
                     method: 'POST',
                     headers: {'Content-Type': 'application/json'},
                     body: JSON.stringify({name, frequency, assigned_to})
@@ -246,7 +265,7 @@ def index():
             const frequency = frequencySelect.value;
             const assigned_to = assignedSelect.value;
             if (name) {
-                await fetch('/add_task', {
+                await fetch('add_task', {
                     method: 'POST',
                     headers: {'Content-Type': 'application/json'},
                     body: JSON.stringify({room_id: roomId, name, frequency, assigned_to})
@@ -258,7 +277,7 @@ def index():
 
         // Complete task
         async function completeTask(roomId, taskId, completed) {
-            await fetch('/complete_task', {
+            await fetch('complete_task', {
                 method: 'POST',
                 headers: {'Content-Type': 'application/json'},
                 body: JSON.stringify({room_id: roomId, task_id: taskId, completed})
@@ -268,7 +287,7 @@ def index():
 
         // Reassign task
         async function reassignTask(roomId, taskId, assignedTo) {
-            await fetch('/reassign_task', {
+            await fetch('reassign_task', {
                 method: 'POST',
                 headers: {'Content-Type': 'application/json'},
                 body: JSON.stringify({room_id: roomId, task_id: taskId, assigned_to: assignedTo})
@@ -278,7 +297,7 @@ def index():
 
         // Assign room
         async function assignRoom(roomId, assignedTo) {
-            await fetch('/assign_room', {
+            await fetch('assign_room', {
                 method: 'POST',
                 headers: {'Content-Type': 'application/json'},
                 body: JSON.stringify({room_id: roomId, assigned_to: assignedTo || null})
@@ -294,7 +313,7 @@ def index():
 
         // Delete history entry
         async function deleteHistory(roomId, taskId, index) {
-            await fetch('/delete_history', {
+            await fetch('delete_history', {
                 method: 'POST',
                 headers: {'Content-Type': 'application/json'},
                 body: JSON.stringify({room_id: roomId, task_id: taskId, index})
@@ -307,122 +326,195 @@ def index():
     </script>
 </body>
 </html>
-    ''')
+'''
+
+@app.route('/')
+def index():
+    return render_template_string(INDEX_HTML)
 
 @app.route('/data')
 def get_data():
-    data = load_data()
-    for room in data['rooms']:
-        for task in room['tasks']:
-            task['is_due'] = is_task_due(task)
-    return jsonify(data)
+    load_data()
+    person = request.args.get('person')
+    body = current_household().render_person(person) if person else current_household().render_data()
+    return app.response_class(body, mimetype=app.json.mimetype)
+
+# Task counts per room and member: total, due (overdue included), overdue and done
+@app.route('/summary')
+def summary():
+    return jsonify(current_household().summary())
+
+# How late tasks get done: lateness quantiles overall, per room and member, and for ?task_id=
+@app.route('/stats')
+def stats():
+    return jsonify(current_household().stats(request.args.get('task_id') or None))
+
+# Every occurrence due in the next ?days=N days (default 7), optionally for one ?person=;
+# ?limit= at a time, the page after the one whose next cursor is passed as ?after=
+@app.route('/forecast')
+def forecast():
+    try:
+        days = int(request.args.get('days', 7))
+        limit = int(request.args.get('limit', FORECAST_LIMIT))
+        return jsonify(current_household().forecast(days, request.args.get('person') or None,
+                                                    limit=limit, after=request.args.get('after') or None))
+    except ValueError as e:
+        return jsonify({'status': 'error', 'error': str(e)}), 400
+
+# Tasks matching a filter query, as ?q=<text> or a JSON spec posted as the body (see query.py);
+# ?explain=1 adds the plan it ran
+@app.route('/query', methods=['GET', 'POST'])
+def query():
+    spec = (request.get_json(silent=True) or {}) if request.method == 'POST' else request.args.get('q', '')
+    explain = request.args.get('explain', '').lower() in ('1', 'true')
+    try:
+        return jsonify(current_household().query(spec, explain))
+    except ValueError as e:
+        return jsonify({'status': 'error', 'error': str(e)}), 400
+
+# Rooms and tasks whose names match ?q=, best first, up to ?limit= (default 20)
+@app.route('/search')
+def search():
+    try:
+        limit = int(request.args.get('limit', 20))
+        return jsonify(current_household().search(request.args.get('q', ''), limit))
+    except ValueError as e:
+        return jsonify({'status': 'error', 'error': str(e)}), 400
+
+# Completions per ?resolution=day|week|month (default day) from ?start= to ?end= (ISO dates)
+@app.route('/completions')
+def completions():
+    try:
+        return jsonify(current_household().completions(request.args.get('resolution', 'day'),
+                                                       request.args.get('start') or None,
+                                                       request.args.get('end') or None))
+    except ValueError as e:
+        return jsonify({'status': 'error', 'error': str(e)}), 400
+
+@app.route('/metrics')
+def metrics():
+    return jsonify({**current_household().metrics(), 'households': pool.stats(),
+                    'idempotency': idempotency.cache.stats()})
+
+@app.route('/export')
+def export():
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in MIMETYPES:
+        return jsonify({'status': 'error', 'error': 'format must be ndjson or csv'}), 400
+    load_data()
+    return app.response_class(export_stream(current_household(), fmt), mimetype=MIMETYPES[fmt])
+
+# Rows stream in as the request body; only ?sync=1 is honoured since the body is not JSON
+@app.route('/import', methods=['POST'])
+def import_rows():
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in MIMETYPES:
+        return jsonify({'status': 'error', 'error': 'format must be ndjson or csv'}), 400
+    load_data()
+    sync = request.args.get('sync', '').lower() in ('1', 'true')
+    report = import_stream(current_household(), read_chunks(request.stream), fmt, sync=sync)
+    return jsonify({'status': 'success', **report})
 
 @app.route('/add_room', methods=['POST'])
 def add_room():
-    data = load_data()
-    room = {
-        'id': str(uuid.uuid4()),
-        'name': request.json['name'],
-        'frequency': request.json['frequency'],
-        'assigned_to': request.json.get('assigned_to'),
-        'tasks': []
-    }
-    data['rooms'].append(room)
-    save_data(data)
+    current_household().add_room(request.json, sync=wants_sync())
     return jsonify({'status': 'success'})
 
 @app.route('/add_task', methods=['POST'])
 def add_task():
-    data = load_data()
-    room_id = request.json['room_id']
-    task = {
-        'id': str(uuid.uuid4()),
-        'name': request.json['name'],
-        'frequency': request.json['frequency'],
-        'assigned_to': request.json['assigned_to'],
-        'history': []
-    }
-    for room in data['rooms']:
-        if room['id'] == room_id:
-            room['tasks'].append(task)
-            break
-    save_data(data)
+    current_household().add_task(request.json, sync=wants_sync())
     return jsonify({'status': 'success'})
 
 @app.route('/complete_task', methods=['POST'])
 def complete_task():
-    data = load_data()
-    room_id = request.json['room_id']
-    task_id = request.json['task_id']
-    completed = request.json['completed']
-    for room in data['rooms']:
-        if room['id'] == room_id:
-            for task in room['tasks']:
-                if task['id'] == task_id:
-                    if completed:
-                        task['history'].append(datetime.now().isoformat())
-                    elif task['history']:
-                        task['history'].pop()
-                    break
-    save_data(data)
+    current_household().complete_task(request.json, sync=wants_sync())
     return jsonify({'status': 'success'})
 
 @app.route('/reassign_task', methods=['POST'])
 def reassign_task():
-    data = load_data()
-    room_id = request.json['room_id']
-    task_id = request.json['task_id']
-    assigned_to = request.json['assigned_to']
-    for room in data['rooms']:
-        if room['id'] == room_id:
-            for task in room['tasks']:
-                if task['id'] == task_id:
-                    task['assigned_to'] = assigned_to
-                    break
-    save_data(data)
+    current_household().reassign_task(request.json, sync=wants_sync())
     return jsonify({'status': 'success'})
 
 @app.route('/assign_room', methods=['POST'])
 def assign_room():
-    data = load_data()
-    room_id = request.json['room_id']
-    assigned_to = request.json['assigned_to']
-    for room in data['rooms']:
-        if room['id'] == room_id:
-            room['assigned_to'] = assigned_to
-            for task in room['tasks']:
-                task['assigned_to'] = assigned_to if assigned_to else task['assigned_to']
-            break
-    save_data(data)
+    current_household().assign_room(request.json, sync=wants_sync())
     return jsonify({'status': 'success'})
 
+@app.route('/move_room', methods=['POST'])
+def move_room():
+    room = current_household().move_room(request.json, sync=wants_sync())
+    return jsonify({'status': 'success', 'order': room['order']})
+
 @app.route('/reorder_rooms', methods=['POST'])
 def reorder_rooms():
-    data = load_data()
-    dragged_id = request.json['dragged_id']
-    target_id = request.json['target_id']
-    rooms = data['rooms']
-    dragged_index = next(i for i, room in enumerate(rooms) if room['id'] == dragged_id)
-    target_index = next(i for i, room in enumerate(rooms) if room['id'] == target_id)
-    rooms.insert(target_index, rooms.pop(dragged_index))
-    save_data(data)
+    current_household().reorder_rooms(request.json, sync=wants_sync())
+    return jsonify({'status': 'success'})
+
+@app.route('/bulk_complete', methods=['POST'])
+def bulk_complete():
+    affected = current_household().bulk_complete(request.json, sync=wants_sync())
+    return jsonify({'status': 'success', 'affected': affected})
+
+@app.route('/bulk_assign', methods=['POST'])
+def bulk_assign():
+    affected = current_household().bulk_assign(request.json, sync=wants_sync())
+    return jsonify({'status': 'success', 'affected': affected})
+
+@app.route('/bulk_update', methods=['POST'])
+def bulk_update():
+    affected = current_household().bulk_update(request.json, sync=wants_sync())
+    return jsonify({'status': 'success', 'affected': affected})
+
+@app.route('/add_member', methods=['POST'])
+def add_member():
+    member = current_household().add_member(request.json, sync=wants_sync())
+    return jsonify({'status': 'success', 'member': member})
+
+@app.route('/rename_member', methods=['POST'])
+def rename_member():
+    current_household().rename_member(request.json, sync=wants_sync())
+    return jsonify({'status': 'success'})
+
+@app.route('/delete_member', methods=['POST'])
+def delete_member():
+    current_household().delete_member(request.json, sync=wants_sync())
     return jsonify({'status': 'success'})
 
+# Fair assignment: {select?} hands tasks (unassigned ones by default) to the least loaded members
+@app.route('/auto_assign', methods=['POST'])
+def auto_assign():
+    affected = current_household().auto_assign(request.get_json(silent=True) or {}, sync=wants_sync())
+    return jsonify({'status': 'success', 'affected': affected})
+
+@app.route('/rebalance', methods=['POST'])
+def rebalance():
+    affected = current_household().rebalance(request.get_json(silent=True) or {}, sync=wants_sync())
+    return jsonify({'status': 'success', 'affected': affected})
+
+# {member_id, exclude: [room or task ids]}: what the member is never given automatically
+@app.route('/set_exclusions', methods=['POST'])
+def set_exclusions():
+    current_household().set_exclusions(request.json, sync=wants_sync())
+    return jsonify({'status': 'success'})
+
+# Unknown rooms, tasks or members in a request body
+@app.errorhandler(UnknownReference)
+def unknown_reference(e):
+    return jsonify({'status': 'error', 'error': 'missing or unknown %s' % e}), 400
+
+# Malformed request bodies, such as a bulk selector with a mistyped key
+@app.errorhandler(ValueError)
+def invalid_request(e):
+    return jsonify({'status': 'error', 'error': str(e)}), 400
+
 @app.route('/delete_history', methods=['POST'])
 def delete_history():
-    data = load_data()
-    room_id = request.json['room_id']
-    task_id = request.json['task_id']
-    index = request.json['index']
-    for room in data['rooms']:
-        if room['id'] == room_id:
-            for task in room['tasks']:
-                if task['id'] == task_id and index < len(task['history']):
-                    task['history'].pop(index)
-                    break
-    save_data(data)
+    current_household().delete_history(request.json, sync=wants_sync())
     return jsonify({'status': 'success'})
 
+idempotency.mount()
+tenancy.mount()
+
 if __name__ == '__main__':
     init_data()
-    app.run(debug=True)
\ No newline at end of file
+    app.run(debug=True)
@@ -0,0 +1,566 @@
+"""asyncio/ASGI front end for app.py's API.
+
+    uvicorn asgi_app:app --port 8000
+
+Serves the same routes as app.py (``/``, ``/data``, ``/add_room``,
+``/complete_task``, ...) against the same Household, with two additions for
+clients that want to hear about changes without polling:
+
+    GET /poll?version=N   long-poll: answers with /data as soon as the store
+                          version moves past N or a task falls due (or after
+                          CHORES_POLL_TIMEOUT s)
+    GET /events           server-sent events, one ``version`` event per change
+                          and a ``due`` event listing the tasks that fell due
+
+Store work (locking, YAML writes) runs on a bounded thread pool so the event
+loop only ever waits on it; idle long-poll and SSE clients cost one coroutine
+each. A background task runs every household's ``tick()`` each
+CHORES_DUE_TICK seconds so due transitions reach clients without a request
+to trigger them. Every route is also served under ``/h/<household_id>/`` for the hosted
+households in app.py's pool (see tenancy.py).
+"""
+import asyncio
+import collections
+import hashlib
+import json
+import os
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+
+from app import INDEX_HTML, household as default_household, load_data, pool, store
+from household import FORECAST_LIMIT, Household
+from idempotency import CONFLICT, HEADER, IdempotencyCache, IdempotencyConflict, fingerprint, parse_key
+from tenancy import InvalidHousehold
+from transfer import MIMETYPES, export_stream, import_stream
+
+IO_THREADS = int(os.environ.get('CHORES_IO_THREADS', '8'))
+# Jobs allowed in or waiting for the pool before new requests wait their turn
+IO_QUEUE = int(os.environ.get('CHORES_IO_QUEUE', '64'))
+POLL_TIMEOUT = float(os.environ.get('CHORES_POLL_TIMEOUT', '25'))
+SSE_KEEPALIVE = 15
+DUE_TICK = float(os.environ.get('CHORES_DUE_TICK', '1'))
+# Batches of due transitions kept for SSE clients that fall behind
+DUE_BACKLOG = 64
+MAX_BODY = 1024 * 1024
+
+# Household methods, called with the request's household
+MUTATIONS = {
+    '/add_room': Household.add_room,
+    '/add_task': Household.add_task,
+    '/complete_task': Household.complete_task,
+    '/reassign_task': Household.reassign_task,
+    '/assign_room': Household.assign_room,
+    '/reorder_rooms': Household.reorder_rooms,
+    '/move_room': Household.move_room,
+    '/bulk_complete': Household.bulk_complete,
+    '/bulk_assign': Household.bulk_assign,
+    '/bulk_update': Household.bulk_update,
+    '/delete_history': Household.delete_history,
+    '/add_member': Household.add_member,
+    '/rename_member': Household.rename_member,
+    '/delete_member': Household.delete_member,
+    '/auto_assign': Household.auto_assign,
+    '/rebalance': Household.rebalance,
+    '/set_exclusions': Household.set_exclusions,
+}
+# Responses to POSTs carrying an Idempotency-Key, replayed to retries (see idempotency.py)
+idempotency_cache = IdempotencyCache()
+
+
+class ChangeHub:
+    """Lets any number of coroutines wait for the store version to move on or tasks to fall due."""
+
+    def __init__(self, version):
+        self.version = version
+        # Serial number of the latest batch of due transitions, and the recent batches
+        self.due_serial = 0
+        self.due_batches = collections.deque(maxlen=DUE_BACKLOG)
+        self._changed = asyncio.Event()
+
+    def publish(self, version):
+        self.version = version
+        self._wake()
+
+    def publish_due(self, tasks):
+        self.due_serial += 1
+        self.due_batches.append((self.due_serial, tasks))
+        self._wake()
+
+    def due_since(self, serial):
+        return [task for batch_serial, tasks in self.due_batches if batch_serial > serial for task in tasks]
+
+    def _wake(self):
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    async def wait_past(self, version, timeout, due_serial=None):
+        """Waits for a version above ``version`` or, given ``due_serial``, due transitions after it."""
+        while self.version <= version and (due_serial is None or self.due_serial <= due_serial):
+            try:
+                await asyncio.wait_for(self._changed.wait(), timeout)
+            except asyncio.TimeoutError:
+                return False
+        return True
+
+
+class Runtime:
+    """Per-event-loop state, created on startup."""
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.executor = ThreadPoolExecutor(max_workers=IO_THREADS, thread_name_prefix='chores-io')
+        self.io_slots = asyncio.Semaphore(IO_QUEUE)
+        # One hub per loaded store; an evicted household's hub goes with its store
+        self.hubs = weakref.WeakKeyDictionary()
+        # Households whose due transitions are pushed to clients
+        self.ticking = weakref.WeakSet()
+        self.ticker = loop.create_task(self.tick_forever())
+
+    def hub_for(self, household):
+        store = household.store
+        hub = self.hubs.get(store)
+        if hub is None:
+            hub = self.hubs[store] = ChangeHub(store.version)
+            # Called on whichever thread saved or reloaded
+            store.subscribe(lambda store, reloaded: self.loop.call_soon_threadsafe(hub.publish, store.version))
+            household.subscribe_due(lambda household, tasks: self.loop.call_soon_threadsafe(hub.publish_due, tasks))
+            self.ticking.add(household)
+        return hub
+
+    async def tick_forever(self):
+        while True:
+            await asyncio.sleep(DUE_TICK)
+            for household in list(self.ticking):
+                await self.run_io(household.tick)
+
+    async def run_io(self, fn, *args):
+        async with self.io_slots:
+            return await self.loop.run_in_executor(self.executor, fn, *args)
+
+    async def close(self):
+        self.ticker.cancel()
+        await self.loop.run_in_executor(self.executor, store.close)
+        await self.loop.run_in_executor(self.executor, pool.close)
+        self.executor.shutdown(wait=True)
+
+
+runtime = None
+
+
+async def startup():
+    global runtime
+    if runtime is None:
+        runtime = Runtime(asyncio.get_running_loop())
+        runtime.hub_for(default_household)
+        await runtime.run_io(load_data)
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        await lifespan(receive, send)
+        return
+    if scope['type'] != 'http':
+        return
+    await startup()
+    path = scope['path']
+    if not path.startswith('/h/'):
+        await route(scope, receive, send, default_household, path)
+        return
+    household_id, slash, rest = path[len('/h/'):].partition('/')
+    if not slash:
+        await respond(send, 308, b'', 'text/plain', [(b'location', (path + '/').encode())])
+        return
+    try:
+        # acquire() waits while an evicted household is written out
+        entry = await runtime.run_io(pool.acquire, household_id)
+    except InvalidHousehold:
+        await respond_json(send, 404, {'status': 'error', 'error': 'not found'})
+        return
+    try:
+        await route(scope, receive, send, entry.household, '/' + rest)
+    finally:
+        await runtime.run_io(pool.release, entry)
+
+
+async def route(scope, receive, send, household, path):
+    method = scope['method']
+    query = parse_qs(scope.get('query_string', b'').decode())
+
+    if method == 'GET' and path == '/':
+        await respond(send, 200, INDEX_HTML.encode(), 'text/html; charset=utf-8')
+    elif method == 'GET' and path == '/data':
+        person = query.get('person', [''])[0]
+        render = (lambda: household.render_person(person)) if person else household.render_data
+        await respond_json_bytes(send, await runtime.run_io(render))
+    elif method == 'GET' and path == '/summary':
+        await respond_json(send, 200, await runtime.run_io(household.summary))
+    elif method == 'GET' and path == '/stats':
+        await stats(send, household, query)
+    elif method == 'GET' and path == '/forecast':
+        await forecast(send, household, query)
+    elif method in ('GET', 'POST') and path == '/query':
+        await run_query(receive, send, household, method, query)
+    elif method == 'GET' and path == '/search':
+        await search(send, household, query)
+    elif method == 'GET' and path == '/completions':
+        await completions(send, household, query)
+    elif method == 'GET' and path == '/metrics':
+        metrics = await runtime.run_io(household.metrics)
+        await respond_json(send, 200, {**metrics, 'households': pool.stats(), 'idempotency': idempotency_cache.stats()})
+    elif method == 'GET' and path == '/poll':
+        await long_poll(send, household, query)
+    elif method == 'GET' and path == '/events':
+        await events(receive, send, runtime.hub_for(household))
+    elif method == 'GET' and path == '/export':
+        await export(send, household, query)
+    elif method == 'POST' and path == '/import':
+        await idempotent(scope, receive, send, household,
+                         lambda receive, send: import_rows(receive, send, household, query), streamed=True)
+    elif method == 'POST' and path in MUTATIONS:
+        await idempotent(scope, receive, send, household,
+                         lambda receive, send: mutate(receive, send, household, MUTATIONS[path], query))
+    elif path in MUTATIONS or path in ('/', '/data', '/summary', '/stats', '/forecast', '/query', '/search', '/completions', '/metrics', '/poll', '/events', '/export', '/import'):
+        await respond_json(send, 405, {'status': 'error', 'error': 'method not allowed'})
+    else:
+        await respond_json(send, 404, {'status': 'error', 'error': 'not found'})
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await startup()
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            if runtime is not None:
+                await runtime.close()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def idempotent(scope, receive, send, household, handler, streamed=False):
+    """Runs ``handler(receive, send)`` once per Idempotency-Key and household; retries get its response.
+
+    The body is read up front for the key's fingerprint, or with ``streamed``
+    digested as the handler reads it and checked against a retry's before
+    its response is replayed.
+    """
+    try:
+        key = parse_key(dict(scope['headers']).get(HEADER.lower().encode(), b'').decode('latin-1') or None)
+    except ValueError as e:
+        await respond_json(send, 400, {'status': 'error', 'error': str(e)})
+        return
+    if key is None:
+        await handler(receive, send)
+        return
+    body = b''
+    if streamed:
+        receive = stream = ReceiveDigest(receive)
+    else:
+        try:
+            body = await read_body(receive)
+        except BodyTooLarge as e:
+            await respond_json(send, 413, {'status': 'error', 'error': str(e)})
+            return
+        receive = replay_body(body)
+    key = (household.store.path, key)
+    request = fingerprint(scope['path'], scope.get('query_string', b''), body)
+    try:
+        while True:
+            state, value = idempotency_cache.lookup(key, request)
+            if state != 'wait':
+                break
+            await asyncio.wrap_future(value)
+    except IdempotencyConflict as e:
+        await respond_json(send, 422, {'status': 'error', 'error': str(e)})
+        return
+    if state == 'replay':
+        status, headers, body, digest = value
+        if digest is not None and await stream.finish() != digest:
+            idempotency_cache.conflicts += 1
+            await respond_json(send, 422, {'status': 'error', 'error': CONFLICT})
+            return
+        headers = [*headers, (b'idempotent-replayed', b'true')]
+    else:
+        messages = []
+
+        async def record(message):
+            messages.append(message)
+
+        try:
+            await handler(receive, record)
+        except BaseException:
+            idempotency_cache.abandon(key)
+            raise
+        status, headers = messages[0]['status'], messages[0]['headers']
+        body = b''.join(message.get('body', b'') for message in messages[1:])
+        digest = await stream.finish() if streamed else None
+        idempotency_cache.store(key, (status, headers, body, digest))
+    await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def mutate(receive, send, household, operation, query):
+    try:
+        payload = json.loads(await read_body(receive) or b'{}')
+    except BodyTooLarge as e:
+        await respond_json(send, 413, {'status': 'error', 'error': str(e)})
+        return
+    except ValueError:
+        await respond_json(send, 400, {'status': 'error', 'error': 'invalid JSON body'})
+        return
+    if not isinstance(payload, dict):
+        await respond_json(send, 400, {'status': 'error', 'error': 'expected a JSON object'})
+        return
+    sync = query.get('sync', [''])[0].lower() in ('1', 'true') or bool(payload.get('sync'))
+    try:
+        result = await runtime.run_io(lambda: operation(household, payload, sync=sync))
+    except ValueError as e:
+        await respond_json(send, 400, {'status': 'error', 'error': str(e)})
+        return
+    except (KeyError, StopIteration) as e:
+        await respond_json(send, 400, {'status': 'error', 'error': 'missing or unknown %s' % e})
+        return
+    reply = {'status': 'success'}
+    # Bulk operations report how many tasks they changed
+    if isinstance(result, int):
+        reply['affected'] = result
+    await respond_json(send, 200, reply)
+
+
+async def export(send, household, query):
+    fmt = query.get('format', ['ndjson'])[0]
+    if fmt not in MIMETYPES:
+        await respond_json(send, 400, {'status': 'error', 'error': 'format must be ndjson or csv'})
+        return
+    chunks = export_stream(household, fmt)
+    await send({
+        'type': 'http.response.start',
+        'status': 200,
+        'headers': [(b'content-type', MIMETYPES[fmt].encode())],
+    })
+    while True:
+        chunk = await runtime.run_io(next, chunks, None)
+        if chunk is None:
+            break
+        await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+    await send({'type': 'http.response.body', 'body': b''})
+
+
+async def import_rows(receive, send, household, query):
+    fmt = query.get('format', ['ndjson'])[0]
+    if fmt not in MIMETYPES:
+        await respond_json(send, 400, {'status': 'error', 'error': 'format must be ndjson or csv'})
+        return
+    sync = query.get('sync', [''])[0].lower() in ('1', 'true')
+    loop = runtime.loop
+
+    # Runs on the pool thread, pulling the body off the event loop as the import consumes it
+    def body_chunks():
+        while True:
+            message = asyncio.run_coroutine_threadsafe(receive(), loop).result()
+            if message['type'] == 'http.disconnect':
+                return
+            yield message.get('body', b'')
+            if not message.get('more_body'):
+                return
+
+    report = await runtime.run_io(import_stream, household, body_chunks(), fmt, sync)
+    await respond_json(send, 200, {'status': 'success', **report})
+
+
+async def stats(send, household, query):
+    task_id = query.get('task_id', [''])[0] or None
+    try:
+        result = await runtime.run_io(lambda: household.stats(task_id))
+    except KeyError as e:
+        await respond_json(send, 400, {'status': 'error', 'error': 'missing or unknown %s' % e})
+        return
+    await respond_json(send, 200, result)
+
+
+async def forecast(send, household, query):
+    person = query.get('person', [''])[0] or None
+    after = query.get('after', [''])[0] or None
+    try:
+        days = int(query.get('days', ['7'])[0])
+        limit = int(query.get('limit', [str(FORECAST_LIMIT)])[0])
+        result = await runtime.run_io(lambda: household.forecast(days, person, limit=limit, after=after))
+    except ValueError as e:
+        await respond_json(send, 400, {'status': 'error', 'error': str(e)})
+        return
+    except KeyError as e:
+        await respond_json(send, 400, {'status': 'error', 'error': 'missing or unknown %s' % e})
+        return
+    await respond_json(send, 200, result)
+
+
+async def run_query(receive, send, household, method, query):
+    explain = query.get('explain', [''])[0].lower() in ('1', 'true')
+    try:
+        if method == 'POST':
+            spec = json.loads(await read_body(receive) or b'{}')
+        else:
+            spec = query.get('q', [''])[0]
+        result = await runtime.run_io(lambda: household.query(spec, explain))
+    except BodyTooLarge as e:
+        await respond_json(send, 413, {'status': 'error', 'error': str(e)})
+        return
+    except ValueError as e:
+        await respond_json(send, 400, {'status': 'error', 'error': str(e)})
+        return
+    except KeyError as e:
+        await respond_json(send, 400, {'status': 'error', 'error': 'missing or unknown %s' % e})
+        return
+    await respond_json(send, 200, result)
+
+
+async def search(send, household, query):
+    q = query.get('q', [''])[0]
+    try:
+        limit = int(query.get('limit', ['20'])[0])
+        result = await runtime.run_io(lambda: household.search(q, limit))
+    except ValueError as e:
+        await respond_json(send, 400, {'status': 'error', 'error': str(e)})
+        return
+    await respond_json(send, 200, result)
+
+
+async def completions(send, household, query):
+    resolution = query.get('resolution', ['day'])[0]
+    start = query.get('start', [''])[0] or None
+    end = query.get('end', [''])[0] or None
+    try:
+        result = await runtime.run_io(lambda: household.completions(resolution, start, end))
+    except ValueError as e:
+        await respond_json(send, 400, {'status': 'error', 'error': str(e)})
+        return
+    await respond_json(send, 200, result)
+
+
+async def long_poll(send, household, query):
+    try:
+        since = int(query.get('version', ['-1'])[0])
+    except ValueError:
+        since = -1
+    hub = runtime.hub_for(household)
+    await hub.wait_past(since, POLL_TIMEOUT, hub.due_serial)
+    body = await runtime.run_io(household.render_data)
+    await respond_json_bytes(send, body, [(b'x-store-version', str(household.store.version).encode())])
+
+
+async def events(receive, send, hub):
+    await send({
+        'type': 'http.response.start',
+        'status': 200,
+        'headers': [(b'content-type', b'text/event-stream'), (b'cache-control', b'no-cache')],
+    })
+    disconnected = asyncio.ensure_future(wait_disconnect(receive))
+    version = hub.version
+    due_serial = hub.due_serial
+    try:
+        await send_event(send, 'version', version)
+        while not disconnected.done():
+            waiter = asyncio.ensure_future(hub.wait_past(version, SSE_KEEPALIVE, due_serial))
+            await asyncio.wait([waiter, disconnected], return_when=asyncio.FIRST_COMPLETED)
+            if disconnected.done():
+                waiter.cancel()
+                break
+            if waiter.result():
+                if hub.due_serial != due_serial:
+                    tasks = hub.due_since(due_serial)
+                    due_serial = hub.due_serial
+                    await send_event(send, 'due', [{'room_id': room_id, 'task_id': task_id}
+                                                   for room_id, task_id in tasks])
+                if hub.version != version:
+                    version = hub.version
+                    await send_event(send, 'version', version)
+            else:
+                await send({'type': 'http.response.body', 'body': b': keepalive\n\n', 'more_body': True})
+    except OSError:
+        pass
+    finally:
+        disconnected.cancel()
+
+
+async def send_event(send, name, data):
+    body = ('event: %s\ndata: %s\n\n' % (name, json.dumps(data))).encode()
+    await send({'type': 'http.response.body', 'body': body, 'more_body': True})
+
+
+async def wait_disconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+class BodyTooLarge(ValueError):
+    """A request body over MAX_BODY bytes, answered with a 413."""
+
+
+async def read_body(receive):
+    chunks = []
+    size = 0
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            break
+        chunk = message.get('body', b'')
+        size += len(chunk)
+        if size > MAX_BODY:
+            raise BodyTooLarge('request body too large')
+        chunks.append(chunk)
+        if not message.get('more_body'):
+            break
+    return b''.join(chunks)
+
+
+class ReceiveDigest:
+    """A receive callable that digests the request body passing through it."""
+
+    def __init__(self, receive):
+        self.receive = receive
+        self.done = False
+        self._digest = hashlib.sha256()
+
+    async def __call__(self):
+        message = await self.receive()
+        if message['type'] == 'http.request':
+            self._digest.update(message.get('body', b''))
+            self.done = not message.get('more_body')
+        else:
+            self.done = True
+        return message
+
+    async def finish(self):
+        """Receives whatever is left of the body and returns the digest of all of it."""
+        while not self.done:
+            await self()
+        return self._digest.hexdigest()
+
+
+# A receive callable that hands over an already read body
+def replay_body(body):
+    async def receive():
+        nonlocal body
+        message, body = {'type': 'http.request', 'body': body}, b''
+        return message
+    return receive
+
+
+async def respond(send, status, body, content_type, headers=()):
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', content_type.encode()),
+                    (b'content-length', str(len(body)).encode()), *headers],
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def respond_json(send, status, payload):
+    await respond(send, status, json.dumps(payload).encode() + b'\n', 'application/json')
+
+
+async def respond_json_bytes(send, body, headers=()):
+    await respond(send, 200, body, 'application/json', headers)
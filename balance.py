@@ -0,0 +1,153 @@
+"""Weekly load per member, for handing out tasks fairly.
+
+A task's weight is the effort it takes each time times how often it comes
+round in a week (see ``household.weekly_load``). A LoadBalancer keeps every
+member's total along with a min-heap and a max-heap over the totals.
+Entries go stale whenever a total changes and are skipped when they reach
+the top, so ``set`` is O(log members). ``lightest`` is O(log members) plus
+one step per member it has to pass over because of an exclusion.
+
+Tasks the balancer placed itself are "auto" tasks. ``moves`` only ever
+shifts those, from the heaviest member to the lightest, until the
+heaviest holds nothing whose move would narrow the gap. Tasks someone
+assigned by hand stay put but still count.
+"""
+import heapq
+
+# Moving a task must narrow the gap between two members by more than this
+EPSILON = 1e-9
+
+
+class LoadBalancer:
+    """Members' weekly loads, built from ``set(task_key, member_id, weight, auto)`` calls."""
+
+    def __init__(self, members=()):
+        self._loads = {member_id: 0.0 for member_id in members}
+        # task key -> (member id or None, weight, auto)
+        self._tasks = {}
+        # member id -> {task key: weight} of the auto tasks they hold
+        self._auto = {member_id: {} for member_id in self._loads}
+        # (load, member id) and (-load, member id); None until first needed
+        self._min_heap = None
+        self._max_heap = None
+
+    def __contains__(self, member_id):
+        return member_id in self._loads
+
+    def load(self, member_id):
+        return self._loads.get(member_id, 0.0)
+
+    def loads(self):
+        return dict(self._loads)
+
+    def add_member(self, member_id):
+        if member_id not in self._loads:
+            self._loads[member_id] = 0.0
+            self._auto[member_id] = {}
+            self._push(member_id)
+
+    def remove_member(self, member_id):
+        """Drops a member; their tasks stay counted against nobody until ``set`` again."""
+        self._loads.pop(member_id, None)
+        self._auto.pop(member_id, None)
+        for task_key, (holder, weight, auto) in list(self._tasks.items()):
+            if holder == member_id:
+                self._tasks[task_key] = (None, weight, auto)
+
+    def set(self, task_key, member_id, weight, auto=False):
+        if self._tasks.get(task_key) == (member_id, weight, auto):
+            return
+        self.remove(task_key)
+        self._tasks[task_key] = (member_id, weight, auto)
+        if member_id in self._loads:
+            self._loads[member_id] += weight
+            if auto:
+                self._auto[member_id][task_key] = weight
+            self._push(member_id)
+
+    def remove(self, task_key):
+        entry = self._tasks.pop(task_key, None)
+        if entry is None:
+            return
+        member_id, weight, _ = entry
+        if member_id in self._loads:
+            self._loads[member_id] -= weight
+            self._auto[member_id].pop(task_key, None)
+            self._push(member_id)
+
+    def auto_tasks(self, member_id):
+        """The auto tasks ``member_id`` holds, as ``{task_key: weight}``."""
+        return dict(self._auto.get(member_id, {}))
+
+    def lightest(self, excluded=None):
+        """The member with the least load for whom ``excluded(member_id)`` is false, or None."""
+        if self._min_heap is None:
+            self._min_heap = [(load, member_id) for member_id, load in self._loads.items()]
+            heapq.heapify(self._min_heap)
+        heap = self._min_heap
+        passed = []
+        found = None
+        while heap:
+            load, member_id = heap[0]
+            if self._loads.get(member_id) != load:
+                heapq.heappop(heap)
+                continue
+            if excluded is None or not excluded(member_id):
+                found = member_id
+                break
+            passed.append(heapq.heappop(heap))
+        for entry in passed:
+            heapq.heappush(heap, entry)
+        return found
+
+    def heaviest(self):
+        if self._max_heap is None:
+            self._max_heap = [(-load, member_id) for member_id, load in self._loads.items()]
+            heapq.heapify(self._max_heap)
+        heap = self._max_heap
+        while heap:
+            load, member_id = heap[0]
+            if self._loads.get(member_id) == -load:
+                return member_id
+            heapq.heappop(heap)
+        return None
+
+    def moves(self, excluded, limit=None):
+        """Shifts auto tasks from the heaviest member to the lightest one allowed to take them.
+
+        ``excluded(member_id, task_key)`` says who may not take a task.
+        Each move takes the heaviest member's largest auto task that still
+        narrows the gap, and stops once none does. Returns
+        ``[(task_key, from_member, to_member)]``; the loads already include
+        the moves.
+        """
+        moved = []
+        while limit is None or len(moved) < limit:
+            heaviest = self.heaviest()
+            if heaviest is None:
+                break
+            load = self._loads[heaviest]
+            best = None
+            for task_key, weight in sorted(self._auto[heaviest].items(), key=lambda item: -item[1]):
+                target = self.lightest(lambda member_id: member_id == heaviest or excluded(member_id, task_key))
+                if target is not None and self._loads[target] + weight < load - EPSILON:
+                    best = task_key, target
+                    break
+            if best is None:
+                break
+            task_key, target = best
+            _, weight, _ = self._tasks[task_key]
+            self.set(task_key, target, weight, auto=True)
+            moved.append((task_key, heaviest, target))
+        return moved
+
+    def _push(self, member_id):
+        load = self._loads[member_id]
+        if self._min_heap is not None:
+            heapq.heappush(self._min_heap, (load, member_id))
+            if len(self._min_heap) > 4 * len(self._loads) + 64:
+                self._min_heap = None
+        if self._max_heap is not None:
+            heapq.heappush(self._max_heap, (-load, member_id))
+            if len(self._max_heap) > 4 * len(self._loads) + 64:
+                self._max_heap = None
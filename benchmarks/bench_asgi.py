@@ -0,0 +1,160 @@
+"""Compares the ASGI app (under uvicorn) with the Flask app (under serve.py).
+
+    python benchmarks/bench_asgi.py --concurrency 200 --seconds 10 --idle 2000
+
+For each server this measures /data throughput with ``--concurrency``
+in-flight requests, while ``--idle`` extra clients sit on long-lived
+connections: SSE on /events for the ASGI app and, since Flask has no push
+channel, open sockets that never finish their request for Flask (what a
+slow mobile client looks like to a thread-per-connection server). Both run
+one process. Needs uvicorn installed for the ASGI side.
+"""
+import argparse
+import asyncio
+import importlib.util
+import os
+import resource
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SERVERS = {
+    'flask': [sys.executable, os.path.join(ROOT, 'serve.py'), 'app:app',
+              '--bind', '127.0.0.1:{port}', '--workers', '1', '--threads', '{threads}'],
+    'asgi': [sys.executable, '-m', 'uvicorn', 'asgi_app:app', '--port', '{port}',
+             '--log-level', 'warning', '--no-access-log'],
+}
+
+
+async def get(port, path):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    try:
+        writer.write(('GET %s HTTP/1.1\r\nHost: bench\r\nConnection: close\r\n\r\n' % path).encode())
+        await writer.drain()
+        status = (await reader.readline()).split()[1]
+        await reader.read()
+        return status == b'200'
+    finally:
+        writer.close()
+
+
+async def idle_client(port, path, opened):
+    try:
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    except OSError:
+        return
+    if path is not None:
+        writer.write(('GET %s HTTP/1.1\r\nHost: bench\r\n\r\n' % path).encode())
+    opened.append(writer)
+    try:
+        while await reader.read(4096):
+            pass
+    except (OSError, asyncio.CancelledError):
+        pass
+
+
+async def measure(port, concurrency, seconds, idle, idle_path):
+    opened = []
+    idlers = [asyncio.ensure_future(idle_client(port, idle_path, opened)) for _ in range(idle)]
+    await asyncio.sleep(1)
+    latencies = []
+    errors = 0
+    stop_at = time.monotonic() + seconds
+
+    async def worker():
+        nonlocal errors
+        while time.monotonic() < stop_at:
+            start = time.perf_counter()
+            try:
+                ok = await get(port, '/data')
+            except OSError:
+                ok = False
+            if ok:
+                latencies.append(time.perf_counter() - start)
+            else:
+                errors += 1
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    for task in idlers:
+        task.cancel()
+    for writer in opened:
+        writer.close()
+    latencies.sort()
+    return latencies, errors, len(opened)
+
+
+async def wait_for(port, timeout=20):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if await get(port, '/data'):
+                return
+        except OSError:
+            pass
+        await asyncio.sleep(0.1)
+    raise RuntimeError('server on port %d did not start' % port)
+
+
+def percentile(values, fraction):
+    if not values:
+        return float('nan')
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def rss_kb(pid):
+    try:
+        with open('/proc/%d/status' % pid) as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--concurrency', type=int, default=200)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--idle', type=int, default=1000)
+    parser.add_argument('--threads', type=int, default=32, help='request threads for the Flask server')
+    parser.add_argument('--port', type=int, default=8741)
+    args = parser.parse_args()
+
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [ROOT, os.environ.get('PYTHONPATH')])))
+    print('%-6s %10s %10s %10s %8s %8s %10s' % ('server', 'req/s', 'p50 ms', 'p99 ms', 'errors', 'idle', 'rss MB'))
+    for offset, (name, command) in enumerate(SERVERS.items()):
+        port = args.port + offset
+        if name == 'asgi' and importlib.util.find_spec('uvicorn') is None:
+            print('%-6s skipped: uvicorn is not installed' % name)
+            continue
+        workdir = tempfile.mkdtemp(prefix='chores-bench-')
+        command = [part.format(port=port, threads=args.threads) for part in command]
+        proc = subprocess.Popen(command, cwd=workdir, env=env,
+                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                                preexec_fn=lambda: resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard)))
+        try:
+            asyncio.run(wait_for(port))
+            idle_path = '/events' if name == 'asgi' else None
+            latencies, errors, idle = asyncio.run(
+                measure(port, args.concurrency, args.seconds, args.idle, idle_path))
+            rss = rss_kb(proc.pid)
+        finally:
+            proc.send_signal(signal.SIGTERM)
+            proc.wait(timeout=30)
+            shutil.rmtree(workdir, ignore_errors=True)
+        print('%-6s %10.0f %10.2f %10.2f %8d %8d %10.1f' % (
+            name, len(latencies) / args.seconds,
+            percentile(latencies, 0.5) * 1000, percentile(latencies, 0.99) * 1000,
+            errors, idle, rss / 1024))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""Times /search lookups against a large in-memory household (see search.py).
+
+    python benchmarks/bench_search.py --tasks 100000
+
+Builds a household with ``--tasks`` tasks named from a chore vocabulary,
+with ``--unique`` of them numbered so that their names are all distinct,
+then runs each query ``--runs`` times through ``Household.search`` and
+reports the median and worst time along with how many tasks matched.
+Nothing is written to disk.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from household import Household  # noqa: E402
+from orderkeys import spread_keys  # noqa: E402
+from schema import SCHEMA_VERSION, empty_document, new_id  # noqa: E402
+from store import YamlStore  # noqa: E402
+
+VERBS = ['Vacuum', 'Wipe', 'Mop', 'Dust', 'Scrub', 'Clean', 'Tidy', 'Polish', 'Empty', 'Water', 'Wash', 'Sweep']
+THINGS = ['floor', 'counters', 'shelves', 'windows', 'sink', 'toilet', 'bins', 'plants', 'rug', 'stairs',
+          'mirror', 'oven', 'fridge', 'table', 'curtains', 'skirting boards', 'bath', 'doors']
+ROOMS = ['Kitchen', 'Bathroom', 'Bedroom', 'Living Room', 'Hallway', 'Garage', 'Office', 'Garden', 'Attic']
+QUERIES = ['vacuum', 'vac', 'wipe counters', 'sk', 'kitchen', 'oven', 'boards', 'clean bath', 'zzz', 'task 4242']
+
+
+def build(tasks, unique, per_room=50):
+    rooms = []
+    room_count = (tasks + per_room - 1) // per_room
+    numbered = 0
+    for number, key in enumerate(spread_keys(room_count)):
+        room_tasks = []
+        for _ in range(min(per_room, tasks - number * per_room)):
+            if numbered < unique:
+                name = 'Task %d' % numbered
+                numbered += 1
+            else:
+                name = '%s %s' % (random.choice(VERBS), random.choice(THINGS))
+            room_tasks.append({'id': new_id(), 'name': name, 'frequency_days': 7, 'assigned_to': None, 'history': []})
+        rooms.append({
+            'id': new_id(),
+            'name': '%s %d' % (random.choice(ROOMS), number),
+            'frequency_days': 7,
+            'assigned_to': None,
+            'order': key,
+            'tasks': room_tasks,
+        })
+    return {'schema': SCHEMA_VERSION, 'members': [], 'rooms': rooms}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--tasks', type=int, default=100000)
+    parser.add_argument('--unique', type=int, default=10000, help='tasks given distinct numbered names')
+    parser.add_argument('--runs', type=int, default=50)
+    args = parser.parse_args()
+
+    store = YamlStore(os.path.join(tempfile.gettempdir(), 'chores-bench-search.yaml'),
+                      default=empty_document, watch=False)
+    store.replace(build(args.tasks, args.unique))
+    household = Household(store)
+    start = time.perf_counter()
+    household.load()
+    print('%d tasks in %d rooms; indexed in %.1f s' % (
+        len(household.tasks_by_id), len(household.rooms_by_id), time.perf_counter() - start))
+    print('%-16s %8s %10s %10s' % ('query', 'matches', 'median ms', 'max ms'))
+    for query in QUERIES:
+        times = []
+        for _ in range(args.runs):
+            start = time.perf_counter()
+            result = household.search(query)
+            times.append((time.perf_counter() - start) * 1000)
+        print('%-16s %8d %10.2f %10.2f' % (query, result['total'], statistics.median(times), max(times)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+"""Compares the Flask dev server with serve.py under concurrent /data polling.
+
+    python benchmarks/bench_server.py --clients 32 --seconds 10
+
+Each server runs in its own process in a scratch directory, starting from
+app.py's sample household.
+"""
+import argparse
+import http.client
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SERVERS = {
+    'dev': [sys.executable, '-c',
+            'import app; app.init_data(); app.app.run(port={port}, debug=True, use_reloader=False)'],
+    'serve': [sys.executable, os.path.join(ROOT, 'serve.py'), 'app:app',
+              '--bind', '127.0.0.1:{port}', '--workers', '{workers}', '--threads', '{threads}'],
+}
+
+
+def wait_for(port, timeout=15):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            conn.request('GET', '/data')
+            conn.getresponse().read()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError('server on port %d did not start' % port)
+
+
+def hammer(port, clients, seconds):
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    stop_at = time.monotonic() + seconds
+
+    def client():
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+        mine = []
+        while time.monotonic() < stop_at:
+            start = time.perf_counter()
+            try:
+                conn.request('GET', '/data')
+                conn.getresponse().read()
+            except (OSError, http.client.HTTPException):
+                with lock:
+                    errors[0] += 1
+                conn.close()
+                conn = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+                continue
+            mine.append(time.perf_counter() - start)
+        with lock:
+            latencies.extend(mine)
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    latencies.sort()
+    return latencies, errors[0]
+
+
+def percentile(values, fraction):
+    if not values:
+        return float('nan')
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--clients', type=int, default=32)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 2)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--port', type=int, default=8731)
+    args = parser.parse_args()
+
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [ROOT, os.environ.get('PYTHONPATH')])))
+    print('%-6s %10s %10s %10s %8s' % ('server', 'req/s', 'p50 ms', 'p99 ms', 'errors'))
+    for offset, (name, command) in enumerate(SERVERS.items()):
+        port = args.port + offset
+        workdir = tempfile.mkdtemp(prefix='chores-bench-')
+        command = [part.format(port=port, workers=args.workers, threads=args.threads) for part in command]
+        proc = subprocess.Popen(command, cwd=workdir, env=env,
+                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            wait_for(port)
+            latencies, errors = hammer(port, args.clients, args.seconds)
+        finally:
+            proc.send_signal(signal.SIGTERM)
+            proc.wait(timeout=30)
+            shutil.rmtree(workdir, ignore_errors=True)
+        print('%-6s %10.0f %10.2f %10.2f %8d' % (
+            name, len(latencies) / args.seconds,
+            percentile(latencies, 0.5) * 1000, percentile(latencies, 0.99) * 1000, errors))
+
+
+if __name__ == '__main__':
+    main()
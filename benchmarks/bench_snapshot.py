@@ -0,0 +1,136 @@
+"""Compares cold starts from the YAML file and from a snapshot (see snapshot.py).
+
+    python benchmarks/bench_snapshot.py --tasks 100000
+
+Builds a household with ``--tasks`` tasks in a scratch directory, writes it
+as YAML and as a snapshot, then times each start in a fresh process: getting
+the document ready, the first /data, and looking up one task. Peak RSS is
+for the whole process.
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+import yaml
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from filewatch import stat_signature  # noqa: E402
+from orderkeys import spread_keys  # noqa: E402
+from schema import SCHEMA_VERSION, new_id  # noqa: E402
+from snapshot import SnapshotFile  # noqa: E402
+
+try:
+    _Dumper = yaml.CSafeDumper
+except AttributeError:
+    _Dumper = yaml.SafeDumper
+
+# Runs in the child process; prints its timings as JSON
+PROBE = '''
+import json, resource, sys, time
+start = time.perf_counter()
+from household import Household
+from schema import empty_document
+from snapshot import SnapshotFile
+from store import YamlStore
+mode, data_file, snapshot_file, task_id = sys.argv[1:]
+imported = time.perf_counter()
+store = YamlStore(data_file, default=empty_document, watch=False)
+if mode == 'yaml':
+    household = Household(store)
+    household.load()
+else:
+    household = Household(store, snapshot=SnapshotFile(snapshot_file))
+    snapshot = household.snapshot.current()
+ready = time.perf_counter()
+household.render_data()
+first_data = time.perf_counter()
+if mode == 'yaml':
+    household.tasks_by_id[task_id]
+else:
+    snapshot.task(task_id)
+first_task = time.perf_counter()
+print(json.dumps({
+    'ready': ready - imported,
+    'data': first_data - ready,
+    'task': first_task - first_data,
+    'rss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+}))
+'''
+
+
+def build(tasks, per_room, members=8):
+    now = datetime.now()
+    member_ids = [new_id() for _ in range(members)]
+    rooms = []
+    room_count = (tasks + per_room - 1) // per_room
+    for number, key in enumerate(spread_keys(room_count)):
+        count = min(per_room, tasks - number * per_room)
+        rooms.append({
+            'id': new_id(),
+            'name': 'Room %d' % number,
+            'frequency_days': 7,
+            'assigned_to': random.choice(member_ids),
+            'order': key,
+            'tasks': [{
+                'id': new_id(),
+                'name': 'Task %d.%d' % (number, index),
+                'frequency_days': random.choice((1, 7, 30)),
+                'assigned_to': random.choice(member_ids),
+                'history': [(now - timedelta(days=random.randint(0, 40))).isoformat()],
+            } for index in range(count)],
+        })
+    return {
+        'schema': SCHEMA_VERSION,
+        'members': [{'id': member_id, 'name': 'Member %d' % n} for n, member_id in enumerate(member_ids)],
+        'rooms': rooms,
+    }
+
+
+def probe(mode, data_file, snapshot_file, task_id):
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [ROOT, os.environ.get('PYTHONPATH')])))
+    output = subprocess.run([sys.executable, '-c', PROBE, mode, data_file, snapshot_file, task_id],
+                            env=env, check=True, capture_output=True, text=True).stdout
+    return json.loads(output)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--tasks', type=int, default=100000)
+    parser.add_argument('--tasks-per-room', type=int, default=50)
+    parser.add_argument('--runs', type=int, default=3, help='starts per format; the best is reported')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='chores-bench-')
+    try:
+        data_file = os.path.join(workdir, 'chores.yaml')
+        snapshot_file = os.path.join(workdir, 'chores.snapshot')
+        data = build(args.tasks, args.tasks_per_room)
+        with open(data_file, 'w') as f:
+            yaml.dump(data, f, Dumper=_Dumper, default_flow_style=False)
+        SnapshotFile(snapshot_file).publish({key: value for key, value in data.items() if key != 'rooms'},
+                                            data['rooms'], source=stat_signature(data_file))
+        task_id = random.choice(random.choice(data['rooms'])['tasks'])['id']
+
+        print('%d tasks in %d rooms; YAML %.1f MB, snapshot %.1f MB' % (
+            args.tasks, len(data['rooms']),
+            os.path.getsize(data_file) / 2 ** 20, os.path.getsize(snapshot_file) / 2 ** 20))
+        print('%-9s %10s %14s %14s %12s' % ('format', 'ready ms', 'first /data ms', 'first task ms', 'peak RSS MB'))
+        for mode in ('yaml', 'snapshot'):
+            runs = [probe(mode, data_file, snapshot_file, task_id) for _ in range(args.runs)]
+            best = min(runs, key=lambda run: run['ready'] + run['data'])
+            print('%-9s %10.1f %14.1f %14.2f %12.0f' % (
+                mode, best['ready'] * 1000, best['data'] * 1000, best['task'] * 1000, best['rss']))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,127 +1,138 @@
 import os
 import uuid
-from datetime import datetime, timedelta
 
 import yaml
-from flask import Flask, jsonify, redirect, render_template_string, request, url_for
+from flask import Flask, g, jsonify, redirect, render_template_string, request, url_for
+
+from household import FORECAST_LIMIT, Household, UnknownReference
+from idempotency import FlaskIdempotency, IdempotencyCache
+from schema import SCHEMA_VERSION, empty_document
+from store import YamlStore
+from tenancy import FlaskTenancy, HouseholdPool
 
 app = Flask(__name__)
-DATA_FILE = "chores_data.yaml"
+# Point CHORES_DATA_FILE at app.py's file to run both apps on one household
+DATA_FILE = os.environ.get("CHORES_DATA_FILE", "chores_data.yaml")
 
 # --- Helper Functions ---
-def load_data():
-    """Loads data from the YAML file."""
-    if not os.path.exists(DATA_FILE):
-        return {
-            "rooms": {
-                "kitchen": {
-                    "name": "Kitchen",
-                    "tasks": {
-                        "task1": {
-                            "name": "Wipe counters",
-                            "done": False,
-                            "frequency_days": 1,
-                            "assigned_to": None,
-                            "last_done": None,
-                        },
-                        "task2": {
-                            "name": "Do dishes",
-                            "done": False,
-                            "frequency_days": 1,
-                            "assigned_to": None,
-                            "last_done": None,
-                        },
-                    },
-                    "default_frequency_days": 7,
-                },
-                "living_room": {
-                    "name": "Living Room",
-                    "tasks": {
-                        "task3": {
-                            "name": "Vacuum floor",
-                            "done": False,
-                            "frequency_days": 7,
-                            "assigned_to": None,
-                            "last_done": None,
-                        }
-                    },
-                    "default_frequency_days": 7,
-                },
+def default_data():
+    """Returns the starter household used when there is no data file yet."""
+    kitchen, living_room = str(uuid.uuid4()), str(uuid.uuid4())
+    return {
+        "schema": SCHEMA_VERSION,
+        "rooms": [
+            {
+                "id": kitchen,
+                "name": "Kitchen",
+                "frequency_days": 7,
+                "assigned_to": None,
+                "order": "F",
+                "tasks": [
+                    {"id": str(uuid.uuid4()), "name": "Wipe counters", "frequency_days": 1, "assigned_to": None, "history": []},
+                    {"id": str(uuid.uuid4()), "name": "Do dishes", "frequency_days": 1, "assigned_to": None, "history": []},
+                ],
             },
-            "members": {"member1": {"name": "Alice"}, "member2": {"name": "Bob"}},
-            "next_ids": {"room": 3, "task": 4, "member": 3}, # Keep track of next IDs
-        }
-    with open(DATA_FILE, "r") as f:
-        return yaml.safe_load(f)
-
-def save_data(data):
-    """Saves data to the YAML file."""
-    with open(DATA_FILE, "w") as f:
-        yaml.dump(data, f, default_flow_style=False)
-
-def is_task_due(task):
-    """Checks if a task is due based on its frequency and last_done date."""
-    if task.get("done") and task.get("last_done") and task.get("frequency_days"):
-        last_done_date = datetime.strptime(task["last_done"], "%Y-%m-%d")
-        if last_done_date + timedelta(days=int(task["frequency_days"])) <= datetime.now():
-            return True # Due, needs to be undone for the new cycle
-        return False # Still within the frequency, no need to show if "Show only due"
-    elif not task.get("done") and task.get("frequency_days"): # Not done yet, but has a frequency
-        return True
-    elif not task.get("frequency_days"): # No frequency, always show if not done
-        return not task.get("done")
-    return False # Default to false if conditions aren't met
+            {
+                "id": living_room,
+                "name": "Living Room",
+                "frequency_days": 7,
+                "assigned_to": None,
+                "order": "U",
+                "tasks": [
+                    {"id": str(uuid.uuid4()), "name": "Vacuum floor", "frequency_days": 7, "assigned_to": None, "history": []},
+                ],
+            },
+        ],
+        "members": [{"id": str(uuid.uuid4()), "name": "Alice"}, {"id": str(uuid.uuid4()), "name": "Bob"}],
+    }
+
+
+store = YamlStore(
+    DATA_FILE,
+    default=default_data,
+    dump=lambda data, f: yaml.dump(data, f, default_flow_style=False),
+)
+# Indexes, migration of older files and the mutations all live in the shared Household
+household = Household(store)
+
+# Hosted households under /h/<household_id>/; the directory can be shared with app.py
+HOUSEHOLDS_DIR = os.environ.get("CHORES_HOUSEHOLDS_DIR", "households")
+MAX_HOUSEHOLDS = int(os.environ.get("CHORES_MAX_HOUSEHOLDS", "1000"))
+HOUSEHOLD_MEMORY_MB = int(os.environ.get("CHORES_HOUSEHOLD_MEMORY_MB", "256"))
+
+
+def open_household(path):
+    """Opens one hosted household's shard."""
+    return Household(YamlStore(path, default=empty_document, dump=store.dump, watch=False))
+
+
+pool = HouseholdPool(HOUSEHOLDS_DIR, open_household, MAX_HOUSEHOLDS, HOUSEHOLD_MEMORY_MB * 1024 * 1024)
+tenancy = FlaskTenancy(app, pool, default=household)
+current_household = tenancy.current
+# Retried form posts carrying an Idempotency-Key get the first redirect back (see idempotency.py)
+idempotency = FlaskIdempotency(app, IdempotencyCache(), lambda: current_household().store.path)
+
+
+def load_data():
+    """Returns the in-memory data, which the store reloads when the YAML file changes."""
+    return current_household().load()
+
+
+@app.before_request
+def lock_store():
+    """Serializes requests to a household, since they all share its in-memory document."""
+    g.store_lock = current_household().store.lock
+    g.store_lock.acquire()
+
+
+@app.teardown_request
+def unlock_store(exc):
+    lock = g.pop("store_lock", None)
+    if lock is not None:
+        lock.release()
 
 
 # --- Routes ---
 @app.route("/")
 def index():
     """Main page displaying rooms, tasks, and members."""
-    data = load_data()
+    household = current_household()
+    data = household.load()
     show_only_due = request.args.get("show_due", "false").lower() == "true"
     current_member_filter = request.args.get("member_filter", "all")
+    # Member views only visit that member's tasks through the index
+    if current_member_filter == "all":
+        task_ids = None
+    else:
+        member = None if current_member_filter == "unassigned" else current_member_filter
+        keys = household.assignees.tasks_for(member)
+        task_ids = {task_id for _, task_id in keys}
+        room_ids = {room_id for room_id, _ in keys}
+
+    rooms = []
+    for room in household.ordered_rooms():
+        if task_ids is None:
+            tasks = room["tasks"]
+        elif room["id"] in room_ids:
+            tasks = [task for task in room["tasks"] if task["id"] in task_ids]
+        else:
+            tasks = []
+        if show_only_due:
+            tasks = [task for task in tasks if household.is_due(task["id"])]
+        if tasks or not show_only_due: # If not filtering by due, show every room so tasks can be added
+            rooms.append((room, tasks))
 
-    # Reset tasks that are due
-    for room_id, room in data["rooms"].items():
-        for task_id, task in room["tasks"].items():
-            if task.get("done") and task.get("last_done") and task.get("frequency_days"):
-                last_done_date = datetime.strptime(task["last_done"], "%Y-%m-%d")
-                if last_done_date + timedelta(days=int(task["frequency_days"])) <= datetime.now():
-                    task["done"] = False # Reset for the new cycle
-                    # task["last_done"] = None # Optionally clear last_done or keep for history
-
-    # Apply filters
-    filtered_rooms = {}
-    for room_id, room_details in data["rooms"].items():
-        visible_tasks = {}
-        for task_id, task_details in room_details["tasks"].items():
-            task_is_due_for_display = is_task_due(task_details)
-            assigned_to_current_filter = (
-                current_member_filter == "all"
-                or task_details.get("assigned_to") == current_member_filter
-                or (current_member_filter == "unassigned" and not task_details.get("assigned_to"))
-            )
-
-            if show_only_due:
-                if task_is_due_for_display and not task_details["done"] and assigned_to_current_filter:
-                    visible_tasks[task_id] = task_details
-            elif assigned_to_current_filter:
-                 visible_tasks[task_id] = task_details
-
-
-        if visible_tasks or not show_only_due : # If not filtering by due, show room if it has any tasks or allow adding tasks
-            filtered_rooms[room_id] = {**room_details, "tasks": visible_tasks}
-        elif not show_only_due and not visible_tasks and not room_details["tasks"]: # Show empty rooms if not filtering
-             filtered_rooms[room_id] = room_details
-
-
-    save_data(data) # Save potential changes from resetting due tasks
+    # A task stays done until its frequency has passed since the last completion
+    done = {task["id"] for _, tasks in rooms for task in tasks if not household.is_due(task["id"])}
 
     return render_template_string(
         HTML_TEMPLATE,
-        rooms=filtered_rooms,
-        all_rooms=data["rooms"], # for dropdowns
+        rooms=rooms,
+        done=done,
         members=data["members"],
+        member_names={member["id"]: member["name"] for member in data["members"]},
+        counters=household.counters,
+        balancer=household.balancer,
         show_only_due=show_only_due,
         current_member_filter=current_member_filter
     )
@@ -130,98 +141,70 @@ def index():
 @app.route("/add_room", methods=["POST"])
 def add_room():
     """Adds a new room."""
-    data = load_data()
+    household = current_household()
+    household.load()
     room_name = request.form.get("room_name")
     default_frequency = request.form.get("room_default_frequency", 7)
     if room_name:
-        room_id = f"room{data['next_ids']['room']}"
-        data["next_ids"]["room"] += 1
-        data["rooms"][room_id] = {
-            "name": room_name,
-            "tasks": {},
-            "default_frequency_days": int(default_frequency),
-        }
-        save_data(data)
+        household.add_room({"name": room_name, "frequency": default_frequency})
     return redirect(url_for("index"))
 
 
 @app.route("/add_task/<room_id>", methods=["POST"])
 def add_task(room_id):
     """Adds a new task to a specific room."""
-    data = load_data()
-    if room_id in data["rooms"]:
+    household = current_household()
+    household.load()
+    room = household.find_room(room_id)
+    if room is not None:
         task_name = request.form.get("task_name")
-        task_frequency = request.form.get(
-            "task_frequency", data["rooms"][room_id]["default_frequency_days"]
-        )
+        task_frequency = request.form.get("task_frequency", room["frequency_days"])
         if task_name:
-            task_id = f"task{data['next_ids']['task']}"
-            data["next_ids"]["task"] += 1
-            data["rooms"][room_id]["tasks"][task_id] = {
-                "name": task_name,
-                "done": False,
-                "frequency_days": int(task_frequency) if task_frequency else None,
-                "assigned_to": None,
-                "last_done": None,
-            }
-            save_data(data)
+            try:
+                household.add_task({"room_id": room_id, "name": task_name, "frequency": task_frequency})
+            except UnknownReference:
+                pass # Neither a number of days nor a repeat rule
     return redirect(url_for("index"))
 
 
 @app.route("/toggle_task/<room_id>/<task_id>", methods=["POST"])
 def toggle_task(room_id, task_id):
     """Toggles the 'done' status of a task."""
-    data = load_data()
-    if (
-        room_id in data["rooms"]
-        and task_id in data["rooms"][room_id]["tasks"]
-    ):
-        task = data["rooms"][room_id]["tasks"][task_id]
-        task["done"] = not task["done"]
-        if task["done"]:
-            task["last_done"] = datetime.now().strftime("%Y-%m-%d")
-        else:
-            task["last_done"] = None # Clear last_done if unchecking
-        save_data(data)
-        # For AJAX response if you implement it later
-        # return jsonify({"success": True, "done": task["done"], "last_done": task["last_done"]})
+    household = current_household()
+    household.load()
+    task = household.find_task(room_id, task_id)
+    if task is not None:
+        # Checking a due task records a completion; unchecking a done one takes it back
+        household.complete_task({"room_id": room_id, "task_id": task_id, "completed": household.is_due(task_id)})
     return redirect(request.referrer or url_for("index"))
 
 
 @app.route("/update_task_frequency/<room_id>/<task_id>", methods=["POST"])
 def update_task_frequency(room_id, task_id):
     """Updates the frequency of a task."""
-    data = load_data()
-    if (
-        room_id in data["rooms"]
-        and task_id in data["rooms"][room_id]["tasks"]
-    ):
+    household = current_household()
+    household.load()
+    if household.find_task(room_id, task_id) is not None:
         try:
-            new_frequency = request.form.get("task_frequency")
-            if new_frequency is None or new_frequency.strip() == "": # Allows clearing frequency
-                data["rooms"][room_id]["tasks"][task_id]["frequency_days"] = None
-            else:
-                data["rooms"][room_id]["tasks"][task_id]["frequency_days"] = int(new_frequency)
-            save_data(data)
-        except ValueError:
-            # Handle cases where conversion to int might fail, though input type=number helps
-            pass # Or return an error message
+            # An empty value clears the frequency
+            household.bulk_update({
+                "select": {"room_id": room_id, "task_ids": [task_id]},
+                "set": {"frequency": request.form.get("task_frequency")},
+            })
+        except UnknownReference:
+            pass # Neither a number of days nor a repeat rule
     return redirect(request.referrer or url_for("index"))
 
 
 @app.route("/update_room_frequency/<room_id>", methods=["POST"])
 def update_room_frequency(room_id):
     """Updates the default frequency for tasks in a room."""
-    data = load_data()
-    if room_id in data["rooms"]:
+    household = current_household()
+    household.load()
+    if household.find_room(room_id) is not None:
         try:
-            new_frequency = request.form.get("room_frequency")
-            if new_frequency is None or new_frequency.strip() == "":
-                data["rooms"][room_id]["default_frequency_days"] = None
-            else:
-                data["rooms"][room_id]["default_frequency_days"] = int(new_frequency)
-            save_data(data)
-        except ValueError:
+            household.update_room({"room_id": room_id, "frequency": request.form.get("room_frequency")})
+        except UnknownReference:
             pass
     return redirect(request.referrer or url_for("index"))
 
@@ -229,63 +212,132 @@ def update_room_frequency(room_id):
 @app.route("/add_member", methods=["POST"])
 def add_member():
     """Adds a new family member."""
-    data = load_data()
+    household = current_household()
+    household.load()
     member_name = request.form.get("member_name")
     if member_name:
-        member_id = f"member{data['next_ids']['member']}"
-        data["next_ids"]["member"] += 1
-        data["members"][member_id] = {"name": member_name}
-        save_data(data)
+        household.add_member({"name": member_name})
     return redirect(url_for("index"))
 
 
 @app.route("/assign_task/<room_id>/<task_id>", methods=["POST"])
 def assign_task(room_id, task_id):
     """Assigns a task to a family member."""
-    data = load_data()
-    if (
-        room_id in data["rooms"]
-        and task_id in data["rooms"][room_id]["tasks"]
-    ):
+    household = current_household()
+    household.load()
+    if household.find_task(room_id, task_id) is not None:
         member_id = request.form.get("member_id")
         # If "unassign" is selected, member_id will be an empty string or a specific value
-        if member_id == "unassign" or not member_id :
-            data["rooms"][room_id]["tasks"][task_id]["assigned_to"] = None
-        elif member_id in data["members"]:
-            data["rooms"][room_id]["tasks"][task_id]["assigned_to"] = member_id
-        save_data(data)
+        if member_id == "unassign" or not member_id:
+            household.reassign_task({"room_id": room_id, "task_id": task_id, "assigned_to": None})
+        elif member_id in household.members_by_id:
+            household.reassign_task({"room_id": room_id, "task_id": task_id, "assigned_to": member_id})
     return redirect(request.referrer or url_for("index"))
 
 @app.route("/delete_task/<room_id>/<task_id>", methods=["POST"])
 def delete_task(room_id, task_id):
-    data = load_data()
-    if room_id in data["rooms"] and task_id in data["rooms"][room_id]["tasks"]:
-        del data["rooms"][room_id]["tasks"][task_id]
-        save_data(data)
+    household = current_household()
+    household.load()
+    household.delete_task({"room_id": room_id, "task_id": task_id})
     return redirect(request.referrer or url_for("index"))
 
 @app.route("/delete_room/<room_id>", methods=["POST"])
 def delete_room(room_id):
-    data = load_data()
-    if room_id in data["rooms"]:
-        del data["rooms"][room_id]
-        save_data(data)
+    household = current_household()
+    household.load()
+    household.delete_room({"room_id": room_id})
     return redirect(url_for("index"))
 
 @app.route("/delete_member/<member_id>", methods=["POST"])
 def delete_member(member_id):
-    data = load_data()
-    if member_id in data["members"]:
-        # Unassign tasks from this member
-        for r_id, room in data["rooms"].items():
-            for t_id, task in room["tasks"].items():
-                if task.get("assigned_to") == member_id:
-                    task["assigned_to"] = None
-        del data["members"][member_id]
-        save_data(data)
+    household = current_household()
+    household.load()
+    if member_id in household.members_by_id:
+        # Unassigns their tasks too
+        household.delete_member({"member_id": member_id})
     return redirect(url_for("index"))
 
 
+@app.route("/auto_assign", methods=["POST"])
+def auto_assign():
+    """Hands unassigned repeating tasks to the members with the least weekly load."""
+    household = current_household()
+    household.load()
+    household.auto_assign({})
+    return redirect(request.referrer or url_for("index"))
+
+@app.route("/rebalance", methods=["POST"])
+def rebalance():
+    """Evens out the weekly load of auto-assigned tasks."""
+    household = current_household()
+    household.load()
+    household.rebalance({})
+    return redirect(request.referrer or url_for("index"))
+
+
+@app.route("/summary")
+def summary():
+    """Due, overdue and done task counts per room and member."""
+    return jsonify(current_household().summary())
+
+
+@app.route("/stats")
+def stats():
+    """Lateness of completions in hours, overall, per room and per member (and for ?task_id=)."""
+    try:
+        return jsonify(current_household().stats(request.args.get("task_id") or None))
+    except UnknownReference as e:
+        return jsonify({"status": "error", "error": "missing or unknown %s" % e}), 400
+
+
+@app.route("/forecast")
+def forecast():
+    """Occurrences due in the next ?days=N days, optionally for one ?person=, paged by ?limit= and ?after=."""
+    try:
+        days = int(request.args.get("days", 7))
+        limit = int(request.args.get("limit", FORECAST_LIMIT))
+        return jsonify(current_household().forecast(days, request.args.get("person") or None,
+                                                    limit=limit, after=request.args.get("after") or None))
+    except ValueError as e:
+        return jsonify({"status": "error", "error": str(e)}), 400
+    except UnknownReference as e:
+        return jsonify({"status": "error", "error": "missing or unknown %s" % e}), 400
+
+
+@app.route("/query", methods=["GET", "POST"])
+def query():
+    """Tasks matching a filter query: ?q=<text> or a posted JSON spec, with the plan for ?explain=1."""
+    spec = (request.get_json(silent=True) or {}) if request.method == "POST" else request.args.get("q", "")
+    explain = request.args.get("explain", "").lower() in ("1", "true")
+    try:
+        return jsonify(current_household().query(spec, explain))
+    except ValueError as e:
+        return jsonify({"status": "error", "error": str(e)}), 400
+    except UnknownReference as e:
+        return jsonify({"status": "error", "error": "missing or unknown %s" % e}), 400
+
+
+@app.route("/search")
+def search():
+    """Rooms and tasks whose names match ?q=, best first."""
+    try:
+        limit = int(request.args.get("limit", 20))
+        return jsonify(current_household().search(request.args.get("q", ""), limit))
+    except ValueError as e:
+        return jsonify({"status": "error", "error": str(e)}), 400
+
+
+@app.route("/completions")
+def completions():
+    """Completions per ?resolution=day, week or month from ?start= to ?end=."""
+    try:
+        return jsonify(current_household().completions(request.args.get("resolution", "day"),
+                                                       request.args.get("start") or None,
+                                                       request.args.get("end") or None))
+    except ValueError as e:
+        return jsonify({"status": "error", "error": str(e)}), 400
+
+
 # --- HTML Template ---
 HTML_TEMPLATE = """
 <!DOCTYPE html>
@@ -309,6 +361,7 @@ HTML_TEMPLATE = """
         .task .frequency, .task .assignment { font-size: 0.9em; color: #555; margin-left:15px;}
         .task .last-done { font-size: 0.8em; color: #777; margin-left: 5px; }
         .task.done label { text-decoration: line-through; color: #888; }
+        .counts { font-size: 0.7em; font-weight: normal; color: #777; margin-left: 5px; }
         .form-section { margin-bottom: 30px; padding: 15px; background-color: #e9e9e9; border-radius: 5px; }
         .form-section h3 { margin-top: 0; }
         input[type="text"], input[type="number"], select, button {
@@ -328,6 +381,7 @@ HTML_TEMPLATE = """
         .task-details-form input, .task-details-form select { padding: 5px; font-size: 0.9em; }
         .task-name { min-width: 150px; }
         .small-input { width: 60px; padding: 5px !important; }
+        .rule-input { width: 150px; padding: 5px !important; }
         .room-header-controls { font-size: 0.9em; display: flex; align-items:center; gap: 5px; }
         .room-header-controls form { margin-bottom: 0; }
     </style>
@@ -345,8 +399,8 @@ HTML_TEMPLATE = """
                 <select name="member_filter" id="member_filter_select" onchange="document.getElementById('filterForm').submit();">
                     <option value="all" {% if current_member_filter == 'all' %}selected{% endif %}>All Members</option>
                     <option value="unassigned" {% if current_member_filter == 'unassigned' %}selected{% endif %}>Unassigned</option>
-                    {% for member_id, member in members.items() %}
-                        <option value="{{ member_id }}" {% if current_member_filter == member_id %}selected{% endif %}>{{ member.name }}</option>
+                    {% for member in members %}
+                        <option value="{{ member.id }}" {% if current_member_filter == member.id %}selected{% endif %}>{{ member.name }}</option>
                     {% endfor %}
                 </select>
             </form>
@@ -361,15 +415,23 @@ HTML_TEMPLATE = """
             {% if members %}
             <h4>Existing Members:</h4>
             <ul>
-                {% for member_id, member in members.items() %}
+                {% for member in members %}
                 <li>
                     {{ member.name }}
-                    <form action="{{ url_for('delete_member', member_id=member_id) }}" method="POST" style="display: inline-block; margin-left: 10px;">
+                    {% set counts = counters.assignee(member.id) %}
+                    <span class="counts">{{ counts.due }} due{% if counts.overdue %}, {{ counts.overdue }} overdue{% endif %}, load {{ '%.1f' % balancer.load(member.id) }}/week</span>
+                    <form action="{{ url_for('delete_member', member_id=member.id) }}" method="POST" style="display: inline-block; margin-left: 10px;">
                         <button type="submit" class="delete-btn" onclick="return confirm('Are you sure you want to delete {{member.name}}? This will unassign their tasks.')">Delete</button>
                     </form>
                 </li>
                 {% endfor %}
             </ul>
+            <form action="{{ url_for('auto_assign') }}" method="POST" class="inline-form">
+                <button type="submit">Auto-assign unassigned tasks</button>
+            </form>
+            <form action="{{ url_for('rebalance') }}" method="POST" class="inline-form">
+                <button type="submit">Rebalance</button>
+            </form>
             {% endif %}
         </div>
 
@@ -384,14 +446,17 @@ HTML_TEMPLATE = """
 
         <hr>
 
-        {% for room_id, room in rooms.items() %}
+        {% for room, tasks in rooms %}
+            {% set room_id = room.id %}
             <div class="room">
                 <h2>
                     <span>{{ room.name }}</span>
+                    {% set counts = counters.room(room_id) %}
+                    <span class="counts">{{ counts.due }} of {{ counts.total }} due{% if counts.overdue %} ({{ counts.overdue }} overdue){% endif %}</span>
                     <span class="room-header-controls">
                         <form action="{{ url_for('update_room_frequency', room_id=room_id) }}" method="POST" class="inline-form">
                             <label for="room_freq_{{room_id}}">Default Task Freq (days):</label>
-                            <input type="number" id="room_freq_{{room_id}}" name="room_frequency" value="{{ room.default_frequency_days if room.default_frequency_days is not none else '' }}" placeholder="e.g., 7" min="1" class="small-input">
+                            <input type="number" id="room_freq_{{room_id}}" name="room_frequency" value="{{ room.frequency_days if room.frequency_days is not none else '' }}" placeholder="e.g., 7" min="1" class="small-input">
                             <button type="submit" style="padding: 5px 8px;">Set</button>
                         </form>
                         <form action="{{ url_for('delete_room', room_id=room_id) }}" method="POST" class="inline-form">
@@ -404,46 +469,49 @@ HTML_TEMPLATE = """
                     <h4>Add New Task to {{ room.name }}</h4>
                     <form action="{{ url_for('add_task', room_id=room_id) }}" method="POST" class="inline-form">
                         <input type="text" name="task_name" placeholder="Task description" required>
-                        <input type="number" name="task_frequency" placeholder="Freq. (days, optional)" value="{{ room.default_frequency_days if room.default_frequency_days is not none else '' }}" min="1" class="small-input">
+                        <input type="text" name="task_frequency" placeholder="Days or rule, e.g. weekdays" value="{{ room.frequency_days if room.frequency_days is not none else '' }}" class="rule-input">
                         <button type="submit">Add Task</button>
                     </form>
                 </div>
 
-                {% if room.tasks %}
-                    {% for task_id, task in room.tasks.items() %}
-                        <div class="task {% if task.done %}done{% endif %}">
+                {% if tasks %}
+                    {% for task in tasks %}
+                        {% set task_id = task.id %}
+                        <div class="task {% if task_id in done %}done{% endif %}">
                             <form action="{{ url_for('toggle_task', room_id=room_id, task_id=task_id) }}" method="POST" style="display: inline-block;">
-                                <input type="checkbox" id="task_{{ task_id }}" {% if task.done %}checked{% endif %} onchange="this.form.submit()">
+                                <input type="checkbox" id="task_{{ task_id }}" {% if task_id in done %}checked{% endif %} onchange="this.form.submit()">
                             </form>
                             <label for="task_{{ task_id }}" class="task-name">{{ task.name }}</label>
 
                             <div class="actions">
                                 <form action="{{ url_for('update_task_frequency', room_id=room_id, task_id=task_id) }}" method="POST" class="task-details-form">
-                                    <input type="number" name="task_frequency" value="{{ task.frequency_days if task.frequency_days is not none else '' }}" placeholder="Days" min="1" class="small-input" title="Task Frequency (days)">
+                                    <input type="text" name="task_frequency" value="{{ task.repeat or (task.frequency_days if task.frequency_days is not none else '') }}" placeholder="Days or rule" class="rule-input" title="Days, or a rule like 'every 2nd tuesday' or '1st of the month'">
                                     <button type="submit" style="padding: 5px 8px;">Set Freq</button>
                                 </form>
 
                                 <form action="{{ url_for('assign_task', room_id=room_id, task_id=task_id) }}" method="POST" class="task-details-form">
                                     <select name="member_id" onchange="this.form.submit()">
                                         <option value="unassign" {% if not task.assigned_to %}selected{% endif %}>Unassigned</option>
-                                        {% for member_id_option, member in members.items() %}
-                                            <option value="{{ member_id_option }}" {% if task.assigned_to == member_id_option %}selected{% endif %}>
+                                        {% for member in members %}
+                                            <option value="{{ member.id }}" {% if task.assigned_to == member.id %}selected{% endif %}>
                                                 {{ member.name }}
                                             </option>
                                         {% endfor %}
                                     </select>
                                 </form>
-                                {% if task.assigned_to and members[task.assigned_to] %}
-                                    <span class="assignment">Assigned to: {{ members[task.assigned_to].name }}</span>
+                                {% if task.assigned_to and member_names[task.assigned_to] %}
+                                    <span class="assignment">Assigned to: {{ member_names[task.assigned_to] }}</span>
                                 {% elif task.assigned_to %}
                                      <span class="assignment">Assigned to: ID {{ task.assigned_to }} (Member not found)</span>
                                 {% endif %}
 
-                                {% if task.frequency_days %}
+                                {% if task.repeat %}
+                                    <span class="frequency">Repeats: {{ task.repeat }}</span>
+                                {% elif task.frequency_days %}
                                     <span class="frequency">Repeats every: {{ task.frequency_days }} day(s)</span>
                                 {% endif %}
-                                {% if task.last_done %}
-                                    <span class="last-done">(Last done: {{ task.last_done }})</span>
+                                {% if task.history %}
+                                    <span class="last-done">(Last done: {{ task.history[-1][:10] }})</span>
                                 {% endif %}
                                 <form action="{{ url_for('delete_task', room_id=room_id, task_id=task_id) }}" method="POST" class="inline-form">
                                     <button type="submit" class="delete-btn" style="padding: 5px 8px;" onclick="return confirm('Are you sure you want to delete this task?')">Del Task</button>
@@ -489,5 +557,8 @@ HTML_TEMPLATE = """
 </html>
 """
 
+idempotency.mount()
+tenancy.mount()
+
 if __name__ == "__main__":
     app.run(debug=True)
@@ -0,0 +1,137 @@
+"""Background watcher that reports changes to a single file.
+
+Uses inotify (through ctypes) on Linux and falls back to polling
+``os.stat`` everywhere else.
+"""
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import threading
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_CLOEXEC = 0o2000000
+IN_NONBLOCK = 0o4000
+
+WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM |
+              IN_MOVED_TO | IN_CREATE | IN_DELETE)
+EVENT_HEADER = struct.Struct('iIII')
+
+
+def _load_libc():
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        libc.inotify_init1
+        libc.inotify_add_watch
+    except (OSError, AttributeError):
+        return None
+    return libc
+
+
+class FileWatcher:
+    """Calls ``callback()`` from a daemon thread whenever ``path`` may have changed.
+
+    The directory is watched rather than the file itself, so editors that
+    save by writing a new file and renaming it over the old one are seen too.
+    Callers are expected to compare ``os.stat`` results themselves; the
+    callback can fire for changes that turn out to be no-ops.
+    """
+
+    def __init__(self, path, callback, poll_interval=0.5):
+        self.path = os.path.abspath(path)
+        self.callback = callback
+        self.poll_interval = poll_interval
+        self._stop = threading.Event()
+        self._thread = None
+        self._fd = None
+        self.mode = None
+
+    def start(self):
+        libc = _load_libc()
+        if libc is not None:
+            self._fd = self._inotify_fd(libc)
+        if self._fd is not None:
+            self.mode = 'inotify'
+            target = self._run_inotify
+        else:
+            self.mode = 'poll'
+            target = self._run_poll
+        self._thread = threading.Thread(target=target, name='filewatch', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def detach(self):
+        """Drops the watcher in a forked child, where its thread no longer exists."""
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def _inotify_fd(self, libc):
+        fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            return None
+        directory = os.path.dirname(self.path).encode()
+        if libc.inotify_add_watch(fd, directory, WATCH_MASK) < 0:
+            os.close(fd)
+            return None
+        return fd
+
+    def _run_inotify(self):
+        name = os.path.basename(self.path).encode()
+        while not self._stop.is_set():
+            ready, _, _ = select.select([self._fd], [], [], self.poll_interval)
+            if not ready:
+                continue
+            try:
+                buf = os.read(self._fd, 64 * 1024)
+            except BlockingIOError:
+                continue
+            except OSError:
+                return
+            if name in self._event_names(buf):
+                self.callback()
+
+    @staticmethod
+    def _event_names(buf):
+        names = set()
+        offset = 0
+        while offset + EVENT_HEADER.size <= len(buf):
+            _, _, _, length = EVENT_HEADER.unpack_from(buf, offset)
+            offset += EVENT_HEADER.size
+            names.add(buf[offset:offset + length].rstrip(b'\0'))
+            offset += length
+        return names
+
+    def _run_poll(self):
+        last = stat_signature(self.path)
+        while not self._stop.wait(self.poll_interval):
+            current = stat_signature(self.path)
+            if current != last:
+                last = current
+                self.callback()
+
+
+def stat_signature(path):
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_ino, st.st_size, st.st_mtime_ns)
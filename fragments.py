@@ -0,0 +1,60 @@
+"""Cache of pre-encoded JSON fragments, one per room."""
+import threading
+
+
+class FragmentCache:
+    """Encoded JSON bytes per room, reused until the room changes or its due flags flip.
+
+    Callers bump a room with ``invalidate(room_id)`` whenever they mutate it,
+    and drop everything with ``invalidate_all()`` when the whole document is
+    replaced. An entry can also carry an ``expires_at`` time, after which it is
+    rebuilt even if the room itself did not change.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._versions = {}
+        self._entries = {}
+        self.hits = 0
+        self.misses = 0
+
+    def version(self, room_id):
+        return (self._generation, self._versions.get(room_id, 0))
+
+    def invalidate(self, room_id):
+        with self._lock:
+            self._versions[room_id] = self._versions.get(room_id, 0) + 1
+            self._entries.pop(room_id, None)
+
+    def invalidate_all(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+    def get(self, room_id, now):
+        with self._lock:
+            entry = self._entries.get(room_id)
+            if entry is not None:
+                version, expires_at, fragment = entry
+                if version == self.version(room_id) and (expires_at is None or now < expires_at):
+                    self.hits += 1
+                    return fragment
+            self.misses += 1
+            return None
+
+    def put(self, room_id, version, expires_at, fragment):
+        with self._lock:
+            if version == self.version(room_id):
+                self._entries[room_id] = (version, expires_at, fragment)
+
+    def retain(self, room_ids):
+        """Forgets rooms that are no longer in the document."""
+        with self._lock:
+            for room_id in set(self._entries) - set(room_ids):
+                del self._entries[room_id]
+                self._versions.pop(room_id, None)
+
+    def stats(self):
+        with self._lock:
+            return {'rooms': len(self._entries), 'hits': self.hits, 'misses': self.misses}
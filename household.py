@@ -0,0 +1,1311 @@
+"""Domain logic for the canonical household document (see schema.py).
+
+app.py's Flask and ASGI front ends and chore_app.py all work through a
+Household. Documents in either legacy layout are migrated to the canonical
+schema when first loaded. The JSON API still speaks names: /data reports
+``assigned_to`` as a display name (with ``assigned_to_id`` alongside) and
+``frequency`` as daily/weekly/monthly or "N days", and mutations accept
+either form.
+
+Rooms are listed in ``order`` key order (see orderkeys.py) rather than list
+order, so moving a room rewrites that room's key and nothing else.
+
+Due flags are materialized: each task that is not due yet sits in a timing
+wheel under its next due time, and ``tick()`` (run by every ``load()``)
+flips the flags of those whose time has come, drops their rooms' cached
+fragments and tells the ``subscribe_due`` listeners. The same updates keep
+per-room and per-member counts of due, overdue and done tasks for
+``summary()``, and a DueIndex of next due times that ``forecast()`` reads
+the coming occurrences from.
+
+Every completion is also measured against the due time it answered, into
+per-room and per-member lateness sketches for ``stats()`` (see
+lateness.py), and counted into per-day, per-week and per-month buckets for
+``completions()`` (see timeseries.py).
+
+Room and task names are kept in a trigram index for ``search()`` (see
+search.py), and ``query()`` runs filter queries against all of these
+indexes (see query.py).
+
+``auto_assign()`` hands tasks to whoever has the least weekly load (see
+balance.py) and marks them ``auto``. An auto task passes to the next
+lightest member each time it is done, and ``rebalance()`` evens out
+auto tasks again after members come, go or change their ``exclude``
+list of rooms and tasks.
+
+Given a SnapshotFile, a Household publishes every save as a shared snapshot
+and serves /data from a newer one published by another process without
+loading it (see snapshot.py).
+"""
+import bisect
+import heapq
+import json
+import math
+import uuid
+from datetime import datetime, timedelta
+
+import schema
+from balance import LoadBalancer
+from filewatch import stat_signature
+from fragments import FragmentCache
+from indexes import DONE, DUE, OVERDUE, AssigneeIndex, DueIndex, StatusCounters
+from lateness import LatenessStats
+from orderkeys import key_between, spread_keys
+from query import compile_query, compile_spec
+from recurrence import compile_rule
+from schema import parse_frequency, parse_schedule, schedule_name
+from search import TrigramIndex
+from singleflight import SingleFlight
+from timerwheel import TimingWheel
+from timeseries import RESOLUTIONS, CompletionSeries, period, period_start
+
+
+class UnknownReference(KeyError):
+    """A request named a room, task or member that does not exist."""
+
+
+# Task fields /bulk_update may set
+BULK_FIELDS = ('name', 'frequency', 'effort')
+# Criteria a bulk selector may give; "all": true stands for none
+SELECTOR_KEYS = ('task_ids', 'room_id', 'assigned_to', 'frequency', 'due', 'all')
+
+# Order keys longer than this trigger a rebalance of every room's key
+MAX_ORDER_KEY = 8
+
+# A due task counts as overdue once it has waited this long
+OVERDUE_AFTER = timedelta(days=1)
+# Longest window forecast() looks ahead
+MAX_FORECAST_DAYS = 366
+# Occurrences forecast() returns per page by default and at most
+FORECAST_LIMIT = 1000
+MAX_FORECAST_LIMIT = 10000
+# Periods completions() reports when not given a start
+DEFAULT_PERIODS = {'day': 30, 'week': 26, 'month': 24}
+# Results search() returns by default and at most
+SEARCH_LIMIT = 20
+MAX_SEARCH_LIMIT = 200
+
+# Starter household written when there is no data file yet
+def sample_data():
+    alice, bob = str(uuid.uuid4()), str(uuid.uuid4())
+    return {
+        'schema': schema.SCHEMA_VERSION,
+        'members': [{'id': alice, 'name': 'Alice'}, {'id': bob, 'name': 'Bob'}],
+        'rooms': [
+            {
+                'id': str(uuid.uuid4()),
+                'name': 'Kitchen',
+                'frequency_days': 7,
+                'assigned_to': None,
+                'order': 'F',
+                'tasks': [
+                    {'id': str(uuid.uuid4()), 'name': 'Wash dishes', 'frequency_days': 1, 'assigned_to': alice, 'history': []},
+                    {'id': str(uuid.uuid4()), 'name': 'Clean counters', 'frequency_days': 7, 'assigned_to': bob, 'history': []}
+                ]
+            },
+            {
+                'id': str(uuid.uuid4()),
+                'name': 'Living Room',
+                'frequency_days': 7,
+                'assigned_to': None,
+                'order': 'U',
+                'tasks': [
+                    {'id': str(uuid.uuid4()), 'name': 'Vacuum floor', 'frequency_days': 7, 'assigned_to': alice, 'history': []}
+                ]
+            }
+        ]
+    }
+
+# When a repeating task next comes due (None if it has never been completed or never repeats)
+def next_due(task):
+    if not task.get('history') or not recurs(task):
+        return None
+    return due_after(task, datetime.fromisoformat(task['history'][-1]))
+
+# When a repeating task comes due again after a completion at ``completed``
+def due_after(task, completed):
+    if task.get('repeat'):
+        return datetime.combine(compile_rule(task['repeat']).next_date(completed.date()), datetime.min.time())
+    return completed + timedelta(days=task['frequency_days'])
+
+# Seconds between each completion from ``history[start]`` on and the due time
+# the completion before it set; the first completion has nothing to answer
+def completion_lateness(task, start=0):
+    history = task.get('history')
+    if not history or not recurs(task):
+        return []
+    previous = datetime.fromisoformat(history[start - 1]) if start > 0 else None
+    lateness = []
+    for entry in history[start:]:
+        completed = datetime.fromisoformat(entry)
+        if previous is not None:
+            lateness.append((completed - due_after(task, previous)).total_seconds())
+        previous = completed
+    return lateness
+
+def recurs(task):
+    return bool(task.get('frequency_days') or task.get('repeat'))
+
+# A task's expected work per week: its effort (default 1) times how often it comes round
+def weekly_load(task):
+    effort = task.get('effort') or 1
+    if task.get('repeat'):
+        return effort * 7 * compile_rule(task['repeat']).per_day
+    if task.get('frequency_days'):
+        return effort * 7 / task['frequency_days']
+    # A one-off task weighs its effort until it is done
+    return 0.0 if task.get('history') else float(effort)
+
+# Check if task is due: never done, or its frequency has passed since the last completion
+def is_task_due(task, now=None):
+    if not task.get('history'):
+        return True
+    due = next_due(task)
+    return due is not None and (now or datetime.now()) >= due
+
+# A task's state (DONE, DUE or OVERDUE) at ``now``, and when it next changes on its own
+def task_state(task, now):
+    if not task.get('history'):
+        return DUE, None
+    due = next_due(task)
+    if due is None:
+        return DONE, None
+    if now < due:
+        return DONE, due
+    if now < due + OVERDUE_AFTER:
+        return DUE, due + OVERDUE_AFTER
+    return OVERDUE, None
+
+# Earliest moment after now when one of the room's tasks becomes due
+def room_due_change(room, now):
+    upcoming = [due for due in map(next_due, room['tasks']) if due is not None and due > now]
+    return min(upcoming, default=None)
+
+# The /data body from the encoded head object and room fragments
+def join_data(head, fragments):
+    separator = b',' if head != b'{}' else b''
+    return head[:-1] + separator + b'"rooms":[' + b','.join(fragments) + b']}\n'
+
+
+# Forecast cursors, "date/time of day/rank/task id": the key of the last
+# occurrence a page returned
+def _forecast_after(slot, today):
+    day, slot_time, rank, task_id = slot[:4]
+    return '%s/%s/%r/%s' % (today + timedelta(days=day), slot_time.isoformat(), rank, task_id)
+
+
+def _forecast_cursor(after, today):
+    try:
+        day, slot_time, rank, task_id = after.split('/', 3)
+        return ((datetime.fromisoformat(day).date() - today).days,
+                datetime.strptime(slot_time, '%H:%M:%S.%f' if '.' in slot_time else '%H:%M:%S').time(),
+                float(rank), task_id)
+    except ValueError:
+        raise ValueError('after must be a cursor from a previous forecast page')
+
+
+# The occurrence after ``slot`` in a forecast (the first past ``cursor`` with
+# one), None when it falls outside the window
+def _next_slot(slot, today, days, cursor=None):
+    day, slot_time, rank, task_id, step, dates, due = slot
+    while True:
+        if dates is None:
+            if cursor is not None and day < cursor[0]:
+                day += -(-(cursor[0] - day) // step) * step
+            else:
+                day += step
+        else:
+            following = next(dates, None)
+            if following is None:
+                return None
+            day = (following - today).days
+        if day >= days:
+            return None
+        slot = (day, slot_time, rank, task_id, step, dates, due)
+        if cursor is None or slot[:4] > cursor:
+            return slot
+
+
+class Household:
+    """One household's document in a YamlStore, plus the caches derived from it.
+
+    Every mutation takes the store lock, applies the change, bumps the cached
+    fragment of the room it touched and saves. ``sync`` forces the save to
+    reach the disk before returning when the store is in write-behind mode.
+
+    Rooms and tasks are looked up through id maps, and ``assignees`` maps
+    each member to their ``(room_id, task_id)`` keys. All of them are rebuilt
+    lazily after the document is reloaded from disk and kept up to date by
+    the mutations in between.
+    """
+
+    def __init__(self, store, dumps=json.dumps, snapshot=None):
+        self.store = store
+        self.dumps = dumps
+        # Concurrent /data polls of the same store version share one render
+        self.data_flight = SingleFlight()
+        # Encoded JSON per room for /data
+        self.room_fragments = FragmentCache()
+        self.rooms_by_id = {}
+        self.tasks_by_id = {}
+        self.members_by_id = {}
+        self.member_ids_by_name = {}
+        # Sorted (order key, room id) pairs
+        self.room_order = []
+        self.assignees = AssigneeIndex()
+        # Ids of the tasks due now, and when each task's state next changes
+        self.due_task_ids = set()
+        self.due_wheel = TimingWheel()
+        # Task counts by state per room and per member, for /summary
+        self.counters = StatusCounters()
+        # Task ids by next due time; never-done tasks are due from the start
+        self.next_due_index = DueIndex()
+        # Weekly load per member, and the rooms and tasks each one is kept away from
+        self.balancer = LoadBalancer()
+        self.exclusions = {}
+        # How late completions come, per room and member, for /stats
+        self.lateness = LatenessStats(completion_lateness)
+        # Completions per day, week and month, for /completions
+        self.completion_series = CompletionSeries()
+        # Room and task names, for /search
+        self.search_index = TrigramIndex()
+        self._due_listeners = []
+        self._index_stale = True
+        # Shared snapshot, and the version of it the loaded document matches
+        self.snapshot = snapshot
+        self.snapshot_version = 0
+        # The snapshot the cached fragments were last brought in line with
+        self._snapshot_seen = None
+        self._publish_pending = False
+        self._adopting = False
+        store.subscribe(self._store_changed)
+
+    def load(self):
+        with self.store.lock:
+            if self.snapshot is not None:
+                self._catch_up()
+            data = self.store.load()
+            if self._index_stale:
+                data, migrated = schema.migrate(data)
+                if schema.repair(data) or migrated:
+                    self.store.save(data)
+                self._reindex(data)
+                if self.snapshot is not None and (self._publish_pending or not self.snapshot_version):
+                    self.publish()
+            self.tick()
+            return data
+
+    def save(self, data, sync=False):
+        self.store.save(data, sync=sync)
+
+    def touch_room(self, room_id):
+        self.room_fragments.invalidate(room_id)
+
+    def _store_changed(self, store, reloaded):
+        # A reload from disk replaces every room at once
+        if reloaded:
+            self.room_fragments.invalidate_all()
+            self._index_stale = True
+        if self.snapshot is not None and not self._adopting:
+            if self._index_stale:
+                # Published from load() once the document is migrated and indexed
+                self._publish_pending = True
+            else:
+                self.publish()
+
+    def publish(self):
+        """Writes the loaded document out as the next shared snapshot."""
+        with self.store.lock:
+            data = self.store.load()
+            head = {key: value for key, value in data.items() if key != 'rooms'}
+            source = None if self.store.dirty else stat_signature(self.store.path)
+            snapshot = self.snapshot.publish(head, self.ordered_rooms(), self.room_fragments.version, source)
+            self.snapshot_version = snapshot.version
+            self._snapshot_seen = snapshot
+            self._publish_pending = False
+
+    # Take over a snapshot another process published, unless our own changes
+    # are still waiting to be written
+    def _catch_up(self):
+        snapshot = self._newer_snapshot()
+        if snapshot is None or self.store.dirty:
+            return
+        self._adopting = True
+        try:
+            self.store.replace(snapshot.document())
+        finally:
+            self._adopting = False
+        self.snapshot_version = snapshot.version
+        self._snapshot_seen = snapshot
+
+    # A published snapshot newer than the loaded document, or None
+    def _newer_snapshot(self):
+        snapshot = self.snapshot.current()
+        if snapshot is None or snapshot.version <= self.snapshot_version:
+            return None
+        if not self.store.loaded and snapshot.source != stat_signature(self.store.path):
+            # The file changed after this snapshot; load() reads it and publishes anew
+            return None
+        return snapshot
+
+    def _reindex(self, data):
+        self.members_by_id = {member['id']: member for member in data['members']}
+        self.member_ids_by_name = {member['name']: member['id'] for member in data['members']}
+        self.rooms_by_id = {room['id']: room for room in data['rooms']}
+        self.room_order = sorted((room['order'], room['id']) for room in data['rooms'])
+        self.tasks_by_id = {task['id']: (room['id'], task) for room in data['rooms'] for task in room['tasks']}
+        self.assignees.rebuild(
+            ((room_id, task_id), task.get('assigned_to')) for task_id, (room_id, task) in self.tasks_by_id.items()
+        )
+        now = datetime.now()
+        self.due_task_ids = set()
+        self.due_wheel = TimingWheel(now=now.timestamp())
+        self.counters = StatusCounters()
+        self.next_due_index = DueIndex()
+        self.balancer = LoadBalancer(self.members_by_id)
+        self.exclusions = {member['id']: set(member['exclude']) for member in data['members'] if member.get('exclude')}
+        self.lateness = LatenessStats(completion_lateness)
+        self.completion_series = CompletionSeries()
+        self.search_index = TrigramIndex()
+        for room in data['rooms']:
+            self.search_index.set(('room', room['id']), room['name'])
+        for _, task in self.tasks_by_id.values():
+            self.refresh_due(task, now)
+        self._index_stale = False
+
+    # --- Due transitions ---
+
+    def is_due(self, task_id):
+        return task_id in self.due_task_ids
+
+    def refresh_due(self, task, now=None):
+        """Recomputes a task's due flag, counters and next wheel timer after it changed."""
+        task_id = task['id']
+        state, changes_at = task_state(task, now or datetime.now())
+        if changes_at is None:
+            self.due_wheel.cancel(task_id)
+        else:
+            self.due_wheel.schedule(task_id, changes_at.timestamp())
+        if state == DONE:
+            self.due_task_ids.discard(task_id)
+        else:
+            self.due_task_ids.add(task_id)
+        room_id = self.tasks_by_id[task_id][0]
+        self.counters.set(task_id, room_id, task.get('assigned_to'), state)
+        self.lateness.update(task_id, room_id, task.get('assigned_to'), task)
+        self.completion_series.update(task_id, room_id, task.get('assigned_to'), task)
+        self.search_index.set(('task', task_id), task['name'])
+        if not task.get('history'):
+            self.next_due_index.set(task_id, -math.inf)
+        elif recurs(task):
+            self.next_due_index.set(task_id, next_due(task).timestamp())
+        else:
+            self.next_due_index.remove(task_id)
+        self.balancer.set(task_id, task.get('assigned_to'), weekly_load(task), bool(task.get('auto')))
+
+    def forget_due(self, task_id):
+        self.due_wheel.cancel(task_id)
+        self.due_task_ids.discard(task_id)
+        self.counters.remove(task_id)
+        self.next_due_index.remove(task_id)
+        self.balancer.remove(task_id)
+        self.lateness.remove(task_id)
+        self.completion_series.remove(task_id)
+        self.search_index.remove(('task', task_id))
+
+    def subscribe_due(self, listener):
+        """Registers ``listener(household, tasks)``, called with the ``(room_id, task_id)`` of tasks that became due."""
+        self._due_listeners.append(listener)
+
+    def tick(self, now=None):
+        """Flags the tasks whose due time has passed and returns their ``(room_id, task_id)``."""
+        now = now or datetime.now()
+        became_due = []
+        with self.store.lock:
+            if self._index_stale:
+                return became_due
+            for task_id in self.due_wheel.advance(now.timestamp()):
+                room_id, task = self.tasks_by_id[task_id]
+                was_due = task_id in self.due_task_ids
+                self.refresh_due(task, now)
+                # Turning overdue only moves the counters
+                if not was_due and task_id in self.due_task_ids:
+                    self.touch_room(room_id)
+                    became_due.append((room_id, task_id))
+        if became_due:
+            for listener in self._due_listeners:
+                listener(self, became_due)
+        return became_due
+
+    def find_room(self, room_id):
+        return self.rooms_by_id.get(room_id)
+
+    def find_task(self, room_id, task_id):
+        room_id_of_task, task = self.tasks_by_id.get(task_id, (None, None))
+        return task if room_id_of_task == room_id else None
+
+    def ordered_rooms(self):
+        return [self.rooms_by_id[room_id] for _, room_id in self.room_order]
+
+    def set_room_order(self, room, key):
+        if room.get('order'):
+            del self.room_order[bisect.bisect_left(self.room_order, (room['order'], room['id']))]
+        room['order'] = key
+        bisect.insort(self.room_order, (key, room['id']))
+        self.touch_room(room['id'])
+
+    # Hand out fresh, short keys once repeated moves into one gap have grown them
+    def rebalance_rooms(self):
+        rooms = self.ordered_rooms()
+        self.room_order = []
+        for room, key in zip(rooms, spread_keys(len(rooms))):
+            room['order'] = key
+            self.room_order.append((key, room['id']))
+        self.room_fragments.invalidate_all()
+
+    def member_id(self, value, required=False):
+        """Resolves a member id or display name to an id; empty values mean unassigned."""
+        if not value:
+            if required:
+                raise UnknownReference('member %r' % value)
+            return None
+        if value in self.members_by_id:
+            return value
+        if value in self.member_ids_by_name:
+            return self.member_ids_by_name[value]
+        raise UnknownReference('member %r' % value)
+
+    def frequency(self, value):
+        try:
+            return parse_frequency(value)
+        except ValueError:
+            raise UnknownReference('frequency %r' % (value,))
+
+    # A task's frequency or repeat rule as ``{'frequency_days', 'repeat'}``
+    def schedule(self, value):
+        try:
+            frequency_days, repeat = parse_schedule(value)
+        except ValueError:
+            raise UnknownReference('frequency %r' % (value,))
+        return {'frequency_days': frequency_days, 'repeat': repeat}
+
+    def member_name(self, member_id, members_by_id=None):
+        member = (self.members_by_id if members_by_id is None else members_by_id).get(member_id)
+        return member['name'] if member else None
+
+    # Task or room as the API shows it: assignment by display name, id alongside
+    def present(self, item, members_by_id=None):
+        return {**item, 'assigned_to': self.member_name(item.get('assigned_to'), members_by_id),
+                'assigned_to_id': item.get('assigned_to'),
+                'frequency': schedule_name(item)}
+
+    def present_room(self, room, now, members_by_id=None):
+        return {**self.present(room, members_by_id), 'tasks': [
+            {**self.present(task, members_by_id), 'is_due': is_task_due(task, now)} for task in room['tasks']
+        ]}
+
+    def present_head(self, data):
+        head = {key: value for key, value in data.items() if key != 'rooms'}
+        head['family_members'] = [member['name'] for member in data['members']]
+        return head
+
+    # Add records to the document and the indexes; callers hold the lock and save
+
+    def insert_room(self, data, room):
+        data['rooms'].append(room)
+        self.rooms_by_id[room['id']] = room
+        self.search_index.set(('room', room['id']), room['name'])
+        last = self.room_order[-1][0] if self.room_order else None
+        self.set_room_order(room, key_between(last, None))
+        return room
+
+    def insert_task(self, room, task):
+        room['tasks'].append(task)
+        self.tasks_by_id[task['id']] = (room['id'], task)
+        self.assignees.assign((room['id'], task['id']), task['assigned_to'])
+        self.refresh_due(task)
+        self.touch_room(room['id'])
+        return task
+
+    def insert_member(self, data, member):
+        data['members'].append(member)
+        self.members_by_id[member['id']] = member
+        self.member_ids_by_name[member['name']] = member['id']
+        self.balancer.add_member(member['id'])
+        if member.get('exclude'):
+            self.exclusions[member['id']] = set(member['exclude'])
+        return member
+
+    # Assigning by hand clears ``auto``, so rebalancing leaves the task alone
+    def assign_task(self, room_id, task, assigned_to, auto=False):
+        task['assigned_to'] = assigned_to
+        if auto:
+            task['auto'] = True
+        else:
+            task.pop('auto', None)
+        self.assignees.assign((room_id, task['id']), assigned_to)
+        self.counters.assign(task['id'], assigned_to)
+        self.lateness.update(task['id'], room_id, assigned_to, task)
+        self.completion_series.update(task['id'], room_id, assigned_to, task)
+        self.balancer.set(task['id'], assigned_to, weekly_load(task), auto)
+
+    def excluded(self, member_id, task_id):
+        """Whether ``member_id`` has excluded the task or its room."""
+        exclusions = self.exclusions.get(member_id)
+        return bool(exclusions) and (task_id in exclusions or self.tasks_by_id[task_id][0] in exclusions)
+
+    # Hands an auto task to the lightest member who may take it, other than
+    # ``avoid`` if anyone else can; returns whether it changed hands
+    def place_task(self, room_id, task, avoid=None):
+        task_id = task['id']
+        member_id = self.balancer.lightest(lambda member_id: member_id == avoid or self.excluded(member_id, task_id))
+        if member_id is None:
+            if avoid is None or avoid not in self.balancer or self.excluded(avoid, task_id):
+                return False
+            member_id = avoid
+        changed = member_id != task.get('assigned_to')
+        self.assign_task(room_id, task, member_id, auto=True)
+        self.touch_room(room_id)
+        return changed
+
+    def effort(self, value):
+        try:
+            effort = float(value)
+        except (TypeError, ValueError):
+            effort = 0
+        if not effort > 0:
+            raise UnknownReference('effort %r' % (value,))
+        return int(effort) if effort == int(effort) else effort
+
+    def select_tasks(self, selector):
+        """Returns ``(room_id, task)`` for every task matching a bulk selector.
+
+        A selector may give ``task_ids``, ``room_id``, ``assigned_to`` (member
+        id or name, empty for unassigned), ``frequency`` and ``due``; tasks must
+        match all of them. Every task takes an explicit ``{"all": true}``, so a
+        mistyped or empty selector is a ValueError rather than a match for
+        everything. The narrowest of the id lists, the room and the assignee
+        index supplies the candidates and the other criteria filter them.
+        """
+        if not isinstance(selector, dict):
+            raise ValueError('select must be an object')
+        unknown = sorted(set(selector) - set(SELECTOR_KEYS))
+        if unknown:
+            raise ValueError('unknown select key %s; expected %s' % (
+                ', '.join(map(repr, unknown)), ', '.join(SELECTOR_KEYS)))
+        if not any(key in selector for key in SELECTOR_KEYS[:-1]) and selector.get('all') is not True:
+            raise ValueError('select needs at least one criterion, or "all": true for every task')
+        candidates = []
+        if 'task_ids' in selector:
+            candidates.append([self.tasks_by_id[task_id] for task_id in selector['task_ids']
+                               if task_id in self.tasks_by_id])
+        if 'room_id' in selector:
+            room_id = selector['room_id']
+            candidates.append([(room_id, task) for task in self._room(room_id)['tasks']])
+        if 'assigned_to' in selector:
+            candidates.append([(room_id, self.tasks_by_id[task_id][1]) for room_id, task_id
+                               in self.assignees.tasks_for(self.member_id(selector['assigned_to']))])
+        if not candidates:
+            candidates.append(list(self.tasks_by_id.values()))
+        matches = min(candidates, key=len)
+        if 'room_id' in selector:
+            matches = [(room_id, task) for room_id, task in matches if room_id == selector['room_id']]
+        if 'assigned_to' in selector:
+            assigned_to = self.member_id(selector['assigned_to'])
+            matches = [(room_id, task) for room_id, task in matches if task.get('assigned_to') == assigned_to]
+        if 'frequency' in selector:
+            schedule = self.schedule(selector['frequency'])
+            matches = [(room_id, task) for room_id, task in matches
+                       if all(task.get(field) == value for field, value in schedule.items())]
+        if 'due' in selector:
+            matches = [(room_id, task) for room_id, task in matches
+                       if self.is_due(task['id']) == bool(selector['due'])]
+        return matches
+
+    # --- Reads ---
+
+    def render_data(self):
+        """Returns the /data body, shared by concurrent callers of the same version."""
+        if self.snapshot is not None:
+            snapshot = self._newer_snapshot()
+            if snapshot is not None:
+                return self.data_flight.do(('snapshot', snapshot.version),
+                                           lambda: self._render_snapshot(snapshot))
+        return self.data_flight.do(('data', self.store.version), self._render_data)
+
+    # Assemble /data from per-room fragments, encoding only rooms that changed
+    def _render_data(self):
+        now = datetime.now()
+        fragments = []
+        missing = []
+        with self.store.lock:
+            data = self.load()
+            rooms = self.ordered_rooms()
+            for room in rooms:
+                fragment = self.room_fragments.get(room['id'], now)
+                if fragment is None:
+                    missing.append((len(fragments), room['id'], self.room_fragments.version(room['id']),
+                                    room_due_change(room, now), self.present_room(room, now)))
+                fragments.append(fragment)
+            head = self.dumps(self.present_head(data)).encode()
+            room_ids = [room['id'] for room in rooms]
+        for index, room_id, version, expires_at, presented in missing:
+            fragments[index] = self.dumps(presented).encode()
+            self.room_fragments.put(room_id, version, expires_at, fragments[index])
+        if missing:
+            self.room_fragments.retain(room_ids)
+        return join_data(head, fragments)
+
+    # /data straight from a snapshot, decoding only the rooms whose fragment is stale
+    def _render_snapshot(self, snapshot):
+        now = datetime.now()
+        with self.store.lock:
+            self._follow(snapshot)
+        members_by_id = {member['id']: member for member in snapshot.head['members']}
+        fragments = []
+        missing = False
+        for room_id in snapshot.room_ids:
+            fragment = self.room_fragments.get(room_id, now)
+            if fragment is None:
+                version = self.room_fragments.version(room_id)
+                room = snapshot.room(room_id)
+                fragment = self.dumps(self.present_room(room, now, members_by_id)).encode()
+                self.room_fragments.put(room_id, version, room_due_change(room, now), fragment)
+                missing = True
+            fragments.append(fragment)
+        if missing:
+            self.room_fragments.retain(snapshot.room_ids)
+        return join_data(self.dumps(self.present_head(snapshot.head)).encode(), fragments)
+
+    # Drop the fragments of rooms that differ between the last snapshot seen and this one
+    def _follow(self, snapshot):
+        seen = self._snapshot_seen
+        if seen is snapshot or (seen is not None and seen.version > snapshot.version):
+            return
+        if seen is None or seen.head_checksum != snapshot.head_checksum:
+            # Member names show up in every room
+            self.room_fragments.invalidate_all()
+        else:
+            for room_id in snapshot.room_ids:
+                if seen.checksum(room_id) != snapshot.checksum(room_id):
+                    self.room_fragments.invalidate(room_id)
+        self._snapshot_seen = snapshot
+
+    def render_person(self, person):
+        """Returns /data restricted to the rooms and tasks assigned to ``person``."""
+        now = datetime.now()
+        with self.store.lock:
+            data = self.load()
+            task_ids_by_room = {}
+            for room_id, task_id in self.assignees.tasks_for(self.member_id(person)):
+                task_ids_by_room.setdefault(room_id, set()).add(task_id)
+            rooms = []
+            for room_id, task_ids in task_ids_by_room.items():
+                room = self.rooms_by_id[room_id]
+                tasks = [self.tasks_by_id[task_id][1] for task_id in task_ids]
+                rooms.append(self.present_room({**room, 'tasks': tasks}, now))
+            rooms.sort(key=lambda room: room['order'])
+            return self.dumps({**self.present_head(data), 'rooms': rooms}).encode() + b'\n'
+
+    def summary(self):
+        """Task counts per room and per member, read from the counters without visiting any task."""
+        with self.store.lock:
+            self.load()
+            return {
+                'rooms': [{'id': room['id'], 'name': room['name'], **self.counters.room(room['id'])}
+                          for room in self.ordered_rooms()],
+                'members': [{'id': member_id, 'name': member['name'], **self.counters.assignee(member_id),
+                             'weekly_load': round(self.balancer.load(member_id), 3)}
+                            for member_id, member in self.members_by_id.items()],
+                'unassigned': self.counters.assignee(None),
+            }
+
+    def stats(self, task_id=None):
+        """Lateness of completions in hours (count, mean and quantiles) overall, per room and per member."""
+        with self.store.lock:
+            self.load()
+            hours = 3600.0
+            stats = {
+                'unit': 'hours',
+                'overall': self.lateness.overall.summary(scale=hours),
+                'rooms': [{'id': room['id'], 'name': room['name'], **self.lateness.room(room['id']).summary(scale=hours)}
+                          for room in self.ordered_rooms()],
+                'members': [{'id': member_id, 'name': member['name'],
+                             **self.lateness.member(member_id).summary(scale=hours)}
+                            for member_id, member in self.members_by_id.items()],
+                'unassigned': self.lateness.member(None).summary(scale=hours),
+            }
+            if task_id is not None:
+                if task_id not in self.tasks_by_id:
+                    raise UnknownReference('task %r' % task_id)
+                stats['task'] = {'id': task_id, **self.lateness.task(task_id).summary(scale=hours)}
+            return stats
+
+    def completions(self, resolution='day', start=None, end=None, now=None):
+        """Completions per day, week or month from ``start`` to ``end`` (ISO dates, ``end`` defaulting to today).
+
+        Without a start it covers the last DEFAULT_PERIODS periods. Periods
+        older than the buckets reach back are left out, so ``periods`` may
+        begin later than ``start``. Each series costs one bucket read per
+        period, however many completions there were.
+        """
+        if resolution not in RESOLUTIONS:
+            raise ValueError('resolution must be one of %s' % ', '.join(RESOLUTIONS))
+        today = (now or datetime.now()).date()
+        end = datetime.fromisoformat(end).date() if end else today
+        start = datetime.fromisoformat(start).date() if start else None
+        with self.store.lock:
+            self.load()
+            series = self.completion_series
+            if start is None:
+                start = period_start(resolution, period(resolution, end) - DEFAULT_PERIODS[resolution] + 1)
+            numbers = series.window(resolution, start, end, today)
+            counts = series.counts
+            return {
+                'resolution': resolution,
+                'periods': [period_start(resolution, number).isoformat() for number in numbers],
+                'overall': counts(series.overall, resolution, numbers),
+                'rooms': [{'id': room['id'], 'name': room['name'],
+                           'counts': counts(series.room(room['id']), resolution, numbers)}
+                          for room in self.ordered_rooms()],
+                'members': [{'id': member_id, 'name': member['name'],
+                             'counts': counts(series.member(member_id), resolution, numbers)}
+                            for member_id, member in self.members_by_id.items()],
+                'unassigned': counts(series.member(None), resolution, numbers),
+            }
+
+    def search(self, query, limit=SEARCH_LIMIT):
+        """Rooms and tasks whose names match ``query``, best first (see search.py)."""
+        if not query or not query.strip():
+            raise ValueError('q is required')
+        if not 1 <= limit <= MAX_SEARCH_LIMIT:
+            raise ValueError('limit must be between 1 and %d' % MAX_SEARCH_LIMIT)
+        with self.store.lock:
+            self.load()
+            keys, total = self.search_index.search(query, limit)
+            results = []
+            for kind, key in keys:
+                if kind == 'room':
+                    room = self.rooms_by_id[key]
+                    results.append({'type': 'room', 'id': key, 'name': room['name'], 'tasks': len(room['tasks'])})
+                    continue
+                results.append({'type': 'task', **self._task_result(*self.tasks_by_id[key])})
+            return {'query': query, 'total': total, 'results': results}
+
+    def query(self, spec, explain=False, now=None):
+        """Tasks matching a query in the text or JSON form (see query.py), with its plan if ``explain``."""
+        compiled = compile_query(spec) if isinstance(spec, str) else compile_spec(spec)
+        now = now or datetime.now()
+        with self.store.lock:
+            self.load()
+            matched, total, plan = compiled.run(self, now)
+            result = {'total': total, 'tasks': [self._task_result(room_id, task) for room_id, task in matched]}
+            if explain:
+                result['plan'] = plan
+            return result
+
+    # A task as /search and /query list it
+    def _task_result(self, room_id, task):
+        when = self.next_due_index.time_of(task['id'])
+        return {
+            'id': task['id'],
+            'name': task['name'],
+            'room_id': room_id,
+            'room': self.rooms_by_id[room_id]['name'],
+            'frequency': schedule_name(task),
+            'assigned_to': self.member_name(task.get('assigned_to')),
+            'assigned_to_id': task.get('assigned_to'),
+            'due': self.is_due(task['id']),
+            'next_due': datetime.fromtimestamp(when).isoformat() if when is not None and when > -math.inf else None,
+        }
+
+    def forecast(self, days, person=None, now=None, limit=FORECAST_LIMIT, after=None):
+        """Occurrences due today and over the following ``days - 1`` days, assuming each is done on time.
+
+        Tasks already due count once, today, ahead of the rest of the day and
+        longest due first. Occurrences come in date, time-of-day and task id
+        order, ``limit`` at a time. Each task yields its dates lazily by
+        stepping its frequency or repeat rule, and tasks join a heap merge
+        only once the due index (earliest first) says they could come next,
+        so a page costs about its own size plus the tasks that fall due
+        before its last occurrence. ``days`` lists each date the page covers;
+        while occurrences are left, ``next`` is a cursor to pass back as
+        ``after`` for the page that follows.
+        """
+        if not 1 <= days <= MAX_FORECAST_DAYS:
+            raise ValueError('days must be between 1 and %d' % MAX_FORECAST_DAYS)
+        if not 1 <= limit <= MAX_FORECAST_LIMIT:
+            raise ValueError('limit must be between 1 and %d' % MAX_FORECAST_LIMIT)
+        now = now or datetime.now()
+        today = now.date()
+        end = today + timedelta(days=days)
+        cursor = _forecast_cursor(after, today) if after else None
+        stop = datetime.combine(end, datetime.min.time()).timestamp()
+        with self.store.lock:
+            self.load()
+            if person is None:
+                entries = self.next_due_index.iter_until(stop)
+            else:
+                time_of = self.next_due_index.time_of
+                entries = sorted((when, task_id) for when, task_id in (
+                    (time_of(task_id), task_id) for _, task_id in self.assignees.tasks_for(self.member_id(person))
+                ) if when is not None and when <= stop)
+            pending = self._forecast_slots(entries, now, days, cursor)
+            upcoming = next(pending, None)
+            heap = []
+            page = []
+            while len(page) < limit:
+                # Bring in every task whose first occurrence could beat the heap's
+                while upcoming is not None and (not heap or upcoming[0] <= heap[0][:4]):
+                    if upcoming[1] is not None:
+                        heapq.heappush(heap, upcoming[1])
+                    upcoming = next(pending, None)
+                if not heap:
+                    break
+                slot = heap[0]
+                page.append(slot)
+                slot = _next_slot(slot, today, days)
+                if slot is None:
+                    heapq.heappop(heap)
+                else:
+                    heapq.heapreplace(heap, slot)
+            more = bool(heap) or upcoming is not None
+            first = max(cursor[0], 0) if cursor is not None else 0
+            last = page[-1][0] if more else days - 1
+            by_day = [[] for _ in range(first, last + 1)]
+            tasks = {}
+            for day, _, _, task_id, _, _, due in page:
+                by_day[day - first].append(task_id)
+                if task_id not in tasks:
+                    room_id, task = self.tasks_by_id[task_id]
+                    tasks[task_id] = {
+                        'name': task['name'],
+                        'room_id': room_id,
+                        'room': self.rooms_by_id[room_id]['name'],
+                        'frequency': schedule_name(task),
+                        'assigned_to': self.member_name(task.get('assigned_to')),
+                        'assigned_to_id': task.get('assigned_to'),
+                        'time': due.strftime('%H:%M'),
+                        'due_now': due is now,
+                    }
+            return {
+                'from': today.isoformat(),
+                'days': [{'date': (today + timedelta(days=first + n)).isoformat(), 'task_ids': task_ids}
+                         for n, task_ids in enumerate(by_day)],
+                'tasks': tasks,
+                'next': _forecast_after(page[-1], today) if more and page else None,
+            }
+
+    # (first key, first slot past the cursor or None) for each (next due time,
+    # task id) in ``entries``, earliest first. A slot is (day, time of day,
+    # rank, task id, step, later dates of a repeat rule, due time); tasks
+    # already due go at the start of today, ranked by how long they have been.
+    def _forecast_slots(self, entries, now, days, cursor):
+        today = now.date()
+        start = now.timestamp()
+        end = today + timedelta(days=days)
+        for when, task_id in entries:
+            if when <= start:
+                due, day, slot_time, rank = now, 0, datetime.min.time(), when
+            else:
+                due = datetime.fromtimestamp(when)
+                day, slot_time, rank = (due.date() - today).days, due.time(), 0
+                if day >= days:
+                    continue
+            task = self.tasks_by_id[task_id][1]
+            step = compile_rule(task['repeat']) if task.get('repeat') else task['frequency_days'] or days
+            dates = None if isinstance(step, int) else step.dates(today + timedelta(days=day), end)
+            slot = (day, slot_time, rank, task_id, step, dates, due)
+            if cursor is not None and slot[:4] <= cursor:
+                yield slot[:4], _next_slot(slot, today, days, cursor)
+            else:
+                yield slot[:4], slot
+
+    def metrics(self):
+        metrics = {
+            'data': self.data_flight.stats(),
+            'room_fragments': self.room_fragments.stats(),
+            'store_version': self.store.version,
+            'due': {'tasks': len(self.due_task_ids), 'scheduled': len(self.due_wheel)}
+        }
+        if self.snapshot is not None:
+            metrics['snapshot'] = {**self.snapshot.stats(), 'loaded_version': self.snapshot_version}
+        return metrics
+
+    # --- Mutations ---
+
+    def add_room(self, payload, sync=False):
+        with self.store.lock:
+            data = self.load()
+            room = {
+                'id': str(uuid.uuid4()),
+                'name': payload['name'],
+                'frequency_days': self.frequency(payload['frequency']),
+                'assigned_to': self.member_id(payload.get('assigned_to')),
+                'order': None,
+                'tasks': []
+            }
+            self.insert_room(data, room)
+            self.save(data, sync)
+            return room
+
+    def add_task(self, payload, sync=False):
+        with self.store.lock:
+            data = self.load()
+            room_id = payload['room_id']
+            task = {
+                'id': str(uuid.uuid4()),
+                'name': payload['name'],
+                **self.schedule(payload['frequency']),
+                'assigned_to': self.member_id(payload.get('assigned_to')),
+                'history': []
+            }
+            if task['repeat'] is None:
+                del task['repeat']
+            if payload.get('effort') is not None:
+                task['effort'] = self.effort(payload['effort'])
+            room = self.find_room(room_id)
+            if room is not None:
+                self.insert_task(room, task)
+            self.touch_room(room_id)
+            self.save(data, sync)
+            return task
+
+    def complete_task(self, payload, sync=False):
+        with self.store.lock:
+            data = self.load()
+            room_id = payload['room_id']
+            task = self.find_task(room_id, payload['task_id'])
+            if task is not None:
+                if payload['completed']:
+                    task['history'].append(datetime.now().isoformat())
+                elif task['history']:
+                    task['history'].pop()
+                self.refresh_due(task)
+                if payload['completed'] and task.get('auto'):
+                    self.place_task(room_id, task, avoid=task.get('assigned_to'))
+            self.touch_room(room_id)
+            self.save(data, sync)
+            return task
+
+    def reassign_task(self, payload, sync=False):
+        with self.store.lock:
+            data = self.load()
+            room_id = payload['room_id']
+            task = self.find_task(room_id, payload['task_id'])
+            if task is not None:
+                self.assign_task(room_id, task, self.member_id(payload['assigned_to']))
+            self.touch_room(room_id)
+            self.save(data, sync)
+            return task
+
+    def assign_room(self, payload, sync=False):
+        with self.store.lock:
+            data = self.load()
+            room_id = payload['room_id']
+            assigned_to = self.member_id(payload['assigned_to'])
+            room = self.find_room(room_id)
+            if room is not None:
+                room['assigned_to'] = assigned_to
+                if assigned_to:
+                    for task in room['tasks']:
+                        self.assign_task(room_id, task, assigned_to)
+            self.touch_room(room_id)
+            self.save(data, sync)
+            return room
+
+    def move_room(self, payload, sync=False):
+        """Moves a room just before ``before_id`` or just after ``after_id`` (to the end if neither)."""
+        with self.store.lock:
+            data = self.load()
+            room = self._room(payload['room_id'])
+            before_id, after_id = payload.get('before_id'), payload.get('after_id')
+            order = self.room_order
+            if before_id:
+                index = bisect.bisect_left(order, (self._room(before_id)['order'], before_id))
+            elif after_id:
+                index = bisect.bisect_right(order, (self._room(after_id)['order'], after_id))
+            else:
+                index = len(order)
+            # Neighbours either side of the gap, stepping over the moving room
+            own = (room['order'], room['id'])
+            below = index - 1 - (index > 0 and order[index - 1] == own)
+            above = index + (index < len(order) and order[index] == own)
+            low = order[below][0] if below >= 0 else None
+            high = order[above][0] if above < len(order) else None
+            key = key_between(low, high)
+            self.set_room_order(room, key)
+            if len(key) > MAX_ORDER_KEY:
+                self.rebalance_rooms()
+            self.save(data, sync)
+            return room
+
+    # Drag and drop from the page: the dragged room takes the target's place
+    def reorder_rooms(self, payload, sync=False):
+        with self.store.lock:
+            self.load()
+            dragged = self._room(payload['dragged_id'])
+            target = self._room(payload['target_id'])
+            if dragged['order'] < target['order']:
+                return self.move_room({'room_id': dragged['id'], 'after_id': target['id']}, sync)
+            return self.move_room({'room_id': dragged['id'], 'before_id': target['id']}, sync)
+
+    def _room(self, room_id):
+        room = self.find_room(room_id)
+        if room is None:
+            raise UnknownReference('room %r' % room_id)
+        return room
+
+    # Bulk mutations take {"select": {...}} (see select_tasks), change every
+    # matching task under one lock hold, save once and return the task count
+
+    def bulk_complete(self, payload, sync=False):
+        with self.store.lock:
+            data = self.load()
+            now = datetime.now()
+            completed = payload.get('completed', True)
+            affected = 0
+            for room_id, task in self.select_tasks(payload['select']):
+                if completed:
+                    task['history'].append(now.isoformat())
+                elif task['history']:
+                    task['history'].pop()
+                else:
+                    continue
+                self.refresh_due(task, now)
+                if completed and task.get('auto'):
+                    self.place_task(room_id, task, avoid=task.get('assigned_to'))
+                affected += 1
+                self.touch_room(room_id)
+            if affected:
+                self.save(data, sync)
+            return affected
+
+    def bulk_assign(self, payload, sync=False):
+        with self.store.lock:
+            data = self.load()
+            assigned_to = self.member_id(payload['assigned_to'])
+            affected = 0
+            for room_id, task in self.select_tasks(payload['select']):
+                if task.get('assigned_to') != assigned_to:
+                    self.assign_task(room_id, task, assigned_to)
+                    self.touch_room(room_id)
+                    affected += 1
+            if affected:
+                self.save(data, sync)
+            return affected
+
+    def bulk_update(self, payload, sync=False):
+        with self.store.lock:
+            data = self.load()
+            changes = payload['set']
+            if not isinstance(changes, dict) or not changes:
+                raise ValueError('set must be an object with at least one of %s' % ', '.join(BULK_FIELDS))
+            unknown = sorted(set(changes) - set(BULK_FIELDS))
+            if unknown:
+                raise ValueError('unsupported set field %s; expected %s' % (
+                    ', '.join(map(repr, unknown)), ', '.join(BULK_FIELDS)))
+            changes = dict(changes)
+            if 'frequency' in changes:
+                changes.update(self.schedule(changes.pop('frequency')))
+            if 'effort' in changes:
+                changes['effort'] = self.effort(changes['effort'])
+            affected = 0
+            for room_id, task in self.select_tasks(payload['select']):
+                if any(task.get(field) != value for field, value in changes.items()):
+                    task.update(changes)
+                    if task.get('repeat', False) is None:
+                        del task['repeat']
+                    self.refresh_due(task)
+                    self.touch_room(room_id)
+                    affected += 1
+            if affected:
+                self.save(data, sync)
+            return affected
+
+    def delete_history(self, payload, sync=False):
+        with self.store.lock:
+            data = self.load()
+            room_id = payload['room_id']
+            index = payload['index']
+            task = self.find_task(room_id, payload['task_id'])
+            if task is not None and index < len(task['history']):
+                task['history'].pop(index)
+                self.refresh_due(task)
+            self.touch_room(room_id)
+            self.save(data, sync)
+            return task
+
+    def update_room(self, payload, sync=False):
+        with self.store.lock:
+            data = self.load()
+            room = self._room(payload['room_id'])
+            if 'name' in payload:
+                room['name'] = payload['name']
+                self.search_index.set(('room', room['id']), room['name'])
+            if 'frequency' in payload:
+                room['frequency_days'] = self.frequency(payload['frequency'])
+            self.touch_room(room['id'])
+            self.save(data, sync)
+            return room
+
+    def delete_task(self, payload, sync=False):
+        with self.store.lock:
+            data = self.load()
+            room_id = payload['room_id']
+            task = self.find_task(room_id, payload['task_id'])
+            if task is not None:
+                self.rooms_by_id[room_id]['tasks'].remove(task)
+                del self.tasks_by_id[task['id']]
+                self.assignees.remove((room_id, task['id']))
+                self.forget_due(task['id'])
+                self.touch_room(room_id)
+                self.save(data, sync)
+            return task
+
+    def delete_room(self, payload, sync=False):
+        with self.store.lock:
+            data = self.load()
+            room = self.find_room(payload['room_id'])
+            if room is not None:
+                for task in room['tasks']:
+                    del self.tasks_by_id[task['id']]
+                    self.assignees.remove((room['id'], task['id']))
+                    self.forget_due(task['id'])
+                data['rooms'].remove(room)
+                del self.rooms_by_id[room['id']]
+                self.search_index.remove(('room', room['id']))
+                self.room_order.remove((room['order'], room['id']))
+                self.touch_room(room['id'])
+                self.save(data, sync)
+            return room
+
+    def add_member(self, payload, sync=False):
+        with self.store.lock:
+            data = self.load()
+            name = payload['name']
+            if name in self.member_ids_by_name:
+                return self.members_by_id[self.member_ids_by_name[name]]
+            member = {'id': str(uuid.uuid4()), 'name': name}
+            if payload.get('exclude'):
+                member['exclude'] = self._exclusion_list(payload['exclude'])
+            self.insert_member(data, member)
+            self._rebalance()
+            self.save(data, sync)
+            return member
+
+    # Tasks keep pointing at the id, so only the member record changes
+    def rename_member(self, payload, sync=False):
+        with self.store.lock:
+            data = self.load()
+            member = self.members_by_id[self.member_id(payload['member_id'], required=True)]
+            name = payload['name']
+            if self.member_ids_by_name.get(name, member['id']) != member['id']:
+                raise UnknownReference('member name %r already taken' % name)
+            del self.member_ids_by_name[member['name']]
+            member['name'] = name
+            self.member_ids_by_name[name] = member['id']
+            self._touch_member_rooms(member['id'])
+            self.save(data, sync)
+            return member
+
+    def delete_member(self, payload, sync=False):
+        with self.store.lock:
+            data = self.load()
+            member_id = self.member_id(payload['member_id'], required=True)
+            member = self.members_by_id.pop(member_id)
+            del self.member_ids_by_name[member['name']]
+            data['members'].remove(member)
+            self._touch_member_rooms(member_id)
+            self.balancer.remove_member(member_id)
+            self.exclusions.pop(member_id, None)
+            for room_id, task_id in self.assignees.tasks_for(member_id):
+                task = self.tasks_by_id[task_id][1]
+                # Auto tasks go to whoever is lightest now; the rest wait for someone to take them
+                if not (task.get('auto') and self.place_task(room_id, task)):
+                    self.assign_task(room_id, task, None)
+            self._rebalance()
+            for room in data['rooms']:
+                if room.get('assigned_to') == member_id:
+                    room['assigned_to'] = None
+                    self.touch_room(room['id'])
+            self.save(data, sync)
+            return member
+
+    def set_exclusions(self, payload, sync=False):
+        """Sets the rooms and tasks a member never gets automatically, and moves their auto tasks off them."""
+        with self.store.lock:
+            data = self.load()
+            member_id = self.member_id(payload['member_id'], required=True)
+            member = self.members_by_id[member_id]
+            exclude = self._exclusion_list(payload['exclude'])
+            if exclude:
+                member['exclude'] = exclude
+                self.exclusions[member_id] = set(exclude)
+            else:
+                member.pop('exclude', None)
+                self.exclusions.pop(member_id, None)
+            for task_id in list(self.balancer.auto_tasks(member_id)):
+                if self.excluded(member_id, task_id):
+                    room_id, task = self.tasks_by_id[task_id]
+                    if not self.place_task(room_id, task, avoid=member_id):
+                        self.assign_task(room_id, task, None)
+                        self.touch_room(room_id)
+            self._rebalance()
+            self.save(data, sync)
+            return member
+
+    def auto_assign(self, payload, sync=False):
+        """Hands each selected repeating task to the member with the least weekly load.
+
+        The selector (see select_tasks) defaults to the unassigned tasks.
+        Heavier tasks are placed first, which keeps the loads close. Returns
+        how many tasks changed hands.
+        """
+        with self.store.lock:
+            data = self.load()
+            tasks = [(room_id, task) for room_id, task in self.select_tasks(payload.get('select', {'assigned_to': ''}))
+                     if recurs(task)]
+            tasks.sort(key=lambda item: -weekly_load(item[1]))
+            affected = 0
+            for room_id, task in tasks:
+                # Off its holder's load first, so they can keep it if they are still the lightest
+                self.balancer.remove(task['id'])
+                if self.place_task(room_id, task):
+                    affected += 1
+                else:
+                    self.refresh_due(task)
+            if tasks:
+                self.save(data, sync)
+            return affected
+
+    def rebalance(self, payload, sync=False):
+        """Moves auto tasks from the heaviest members to the lightest; returns how many moved."""
+        with self.store.lock:
+            data = self.load()
+            moved = self._rebalance(payload.get('limit'))
+            if moved:
+                self.save(data, sync)
+            return moved
+
+    def _rebalance(self, limit=None):
+        moves = self.balancer.moves(self.excluded, limit)
+        for task_id, _, member_id in moves:
+            room_id, task = self.tasks_by_id[task_id]
+            self.assign_task(room_id, task, member_id, auto=True)
+            self.touch_room(room_id)
+        return len(moves)
+
+    # Room and task ids to exclude, checked and without repeats
+    def _exclusion_list(self, ids):
+        for item_id in ids:
+            if item_id not in self.rooms_by_id and item_id not in self.tasks_by_id:
+                raise UnknownReference('room or task %r' % (item_id,))
+        return sorted(set(ids))
+
+    # Cached room fragments carry display names, so drop the ones showing this member
+    def _touch_member_rooms(self, member_id):
+        room_ids = {room_id for room_id, _ in self.assignees.tasks_for(member_id)}
+        room_ids.update(room_id for room_id, room in self.rooms_by_id.items() if room.get('assigned_to') == member_id)
+        for room_id in room_ids:
+            self.touch_room(room_id)
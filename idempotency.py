@@ -0,0 +1,241 @@
+"""Replays of mutating requests that carry an ``Idempotency-Key`` header.
+
+A client that retries a POST it never heard back from sends the same key
+again. The first request with a key runs and its response is remembered;
+a retry gets that response back without the mutation running a second
+time, so a completion is recorded once and a toggle flips once. Retries
+that arrive while the first request is still running wait for it.
+
+Keys are kept per household, for TTL seconds and MAX_ENTRIES at most
+(oldest dropped first). A key sent again with a different request (another
+route or body) is refused. A streamed body is digested as the request
+reads it and stored with the response, so a retry's body is digested in
+turn and compared before anything is replayed. Failed requests, ones that
+raise rather than return a response, are not remembered and run again on
+retry.
+
+The cache lives in the process. Under serve.py with several workers a retry
+can land on a worker that never saw the key, so there each worker refuses
+keyed requests outright (``FlaskIdempotency.refuse``) rather than risk
+running them twice.
+"""
+import collections
+import hashlib
+import os
+import threading
+import time
+from concurrent.futures import Future
+from functools import wraps
+
+from flask import current_app, jsonify, request
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+TTL = float(os.environ.get('CHORES_IDEMPOTENCY_TTL', str(24 * 60 * 60)))
+MAX_ENTRIES = int(os.environ.get('CHORES_IDEMPOTENCY_ENTRIES', '10000'))
+CONFLICT = '%s was already used for a different request' % HEADER
+
+
+class IdempotencyConflict(ValueError):
+    """A key reused for a different request."""
+
+
+def parse_key(value):
+    """The key in a header value, None without one; ValueError if it is malformed."""
+    if value is None:
+        return None
+    if not 0 < len(value) <= MAX_KEY_LENGTH or not value.isprintable():
+        raise ValueError('%s must be 1 to %d printable characters' % (HEADER, MAX_KEY_LENGTH))
+    return value
+
+
+def fingerprint(*parts):
+    """A digest of the parts (str or bytes) that make up a request."""
+    digest = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, str):
+            part = part.encode()
+        digest.update(b'%d:' % len(part))
+        digest.update(part)
+    return digest.hexdigest()
+
+
+class StreamDigest:
+    """Wraps a body stream and digests everything read from it."""
+
+    def __init__(self, stream, chunk_size=64 * 1024):
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self._digest = hashlib.sha256()
+
+    def read(self, size=-1):
+        data = self.stream.read(size)
+        self._digest.update(data)
+        return data
+
+    def finish(self):
+        """Digests whatever is left unread and returns the digest of the whole body."""
+        while self.read(self.chunk_size):
+            pass
+        return self._digest.hexdigest()
+
+
+class IdempotencyCache:
+    """Results by key for ``ttl`` seconds, at most ``max_entries`` of them.
+
+    ``run(key, fingerprint, fn)`` does it all for threaded callers. Async
+    ones step through it themselves: ``lookup`` answers with the stored
+    result, a future to wait on before looking again, or the go-ahead to
+    run, after which they ``store`` the result or ``abandon`` the key.
+    """
+
+    def __init__(self, max_entries=MAX_ENTRIES, ttl=TTL, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.clock = clock
+        self._lock = threading.Lock()
+        # key -> (expires at, fingerprint, result), oldest first
+        self._entries = collections.OrderedDict()
+        # key -> (fingerprint, future done when it finishes) for requests still running
+        self._running = {}
+        self.executions = 0
+        self.replays = 0
+        self.conflicts = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def run(self, key, fingerprint, fn):
+        """``(result, replayed)``: ``fn()``'s result, run only if ``key`` has none yet."""
+        while True:
+            state, value = self.lookup(key, fingerprint)
+            if state != 'wait':
+                break
+            value.result()
+        if state == 'replay':
+            return value, True
+        try:
+            result = fn()
+        except BaseException:
+            self.abandon(key)
+            raise
+        self.store(key, result)
+        return result, False
+
+    def lookup(self, key, fingerprint):
+        """``('replay', result)``, ``('wait', future)`` or ``('run', None)`` for ``key``.
+
+        Raises IdempotencyConflict if ``key`` belongs to a request with
+        another fingerprint.
+        """
+        with self._lock:
+            self._expire()
+            entry = self._entries.get(key)
+            running = self._running.get(key)
+            if entry is None and running is None:
+                self._running[key] = (fingerprint, Future())
+                self.executions += 1
+                return 'run', None
+            if (entry[1] if entry is not None else running[0]) != fingerprint:
+                self.conflicts += 1
+                raise IdempotencyConflict(CONFLICT)
+            if entry is not None:
+                self.replays += 1
+                return 'replay', entry[2]
+            return 'wait', running[1]
+
+    def store(self, key, result):
+        with self._lock:
+            fingerprint, done = self._running.pop(key)
+            self._entries[key] = (self.clock() + self.ttl, fingerprint, result)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        done.set_result(None)
+
+    def abandon(self, key):
+        """Forgets a run that failed; requests waiting on it look again and one of them runs."""
+        with self._lock:
+            _, done = self._running.pop(key)
+        done.set_result(None)
+
+    def stats(self):
+        return {
+            'entries': len(self._entries),
+            'executions': self.executions,
+            'replays': self.replays,
+            'conflicts': self.conflicts,
+        }
+
+    # Entries go in in expiry order, so expired ones are always at the front
+    def _expire(self):
+        now = self.clock()
+        while self._entries:
+            key, entry = next(iter(self._entries.items()))
+            if entry[0] > now:
+                return
+            del self._entries[key]
+
+
+class FlaskIdempotency:
+    """Honours ``Idempotency-Key`` on a Flask app's POST-only routes.
+
+    ``scope()`` names what keys are kept apart by (the request's household).
+    Endpoints in ``streamed`` read their body as a stream, so it is digested
+    as they read it rather than up front. Call ``mount()`` after every route
+    has been registered.
+    """
+
+    def __init__(self, app, cache, scope, streamed=()):
+        self.app = app
+        self.cache = cache
+        self.scope = scope
+        self.streamed = set(streamed)
+        self.refused = None
+
+    def refuse(self, reason):
+        """Answers every request that carries a key with a 400 giving ``reason``."""
+        self.refused = reason
+
+    def mount(self):
+        for rule in list(self.app.url_map.iter_rules()):
+            if rule.methods - {'HEAD', 'OPTIONS'} == {'POST'}:
+                view = self.app.view_functions[rule.endpoint]
+                if not getattr(view, 'idempotent', False):
+                    self.app.view_functions[rule.endpoint] = self._wrap(view, rule.endpoint in self.streamed)
+
+    def _wrap(self, view, streamed):
+        @wraps(view)
+        def idempotent_view(**kwargs):
+            try:
+                key = parse_key(request.headers.get(HEADER))
+            except ValueError as e:
+                return jsonify({'status': 'error', 'error': str(e)}), 400
+            if key is None:
+                return view(**kwargs)
+            if self.refused:
+                return jsonify({'status': 'error', 'error': self.refused}), 400
+
+            if streamed:
+                request.stream = stream = StreamDigest(request.stream)
+
+            def respond():
+                response = current_app.make_response(view(**kwargs))
+                digest = stream.finish() if streamed else None
+                return response.status_code, list(response.headers.items()), response.get_data(), digest
+
+            body = b'' if streamed else request.get_data(cache=True)
+            try:
+                (status, headers, data, digest), replayed = self.cache.run(
+                    (self.scope(), key), fingerprint(request.path, request.query_string, body), respond)
+                if replayed and digest is not None and stream.finish() != digest:
+                    self.cache.conflicts += 1
+                    raise IdempotencyConflict(CONFLICT)
+            except IdempotencyConflict as e:
+                return jsonify({'status': 'error', 'error': str(e)}), 422
+            response = current_app.response_class(data, status, headers)
+            if replayed:
+                response.headers['Idempotent-Replayed'] = 'true'
+            return response
+
+        idempotent_view.idempotent = True
+        return idempotent_view
@@ -0,0 +1,197 @@
+"""Secondary indexes over chore documents."""
+import bisect
+import itertools
+import math
+from collections import defaultdict
+
+# Bucket for tasks nobody is assigned to
+UNASSIGNED = None
+
+
+class AssigneeIndex:
+    """Maps each assignee to the set of task keys assigned to them.
+
+    Task keys are whatever the caller uses to find a task again, e.g.
+    ``(room_id, task_id)``. Empty assignees ('' or None) share the
+    ``UNASSIGNED`` bucket. Every operation is O(1) in the number of tasks.
+    """
+
+    def __init__(self):
+        self._tasks = defaultdict(set)
+        self._assignee = {}
+
+    def rebuild(self, assignments):
+        """Replaces the index with ``(task_key, assignee)`` pairs."""
+        self._tasks.clear()
+        self._assignee.clear()
+        for task_key, assignee in assignments:
+            self.assign(task_key, assignee)
+
+    def assign(self, task_key, assignee):
+        assignee = assignee or UNASSIGNED
+        self.remove(task_key)
+        self._assignee[task_key] = assignee
+        self._tasks[assignee].add(task_key)
+
+    def remove(self, task_key):
+        if task_key not in self._assignee:
+            return
+        previous = self._assignee.pop(task_key)
+        bucket = self._tasks[previous]
+        bucket.discard(task_key)
+        if not bucket:
+            del self._tasks[previous]
+
+    def tasks_for(self, assignee):
+        """Returns a snapshot of the task keys assigned to ``assignee``."""
+        return set(self._tasks.get(assignee or UNASSIGNED, ()))
+
+    def count(self, assignee):
+        return len(self._tasks.get(assignee or UNASSIGNED, ()))
+
+    def assignee_of(self, task_key):
+        return self._assignee.get(task_key)
+
+    def assignees(self):
+        return [assignee for assignee in self._tasks if assignee is not UNASSIGNED]
+
+    def __len__(self):
+        return len(self._assignee)
+
+
+# Task states counted by StatusCounters
+DONE = 'done'
+DUE = 'due'
+OVERDUE = 'overdue'
+
+
+class StatusCounters:
+    """Per-room and per-assignee task counts by due state, kept up to date incrementally.
+
+    Callers ``set`` a task whenever its room, assignee or state changes and
+    ``remove`` it when it goes; reading a count never looks at the tasks.
+    Counts are reported as ``total``, ``due`` (overdue tasks included),
+    ``overdue`` and ``done``.
+    """
+
+    def __init__(self):
+        # task key -> (room_id, assignee, state)
+        self._tasks = {}
+        self._rooms = {}
+        self._assignees = {}
+
+    def set(self, task_key, room_id, assignee, state):
+        self.remove(task_key)
+        assignee = assignee or UNASSIGNED
+        self._tasks[task_key] = (room_id, assignee, state)
+        self._add(self._rooms, room_id, state, 1)
+        self._add(self._assignees, assignee, state, 1)
+
+    def assign(self, task_key, assignee):
+        room_id, _, state = self._tasks[task_key]
+        self.set(task_key, room_id, assignee, state)
+
+    def remove(self, task_key):
+        entry = self._tasks.pop(task_key, None)
+        if entry is not None:
+            room_id, assignee, state = entry
+            self._add(self._rooms, room_id, state, -1)
+            self._add(self._assignees, assignee, state, -1)
+
+    def state_of(self, task_key):
+        entry = self._tasks.get(task_key)
+        return entry[2] if entry else None
+
+    def room(self, room_id):
+        return self._report(self._rooms.get(room_id))
+
+    def assignee(self, assignee):
+        return self._report(self._assignees.get(assignee or UNASSIGNED))
+
+    def _add(self, table, key, state, delta):
+        counts = table.get(key)
+        if counts is None:
+            counts = table[key] = {DONE: 0, DUE: 0, OVERDUE: 0}
+        counts[state] += delta
+        if not any(counts.values()):
+            del table[key]
+
+    @staticmethod
+    def _report(counts):
+        counts = counts or {DONE: 0, DUE: 0, OVERDUE: 0}
+        return {
+            'total': counts[DONE] + counts[DUE] + counts[OVERDUE],
+            'due': counts[DUE] + counts[OVERDUE],
+            'overdue': counts[OVERDUE],
+            'done': counts[DONE],
+        }
+
+
+class DueIndex:
+    """Keys ordered by a time (seconds since the epoch), e.g. task ids by next due time.
+
+    ``set`` and ``remove`` are O(1): entries are appended and superseded ones
+    left in place, to be skipped on read. ``until(t)`` sorts whatever was
+    appended out of order (cheap for a nearly sorted list), drops superseded
+    entries once they outnumber the live ones, and slices out every key due
+    by ``t`` without looking at the rest. Keys due at the same time come in
+    key order.
+    """
+
+    def __init__(self):
+        # key -> (time, serial) of its live entry
+        self._times = {}
+        # (time, key, serial), sorted unless _unsorted
+        self._entries = []
+        self._serials = itertools.count()
+        self._unsorted = False
+        self._stale = 0
+
+    def __len__(self):
+        return len(self._times)
+
+    def set(self, key, when):
+        live = self._times.get(key)
+        if live is not None:
+            if live[0] == when:
+                return
+            self._stale += 1
+        entry = (when, key, next(self._serials))
+        self._times[key] = (when, entry[2])
+        if self._entries and entry < self._entries[-1]:
+            self._unsorted = True
+        self._entries.append(entry)
+
+    def remove(self, key):
+        if self._times.pop(key, None) is not None:
+            self._stale += 1
+
+    def time_of(self, key):
+        live = self._times.get(key)
+        return live[0] if live else None
+
+    def until(self, when):
+        """Returns ``(time, key)`` for every key with a time up to ``when``, earliest first."""
+        end = self._end(when)
+        return [entry[:2] for entry in self._entries[:end] if self._times.get(entry[1]) == (entry[0], entry[2])]
+
+    def iter_until(self, when):
+        """``until(when)`` one entry at a time, for callers that may stop early."""
+        times = self._times
+        for entry in itertools.islice(self._entries, self._end(when)):
+            if times.get(entry[1]) == (entry[0], entry[2]):
+                yield entry[:2]
+
+    def count_until(self, when):
+        """An upper bound on ``len(until(when))``, without collecting the keys."""
+        return min(self._end(when), len(self._times))
+
+    # Position in the tidied, sorted entries just past ``when``
+    def _end(self, when):
+        if self._stale > len(self._times):
+            self._entries = [entry for entry in self._entries if self._times.get(entry[1]) == (entry[0], entry[2])]
+            self._stale = 0
+        if self._unsorted:
+            self._entries.sort()
+            self._unsorted = False
+        return bisect.bisect_left(self._entries, (math.nextafter(when, math.inf),))
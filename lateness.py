@@ -0,0 +1,190 @@
+"""How late chores get done, as streaming quantile sketches.
+
+Every completion after a task's first is measured against the due time
+the completion before it set (see ``household.completion_lateness``):
+seconds after it, negative when done early. LatenessStats keeps a
+QuantileSketch per room and per member plus one overall, and each task's
+own measurements in a compact array. A new completion adds one value;
+any other change to a task (a completion taken back, a history entry
+deleted, a new frequency) re-measures that task alone, and a reassignment
+moves its values between member sketches. Loading a household measures
+every task in the same single pass that builds its other indexes.
+
+Completions count towards the task's current room and assignee.
+"""
+import math
+from array import array
+
+# Relative accuracy of reported quantiles
+ACCURACY = 0.01
+# Values closer to zero than this (in seconds) count as exactly on time
+MIN_VALUE = 1.0
+QUANTILES = (0.5, 0.9, 0.99)
+
+
+class QuantileSketch:
+    """Quantiles of a stream of values to within ``accuracy`` of their size (a DDSketch).
+
+    Values go into logarithmically sized buckets, one set for positive and
+    one for negative values, with a bucket of their own for values within
+    MIN_VALUE of zero. Only bucket counts are kept, so sketches with the
+    same accuracy merge bucket by bucket, and a value can be taken out
+    again exactly as it went in.
+    """
+
+    def __init__(self, accuracy=ACCURACY):
+        self.accuracy = accuracy
+        self._gamma = (1 + accuracy) / (1 - accuracy)
+        self._log_gamma = math.log(self._gamma)
+        # bucket index -> count
+        self.positive = {}
+        self.negative = {}
+        self.zero = 0
+        self.count = 0
+        self.total = 0.0
+
+    @classmethod
+    def of(cls, values, accuracy=ACCURACY):
+        sketch = cls(accuracy)
+        for value in values:
+            sketch.add(value)
+        return sketch
+
+    def add(self, value, weight=1):
+        if abs(value) < MIN_VALUE:
+            self.zero += weight
+        else:
+            buckets = self.positive if value > 0 else self.negative
+            key = math.ceil(math.log(abs(value)) / self._log_gamma)
+            count = buckets.get(key, 0) + weight
+            if count:
+                buckets[key] = count
+            else:
+                del buckets[key]
+        self.count += weight
+        self.total += value * weight
+
+    def remove(self, value):
+        self.add(value, -1)
+
+    def merge(self, other, sign=1):
+        """Adds ``other``'s values to this sketch, or takes them out again with ``sign=-1``."""
+        if other.accuracy != self.accuracy:
+            raise ValueError('cannot merge sketches of different accuracy')
+        for mine, theirs in ((self.positive, other.positive), (self.negative, other.negative)):
+            for key, count in theirs.items():
+                count = mine.get(key, 0) + sign * count
+                if count:
+                    mine[key] = count
+                else:
+                    del mine[key]
+        self.zero += sign * other.zero
+        self.count += sign * other.count
+        self.total += sign * other.total
+
+    def quantile(self, q):
+        """The value at quantile ``q`` (0 to 1), None if the sketch is empty."""
+        if self.count <= 0:
+            return None
+        rank = q * (self.count - 1)
+        seen = 0
+        for key in sorted(self.negative, reverse=True):
+            seen += self.negative[key]
+            if seen > rank:
+                return -self._value(key)
+        seen += self.zero
+        if seen > rank:
+            return 0.0
+        for key in sorted(self.positive):
+            seen += self.positive[key]
+            if seen > rank:
+                return self._value(key)
+        return self._value(max(self.positive)) if self.positive else 0.0
+
+    def summary(self, quantiles=QUANTILES, scale=1.0):
+        """Count, mean and quantiles, with values divided by ``scale``."""
+        summary = {'count': self.count, 'mean': round(self.total / self.count / scale, 2) if self.count > 0 else None}
+        for q in quantiles:
+            value = self.quantile(q)
+            summary['p%g' % (q * 100)] = None if value is None else round(value / scale, 2)
+        return summary
+
+    def _value(self, key):
+        # Midpoint of the bucket, within ``accuracy`` of anything in it
+        return 2 * self._gamma ** key / (self._gamma + 1)
+
+
+class LatenessStats:
+    """Lateness sketches per room and member, kept up to date task by task.
+
+    ``update(task_id, room_id, member_id, task)`` is called whenever a task
+    may have changed and ``remove(task_id)`` when it goes. ``measure(task,
+    start)`` returns the lateness of the task's completions from index
+    ``start`` on.
+    """
+
+    def __init__(self, measure):
+        self.measure = measure
+        self.overall = QuantileSketch()
+        self.rooms = {}
+        self.members = {}
+        # task id -> (room id, member id, history key, lateness values)
+        self._tasks = {}
+
+    def update(self, task_id, room_id, member_id, task):
+        history = task.get('history') or ()
+        key = (len(history), history[-1] if history else None, task.get('frequency_days'), task.get('repeat'))
+        entry = self._tasks.get(task_id)
+        if entry is None or entry[0] != room_id:
+            self.remove(task_id)
+            values = array('d', self.measure(task, 0))
+            self._add(room_id, member_id, values)
+        else:
+            _, old_member, old_key, values = entry
+            if old_member != member_id:
+                moved = QuantileSketch.of(values)
+                self._member(old_member).merge(moved, -1)
+                self._member(member_id).merge(moved)
+            if key == old_key:
+                pass
+            elif key[2:] == old_key[2:] and key[0] == old_key[0] + 1 and (not old_key[0] or history[-2] == old_key[1]):
+                # One completion added at the end
+                added = self.measure(task, key[0] - 1)
+                values.extend(added)
+                self._add(room_id, member_id, added)
+            else:
+                self._add(room_id, member_id, values, -1)
+                values = array('d', self.measure(task, 0))
+                self._add(room_id, member_id, values)
+        self._tasks[task_id] = (room_id, member_id, key, values)
+
+    def remove(self, task_id):
+        entry = self._tasks.pop(task_id, None)
+        if entry is not None:
+            self._add(entry[0], entry[1], entry[3], -1)
+
+    def task(self, task_id):
+        """A sketch of one task's lateness, built from its measurements."""
+        entry = self._tasks.get(task_id)
+        return QuantileSketch.of(entry[3] if entry else ())
+
+    def room(self, room_id):
+        return self.rooms.get(room_id) or QuantileSketch()
+
+    def member(self, member_id):
+        return self.members.get(member_id) or QuantileSketch()
+
+    def _member(self, member_id):
+        if member_id not in self.members:
+            self.members[member_id] = QuantileSketch()
+        return self.members[member_id]
+
+    def _add(self, room_id, member_id, values, weight=1):
+        if not values:
+            return
+        if room_id not in self.rooms:
+            self.rooms[room_id] = QuantileSketch()
+        sketches = (self.overall, self.rooms[room_id], self._member(member_id))
+        for value in values:
+            for sketch in sketches:
+                sketch.add(value, weight)
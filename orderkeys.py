@@ -0,0 +1,57 @@
+"""Fractional order keys: strings that sort in list order and can always be split.
+
+A key is the fractional part of a base-62 number written without trailing
+zeros, so ``'V'`` is 0.5. ``key_between(a, b)`` returns a key that sorts
+strictly between two others, which lets a list item move by changing its own
+key only. Keys grow by about one character per repeated split in the same
+gap; ``spread_keys`` hands out fresh short keys when that gets out of hand.
+"""
+
+DIGITS = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz'
+BASE = len(DIGITS)
+_VALUE = {digit: value for value, digit in enumerate(DIGITS)}
+
+
+def key_between(a, b):
+    """Returns a key with ``a < key < b``; ``None`` means no bound on that side."""
+    a = a or ''
+    if b is not None and a >= b:
+        raise ValueError('%r is not below %r' % (a, b))
+    if a.endswith('0') or (b or '').endswith('0'):
+        raise ValueError('order keys must not end in 0')
+    return _midpoint(a, b)
+
+
+def _midpoint(a, b):
+    if b is not None:
+        # Skip the digits both keys share, padding a with zeros
+        n = 0
+        while n < len(b) and (a[n] if n < len(a) else '0') == b[n]:
+            n += 1
+        if n:
+            return b[:n] + _midpoint(a[n:], b[n:])
+    low = _VALUE[a[0]] if a else 0
+    high = _VALUE[b[0]] if b is not None else BASE
+    if high - low > 1:
+        return DIGITS[(low + high) // 2]
+    # Adjacent first digits
+    if b is not None and len(b) > 1:
+        return b[0]
+    return DIGITS[low] + _midpoint(a[1:], None)
+
+
+def spread_keys(count):
+    """Returns ``count`` short, evenly spaced keys in ascending order."""
+    width = 1
+    while BASE ** width <= count:
+        width += 1
+    step = BASE ** width // (count + 1)
+    return [_encode((i + 1) * step, width) for i in range(count)]
+
+
+def _encode(value, width):
+    digits = []
+    for _ in range(width):
+        value, digit = divmod(value, BASE)
+        digits.append(DIGITS[digit])
+    return ''.join(reversed(digits)).rstrip('0')
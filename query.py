@@ -0,0 +1,771 @@
+"""Task queries: a small filter language and its JSON form, compiled into index-using plans.
+
+    room in (Kitchen, Bath) and due within 2 days and frequency <= 7 sort by overdue desc limit 20
+
+Conditions combine with ``and``, ``or``, ``not`` and parentheses:
+
+    room = Kitchen, room in (Kitchen, "Living Room"), room not in (...)
+    assigned_to = Alice (or member, person), assigned_to in (Alice, Bob)
+    name = "Do dishes", name contains vac (or name ~ vac; matched as /search does)
+    frequency <= 7 (or weekly, "3 days"), effort > 2; =, !=, <, <=, >, >= and in
+    due within 2 days (or hours, weeks)
+    due, overdue, done, auto, unassigned
+
+Room and member values are names or ids; unquoted values run up to the next
+keyword, comma or parenthesis. A repeat rule's frequency is the average
+number of days between its dates, and tasks without one match no frequency
+comparison. Tasks come in page order unless ``sort by`` gives name, room
+(page order), assigned_to, frequency, effort, due (next due time) or
+overdue, each optionally ``desc``; missing values sort last and ties keep
+page order.
+
+The JSON form says the same in lists::
+
+    {"where": {"and": [["room", "in", ["Kitchen", "Bath"]], ["due", "within", 2],
+                       ["frequency", "<=", 7], {"not": ["auto"]}]},
+     "sort": ["overdue desc"], "limit": 20}
+
+A query compiles once into a tree of conditions (``compile_query`` and
+``compile_spec`` cache them). Each run asks the conditions that have an
+index behind them (room tasks, the assignee index, the due set, the
+DueIndex of next due times, the trigram name index) how many tasks they
+would hand over, takes the narrowest as the source and checks only those
+tasks against the rest; an ``or`` whose branches all have a source takes
+their union. Only a query with no indexed condition in its top ``and``
+scans every task. ``plan`` in the result says what was chosen.
+"""
+import abc
+import functools
+import heapq
+import json
+import re
+
+from indexes import OVERDUE
+from recurrence import compile_rule
+from schema import parse_frequency
+from search import matches, normalize
+
+# Tasks returned when a query gives no limit, and the most it may ask for
+QUERY_LIMIT = 100
+MAX_QUERY_LIMIT = 1000
+# Compiled queries kept by compile_query and compile_spec
+CACHE_SIZE = 256
+
+FIELD_ALIASES = {'member': 'assigned_to', 'person': 'assigned_to', 'assignee': 'assigned_to', 'task': 'name'}
+FLAGS = ('due', 'overdue', 'done', 'auto', 'unassigned')
+COMPARISONS = ('=', '!=', '<', '<=', '>', '>=')
+SORT_KEYS = ('name', 'room', 'assigned_to', 'frequency', 'effort', 'due', 'overdue')
+UNITS = {'hour': 3600, 'hours': 3600, 'day': 86400, 'days': 86400, 'week': 604800, 'weeks': 604800}
+KEYWORDS = ('and', 'or', 'not', 'in', 'within', 'contains', 'sort', 'sorted', 'order', 'by', 'limit', 'asc', 'desc')
+
+_TOKEN = re.compile(r'\s*(?:"((?:[^"\\]|\\.)*)"|\'((?:[^\'\\]|\\.)*)\'|(<=|>=|!=|==|=|<|>|~|\(|\)|,)|([^\s()<>=!~,"\']+))')
+
+
+class Source:
+    """Task ids an index hands over for ``node``; ``exact`` if they all match it."""
+
+    def __init__(self, index, node, estimate, fetch, exact=True):
+        self.index = index
+        self.node = node
+        self.estimate = estimate
+        self.fetch = fetch
+        self.exact = exact
+
+
+class Node(abc.ABC):
+    """A condition: ``test`` checks one task, ``source`` offers an index for it, if any."""
+
+    def source(self, run):
+        return None
+
+    @abc.abstractmethod
+    def test(self, run, room_id, task):
+        """Whether the task matches."""
+
+
+class And(Node):
+    def __init__(self, children):
+        self.children = children
+
+    def __str__(self):
+        return ' and '.join('(%s)' % child if isinstance(child, Or) else str(child) for child in self.children)
+
+    def source(self, run):
+        sources = [source for source in (child.source(run) for child in self.children) if source is not None]
+        return min(sources, key=lambda source: source.estimate, default=None)
+
+    def test(self, run, room_id, task):
+        return all(child.test(run, room_id, task) for child in self.children)
+
+
+class Or(Node):
+    def __init__(self, children):
+        self.children = children
+
+    def __str__(self):
+        return ' or '.join(map(str, self.children))
+
+    def source(self, run):
+        sources = [child.source(run) for child in self.children]
+        if any(source is None for source in sources):
+            return None
+
+        def fetch():
+            task_ids = set()
+            for source in sources:
+                task_ids.update(source.fetch())
+            return task_ids
+        exact = all(source.exact and source.node is child for source, child in zip(sources, self.children))
+        return Source('+'.join(source.index for source in sources), self,
+                      sum(source.estimate for source in sources), fetch, exact)
+
+    def test(self, run, room_id, task):
+        return any(child.test(run, room_id, task) for child in self.children)
+
+
+class Not(Node):
+    def __init__(self, child):
+        self.child = child
+
+    def __str__(self):
+        return 'not (%s)' % self.child if isinstance(self.child, (And, Or)) else 'not %s' % self.child
+
+    def test(self, run, room_id, task):
+        return not self.child.test(run, room_id, task)
+
+
+class RoomIs(Node):
+    def __init__(self, values, negate=False):
+        self.values = values
+        self.negate = negate
+
+    def __str__(self):
+        return 'room %s' % _membership(self.values, self.negate)
+
+    def source(self, run):
+        if self.negate:
+            return None
+        rooms = [run.household.rooms_by_id[room_id] for room_id in run.rooms(self.values)]
+        return Source('room', self, sum(len(room['tasks']) for room in rooms),
+                      lambda: [task['id'] for room in rooms for task in room['tasks']])
+
+    def test(self, run, room_id, task):
+        return (room_id in run.rooms(self.values)) != self.negate
+
+
+class MemberIs(Node):
+    def __init__(self, values, negate=False):
+        self.values = values
+        self.negate = negate
+
+    def __str__(self):
+        if self.values == ('',) and not self.negate:
+            return 'unassigned'
+        return 'assigned_to %s' % _membership(self.values, self.negate)
+
+    def source(self, run):
+        if self.negate:
+            return None
+        assignees = run.household.assignees
+        members = run.members(self.values)
+        return Source('assignee', self, sum(assignees.count(member) for member in members),
+                      lambda: [task_id for member in members for _, task_id in assignees.tasks_for(member)])
+
+    def test(self, run, room_id, task):
+        return (task.get('assigned_to') in run.members(self.values)) != self.negate
+
+
+class NameIs(Node):
+    def __init__(self, op, value):
+        self.op = op
+        self.value = value
+        self.folded = value.casefold()
+
+    def __str__(self):
+        return 'name %s %s' % (self.op, _quote(self.value))
+
+    def source(self, run):
+        if self.op == '!=' or not normalize(self.value):
+            return None
+        keys = run.household.search_index.matching(self.value)
+        task_ids = [key for kind, key in keys if kind == 'task']
+        return Source('name', self, len(task_ids), lambda: task_ids, exact=self.op == 'contains')
+
+    def test(self, run, room_id, task):
+        if self.op == 'contains':
+            return matches(self.value, task['name'])
+        return (task['name'].casefold() == self.folded) != (self.op == '!=')
+
+
+class Compare(Node):
+    def __init__(self, field, op, values):
+        self.field = field
+        self.op = op
+        self.values = values
+
+    def __str__(self):
+        if self.op == 'in':
+            return '%s in (%s)' % (self.field, ', '.join('%g' % value for value in self.values))
+        return '%s %s %g' % (self.field, self.op, self.values[0])
+
+    def test(self, run, room_id, task):
+        value = _number(self.field, task)
+        if value is None:
+            return False
+        if self.op == 'in':
+            return value in self.values
+        return _COMPARE[self.op](value, self.values[0])
+
+
+class Flag(Node):
+    def __init__(self, name):
+        self.name = name
+
+    def __str__(self):
+        return self.name
+
+    def source(self, run):
+        due = run.household.due_task_ids
+        if self.name == 'due':
+            return Source('due', self, len(due), lambda: due)
+        if self.name == 'overdue':
+            return Source('due', self, len(due), lambda: due, exact=False)
+        return None
+
+    def test(self, run, room_id, task):
+        household = run.household
+        if self.name == 'due':
+            return task['id'] in household.due_task_ids
+        if self.name == 'overdue':
+            return household.counters.state_of(task['id']) == OVERDUE
+        if self.name == 'done':
+            return task['id'] not in household.due_task_ids
+        return bool(task.get('auto'))
+
+
+class DueWithin(Node):
+    def __init__(self, seconds):
+        self.seconds = seconds
+
+    def __str__(self):
+        if self.seconds % UNITS['day']:
+            return 'due within %g hours' % (self.seconds / UNITS['hour'])
+        return 'due within %g days' % (self.seconds / UNITS['day'])
+
+    def source(self, run):
+        index = run.household.next_due_index
+        until = run.timestamp + self.seconds
+        return Source('next_due', self, index.count_until(until),
+                      lambda: [task_id for _, task_id in index.until(until)])
+
+    def test(self, run, room_id, task):
+        when = run.household.next_due_index.time_of(task['id'])
+        return when is not None and when <= run.timestamp + self.seconds
+
+
+class Query:
+    """A compiled query: ``run(household, now)`` returns ``(matches, total, plan)``."""
+
+    def __init__(self, where, sort, limit):
+        self.where = where
+        self.sort = sort
+        self.limit = limit
+
+    def __str__(self):
+        parts = [str(self.where)] if self.where is not None else []
+        if self.sort:
+            parts.append('sort by ' + ', '.join(key + (' desc' if descending else '') for key, descending in self.sort))
+        parts.append('limit %d' % self.limit)
+        return ' '.join(parts)
+
+    def run(self, household, now):
+        run = _Run(household, now)
+        where = self.where
+        source = where.source(run) if where is not None else None
+        if source is None:
+            candidates = household.tasks_by_id.values()
+            filters = [] if where is None else where.children if isinstance(where, And) else [where]
+            plan_source = {'index': None, 'scan': len(household.tasks_by_id)}
+        else:
+            tasks_by_id = household.tasks_by_id
+            candidates = [tasks_by_id[task_id] for task_id in source.fetch() if task_id in tasks_by_id]
+            children = where.children if isinstance(where, And) else [where]
+            filters = [child for child in children if not (child is source.node and source.exact)]
+            plan_source = {'index': source.index, 'condition': str(source.node), 'estimate': source.estimate}
+        if len(filters) == 1:
+            candidates_seen = len(candidates)
+            test = filters[0].test
+            matched = [(room_id, task) for room_id, task in candidates if test(run, room_id, task)]
+        elif filters:
+            candidates_seen = len(candidates)
+            matched = [(room_id, task) for room_id, task in candidates
+                       if all(node.test(run, room_id, task) for node in filters)]
+        else:
+            matched = list(candidates)
+            candidates_seen = len(matched)
+        total = len(matched)
+        matched = _first(run, matched, self.sort, self.limit)
+        plan = {
+            'query': str(self),
+            'source': plan_source,
+            'filters': [str(node) for node in filters],
+            'examined': candidates_seen,
+            'matched': total,
+        }
+        return matched, total, plan
+
+
+class _Run:
+    """What one run of a query looks up, resolved once."""
+
+    def __init__(self, household, now):
+        self.household = household
+        self.now = now
+        self.timestamp = now.timestamp()
+        self._rooms = {}
+        self._members = {}
+        self._room_ids_by_name = None
+        # room id -> {task id: its place in the room}
+        self._places = {}
+
+    # Ids of the rooms named by ``values`` (ids or names, any case)
+    def rooms(self, values):
+        if values not in self._rooms:
+            if self._room_ids_by_name is None:
+                self._room_ids_by_name = {}
+                for room_id, room in self.household.rooms_by_id.items():
+                    self._room_ids_by_name.setdefault(room['name'].casefold(), set()).add(room_id)
+            rooms = set()
+            for value in values:
+                if value in self.household.rooms_by_id:
+                    rooms.add(value)
+                else:
+                    rooms.update(self._room_ids_by_name.get(value.casefold(), ()))
+            self._rooms[values] = rooms
+        return self._rooms[values]
+
+    # Where a task comes on the page: its room's order key, then its place in the room
+    def position(self, item):
+        room_id, task = item
+        places = self._places.get(room_id)
+        if places is None:
+            places = self._places[room_id] = {
+                task['id']: place for place, task in enumerate(self.household.rooms_by_id[room_id]['tasks'])}
+        return self.household.rooms_by_id[room_id]['order'], places[task['id']]
+
+    def members(self, values):
+        if values not in self._members:
+            self._members[values] = {self.household.member_id(value) for value in values}
+        return self._members[values]
+
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def compile_query(text):
+    """Compiles the text form (see the module docstring); ValueError if it does not parse."""
+    if not isinstance(text, str):
+        raise ValueError('query must be a string')
+    return _Parser(text).query()
+
+
+def compile_spec(spec):
+    """Compiles the JSON form, or ``{"q": text}``; ValueError if it is malformed."""
+    if not isinstance(spec, dict):
+        raise ValueError('query spec must be an object')
+    if 'q' in spec:
+        return compile_query(spec['q'])
+    return _compile_spec(json.dumps(spec, sort_keys=True))
+
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def _compile_spec(encoded):
+    spec = json.loads(encoded)
+    unknown = set(spec) - {'where', 'sort', 'limit'}
+    if unknown:
+        raise ValueError('unknown query spec keys: %s' % ', '.join(sorted(unknown)))
+    where = _spec_node(spec['where']) if spec.get('where') else None
+    sort = []
+    for item in spec.get('sort') or []:
+        key, *direction = item.split() if isinstance(item, str) else item
+        sort.append(_sort_key(key, direction[0] if direction else 'asc'))
+    return Query(where, sort, _limit(spec.get('limit', QUERY_LIMIT)))
+
+
+def _spec_node(spec):
+    if isinstance(spec, dict):
+        if len(spec) != 1:
+            raise ValueError('a condition object needs exactly one of and, or, not')
+        (op, value), = spec.items()
+        if op == 'not':
+            return Not(_spec_node(value))
+        if op in ('and', 'or') and isinstance(value, list) and value:
+            children = [_spec_node(child) for child in value]
+            return children[0] if len(children) == 1 else (And if op == 'and' else Or)(children)
+        raise ValueError('bad condition %r' % (spec,))
+    if isinstance(spec, list) and spec and all(isinstance(child, (list, dict)) for child in spec):
+        # A list of conditions all of which must hold
+        return _spec_node({'and': spec})
+    if isinstance(spec, list) and spec and isinstance(spec[0], str):
+        if len(spec) == 1:
+            return _condition(spec[0])
+        if len(spec) == 3 and isinstance(spec[1], str):
+            return _condition(spec[0], spec[1].lower(), spec[2])
+    raise ValueError('bad condition %r' % (spec,))
+
+
+# The node for one condition, from either form
+def _condition(field, op=None, value=None):
+    field = FIELD_ALIASES.get(field.lower(), field.lower())
+    if op is None:
+        if field == 'unassigned':
+            return MemberIs(('',))
+        if field not in FLAGS:
+            raise ValueError('%r needs an operator and a value' % field)
+        return Flag(field)
+    if op == '==':
+        op = '='
+    if op == '~':
+        op = 'contains'
+    if field == 'due' and op == 'within':
+        return DueWithin(_duration(value))
+    if field in FLAGS and op in ('=', '!='):
+        flag = _condition(field)
+        return flag if _truth(value) == (op == '=') else Not(flag)
+    if field in ('room', 'assigned_to'):
+        if op in ('in', 'not in'):
+            values = tuple(_text(item) for item in _items(value))
+        elif op in ('=', '!='):
+            values = (_text(value),)
+        else:
+            raise ValueError('%s takes =, !=, in or not in' % field)
+        kind = RoomIs if field == 'room' else MemberIs
+        return kind(values, negate=op in ('!=', 'not in'))
+    if field == 'name':
+        if op not in ('=', '!=', 'contains'):
+            raise ValueError('name takes =, !=, contains or ~')
+        return NameIs(op, _text(value))
+    if field in ('frequency', 'effort'):
+        if op == 'in':
+            return Compare(field, op, tuple(_amount(field, item) for item in _items(value)))
+        if op not in COMPARISONS:
+            raise ValueError('%s takes =, !=, <, <=, >, >= or in' % field)
+        return Compare(field, op, (_amount(field, value),))
+    raise ValueError('unknown field %r' % field)
+
+
+class _Parser:
+    def __init__(self, text):
+        self.tokens = []
+        position = 0
+        text = text.rstrip()
+        while position < len(text):
+            match = _TOKEN.match(text, position)
+            if match is None or match.end() == position:
+                raise ValueError('cannot read query at %r' % text[position:])
+            double, single, symbol, word = match.groups()
+            if symbol is not None:
+                self.tokens.append(('symbol', symbol))
+            elif word is not None:
+                self.tokens.append(('word', word))
+            else:
+                quoted = double if double is not None else single
+                self.tokens.append(('string', re.sub(r'\\(.)', r'\1', quoted)))
+            position = match.end()
+        self.position = 0
+
+    def query(self):
+        where = None
+        if self.peek() is not None and not self.at('sort', 'sorted', 'order', 'limit'):
+            where = self.disjunction()
+        sort = []
+        if self.at('sort', 'sorted', 'order'):
+            self.take()
+            self.expect('by')
+            while True:
+                key = self.word('a sort key')
+                direction = self.take()[1].lower() if self.at('asc', 'desc') else 'asc'
+                sort.append(_sort_key(key, direction))
+                if not self.at_symbol(','):
+                    break
+                self.take()
+        limit = QUERY_LIMIT
+        if self.at('limit'):
+            self.take()
+            limit = self.word('a limit')
+        if self.peek() is not None:
+            raise ValueError('unexpected %r' % self.peek()[1])
+        return Query(where, sort, _limit(limit))
+
+    def disjunction(self):
+        children = [self.conjunction()]
+        while self.at('or'):
+            self.take()
+            children.append(self.conjunction())
+        return children[0] if len(children) == 1 else Or(children)
+
+    def conjunction(self):
+        children = [self.negation()]
+        while self.at('and'):
+            self.take()
+            children.append(self.negation())
+        return children[0] if len(children) == 1 else And(children)
+
+    def negation(self):
+        if self.at('not'):
+            self.take()
+            return Not(self.negation())
+        if self.at_symbol('('):
+            self.take()
+            node = self.disjunction()
+            self.expect_symbol(')')
+            return node
+        field = self.word('a field')
+        if self.at('within'):
+            self.take()
+            return _condition(field, 'within', self.value())
+        if self.at('not'):
+            self.take()
+            self.expect('in')
+            return _condition(field, 'not in', self.values())
+        if self.at('in'):
+            self.take()
+            return _condition(field, 'in', self.values())
+        if self.at('contains'):
+            self.take()
+            return _condition(field, 'contains', self.value())
+        token = self.peek()
+        if token is not None and token[0] == 'symbol' and token[1] not in ('(', ')', ','):
+            self.take()
+            return _condition(field, token[1], self.value())
+        return _condition(field)
+
+    # Words and quoted strings up to the next keyword or symbol, joined by spaces
+    def value(self):
+        parts = []
+        while self.peek() is not None and self.peek()[0] != 'symbol':
+            kind, text = self.peek()
+            if kind == 'word' and text.lower() in KEYWORDS:
+                break
+            parts.append(text)
+            self.take()
+        if not parts:
+            raise ValueError('expected a value')
+        return ' '.join(parts)
+
+    def values(self):
+        self.expect_symbol('(')
+        values = [self.value()]
+        while self.at_symbol(','):
+            self.take()
+            values.append(self.value())
+        self.expect_symbol(')')
+        return values
+
+    def peek(self):
+        return self.tokens[self.position] if self.position < len(self.tokens) else None
+
+    def take(self):
+        token = self.peek()
+        self.position += 1
+        return token
+
+    def at(self, *words):
+        token = self.peek()
+        return token is not None and token[0] == 'word' and token[1].lower() in words
+
+    def at_symbol(self, symbol):
+        return self.peek() == ('symbol', symbol)
+
+    def word(self, what):
+        token = self.peek()
+        if token is None or token[0] != 'word':
+            raise ValueError('expected %s' % what)
+        self.take()
+        return token[1]
+
+    def expect(self, word):
+        if not self.at(word):
+            raise ValueError('expected %r' % word)
+        self.take()
+
+    def expect_symbol(self, symbol):
+        if not self.at_symbol(symbol):
+            raise ValueError('expected %r' % symbol)
+        self.take()
+
+
+_COMPARE = {
+    '=': lambda a, b: a == b,
+    '!=': lambda a, b: a != b,
+    '<': lambda a, b: a < b,
+    '<=': lambda a, b: a <= b,
+    '>': lambda a, b: a > b,
+    '>=': lambda a, b: a >= b,
+}
+
+
+# A task's frequency in days or its effort, None if it has no frequency
+def _number(field, task):
+    if field == 'effort':
+        return task.get('effort') or 1
+    if task.get('repeat'):
+        return 1 / compile_rule(task['repeat']).per_day
+    return task.get('frequency_days')
+
+
+# The first ``limit`` of ``matched`` in sort order, without sorting them all.
+# The first sort value alone (no key function) splits off the tasks that
+# certainly make the cut, which get the full sort key; the ones tied at the
+# cutoff, or missing the value, are narrowed the same way by the next keys.
+def _first(run, matched, sort, limit):
+    if len(matched) <= limit:
+        return sorted(matched, key=_order(run, sort))
+    if not sort:
+        return heapq.nsmallest(limit, matched, key=run.position)
+    key, descending = sort[0]
+    firsts = list(map(_sort_value(run, key), matched))
+    known = [value for value in firsts if value is not None]
+    if len(known) < limit:
+        ahead = [item for value, item in zip(firsts, matched) if value is not None]
+        rest = [item for value, item in zip(firsts, matched) if value is None]
+    else:
+        cutoff = (heapq.nlargest if descending else heapq.nsmallest)(limit, known)[-1]
+        if descending:
+            ahead = [item for value, item in zip(firsts, matched) if value is not None and value > cutoff]
+        else:
+            ahead = [item for value, item in zip(firsts, matched) if value is not None and value < cutoff]
+        rest = [item for value, item in zip(firsts, matched) if value is not None and value == cutoff]
+    return sorted(ahead, key=_order(run, sort)) + _first(run, rest, sort[1:], limit - len(ahead))
+
+
+class _Descending:
+    """Wraps a sort value so that larger ones come first."""
+
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __eq__(self, other):
+        return self.value == other.value
+
+    def __lt__(self, other):
+        return other.value < self.value
+
+
+# The sort key of a matched (room id, task): each sort value, missing ones
+# last in either direction, and page order for ties
+def _order(run, sort):
+    values = [(_sort_value(run, key), descending) for key, descending in sort]
+    position = run.position
+
+    def order(item):
+        parts = []
+        for value, descending in values:
+            value = value(item)
+            if value is None:
+                parts.append((True, None))
+            else:
+                parts.append((False, _Descending(value) if descending else value))
+        parts.append(position(item))
+        return parts
+    return order
+
+
+def _sort_value(run, key):
+    household = run.household
+    if key == 'name':
+        return lambda item: item[1]['name'].casefold()
+    if key == 'room':
+        return lambda item: household.rooms_by_id[item[0]]['order']
+    if key == 'assigned_to':
+        def value(item):
+            member = household.members_by_id.get(item[1].get('assigned_to'))
+            return member['name'].casefold() if member else None
+        return value
+    if key in ('frequency', 'effort'):
+        return lambda item: _number(key, item[1])
+    time_of = household.next_due_index.time_of
+    if key == 'due':
+        return lambda item: time_of(item[1]['id'])
+
+    def value(item):
+        when = time_of(item[1]['id'])
+        return None if when is None else run.timestamp - when
+    return value
+
+
+def _sort_key(key, direction):
+    key = FIELD_ALIASES.get(key.lower(), key.lower())
+    if key not in SORT_KEYS:
+        raise ValueError('cannot sort by %r; use one of %s' % (key, ', '.join(SORT_KEYS)))
+    if direction.lower() not in ('asc', 'desc'):
+        raise ValueError('sort direction must be asc or desc')
+    return key, direction.lower() == 'desc'
+
+
+def _limit(value):
+    try:
+        limit = int(value)
+    except (TypeError, ValueError):
+        raise ValueError('limit must be a number')
+    if not 1 <= limit <= MAX_QUERY_LIMIT:
+        raise ValueError('limit must be between 1 and %d' % MAX_QUERY_LIMIT)
+    return limit
+
+
+def _duration(value):
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return value * UNITS['day']
+    parts = str(value).lower().split()
+    try:
+        amount = float(parts[0])
+    except (IndexError, ValueError):
+        raise ValueError('due within needs a number of days, hours or weeks')
+    if len(parts) > 2 or (len(parts) == 2 and parts[1] not in UNITS):
+        raise ValueError('due within needs a number of days, hours or weeks')
+    return amount * UNITS[parts[1] if len(parts) == 2 else 'days']
+
+
+def _amount(field, value):
+    if field == 'frequency':
+        return parse_frequency(value if isinstance(value, str) else str(value))
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        raise ValueError('effort must be a number')
+
+
+def _items(value):
+    if isinstance(value, (list, tuple)):
+        return value
+    raise ValueError('in takes a list of values')
+
+
+def _text(value):
+    if value is None:
+        return ''
+    if not isinstance(value, (str, int, float)) or isinstance(value, bool):
+        raise ValueError('bad value %r' % (value,))
+    return str(value)
+
+
+def _truth(value):
+    if isinstance(value, bool):
+        return value
+    if str(value).lower() in ('true', 'yes', '1'):
+        return True
+    if str(value).lower() in ('false', 'no', '0'):
+        return False
+    raise ValueError('expected true or false, not %r' % (value,))
+
+
+def _membership(values, negate):
+    if len(values) == 1:
+        return '%s %s' % ('!=' if negate else '=', _quote(values[0]))
+    return '%s (%s)' % ('not in' if negate else 'in', ', '.join(map(_quote, values)))
+
+
+def _quote(value):
+    if value and re.fullmatch(r'[^\s()<>=!~,"\']+', value) and value.lower() not in KEYWORDS:
+        return value
+    return '"%s"' % value.replace('\\', '\\\\').replace('"', '\\"')
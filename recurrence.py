@@ -0,0 +1,251 @@
+"""Calendar repeat rules for tasks: a subset of RFC 5545 RRULEs.
+
+A task with a ``repeat`` rule comes due at midnight on the first day the
+rule matches after the day of its last completion, in place of
+``frequency_days`` after it. Rules are accepted as RRULE parts or as
+phrases, and stored in their RRULE form::
+
+    weekdays                        FREQ=WEEKLY;BYDAY=MO,TU,WE,TH,FR
+    every tuesday and friday        FREQ=WEEKLY;BYDAY=TU,FR
+    every 2nd tuesday               FREQ=WEEKLY;INTERVAL=2;BYDAY=TU
+    2nd tuesday of the month        FREQ=MONTHLY;BYDAY=2TU
+    1st of the month                FREQ=MONTHLY;BYMONTHDAY=1
+    last day of the month           FREQ=MONTHLY;BYMONTHDAY=-1
+    ... except 2026-12-25           ...;EXDATE=20261225
+
+There is no start date: INTERVAL counts from the last completion, so
+"every 2nd tuesday" passes over the first Tuesday after one. Finding the
+next day takes one table lookup, or a look at the month or two ahead for
+monthly rules, plus one step per excluded day in the way, and
+``compile_rule`` caches compiled rules by their text.
+"""
+import calendar
+import functools
+import re
+from datetime import date, timedelta
+
+WEEKDAYS = ['MO', 'TU', 'WE', 'TH', 'FR', 'SA', 'SU']
+DAY_NAMES = {name: n for n, name in enumerate(
+    ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday'])}
+DAY_NAMES.update({name[:3]: n for name, n in list(DAY_NAMES.items())})
+ORDINAL_WORDS = {'first': 1, 'second': 2, 'third': 3, 'fourth': 4, 'fifth': 5, 'last': -1, 'other': 2}
+FREQUENCIES = ('DAILY', 'WEEKLY', 'MONTHLY')
+RRULE_PARTS = ('FREQ', 'INTERVAL', 'BYDAY', 'BYMONTHDAY', 'EXDATE')
+# Compiled rules kept by compile_rule
+CACHE_SIZE = 1024
+# Longest run of months a monthly rule may skip (the 31st on a Friday skips up to 20)
+MONTHS_AHEAD = 24
+
+_BYDAY = re.compile(r'([+-]?[1-5])?(MO|TU|WE|TH|FR|SA|SU)')
+_ORDINAL = r'(\d{1,2}(?:st|nd|rd|th)|first|second|third|fourth|fifth|last)'
+_OF_MONTH = r' of (?:the |each |every )?month'
+_MONTH_WEEKDAY = re.compile(r'(?:the |every |each |on the )?' + _ORDINAL + r' (\w+)' + _OF_MONTH)
+_MONTH_DAY = re.compile(r'(?:the |every |each |on the )?' + _ORDINAL + r'(?: day)?' + _OF_MONTH)
+_EVERY = re.compile(r'(?:every|each|on) (?:(other|second|third|fourth|\d+(?:st|nd|rd|th))\s+)?(.+)')
+_EVERY_WEEKS = re.compile(r'every (\d+) weeks? on (.+)')
+
+
+class Rule:
+    """A compiled rule: ``next_date(day)`` is the first day after ``day`` it falls on."""
+
+    def __init__(self, freq, interval=1, weekdays=(), month_weekdays=(), month_days=(), exclude=()):
+        if freq not in FREQUENCIES:
+            raise ValueError('FREQ must be one of %s' % ', '.join(FREQUENCIES))
+        if interval < 1:
+            raise ValueError('INTERVAL must be at least 1')
+        if month_weekdays and freq != 'MONTHLY':
+            raise ValueError('numbered BYDAY needs FREQ=MONTHLY')
+        if month_days and freq != 'MONTHLY':
+            raise ValueError('BYMONTHDAY needs FREQ=MONTHLY')
+        if any(not 1 <= abs(day) <= 31 for day in month_days):
+            raise ValueError('BYMONTHDAY must be 1 to 31 or -31 to -1')
+        self.freq = freq
+        self.interval = interval
+        self.weekdays = tuple(sorted(set(weekdays)))
+        self.month_weekdays = tuple(sorted(set(month_weekdays)))
+        self.month_days = tuple(sorted(set(month_days)))
+        self.exclude = frozenset(exclude)
+        self.monthly = bool(self.month_weekdays or self.month_days)
+        if freq == 'MONTHLY' and not (self.monthly or self.weekdays):
+            raise ValueError('FREQ=MONTHLY needs BYDAY or BYMONTHDAY')
+        # Days from each weekday to the next one the rule allows, 1 to 7
+        self._steps = [min((weekday - day - 1) % 7 + 1 for weekday in self.weekdays) if self.weekdays
+                       else 1 if freq == 'DAILY' else 7
+                       for day in range(7)]
+        self.text = self._format()
+        # About how many times a day it falls on, for weighing tasks against each other
+        if self.monthly:
+            per_day = (len(self.month_days) + len(self.month_weekdays)) * 12 / 365.25
+        elif self.weekdays:
+            per_day = len(self.weekdays) / 7
+        else:
+            per_day = 1 if freq == 'DAILY' else 1 / 7
+        self.per_day = per_day / interval
+        # Raises for combinations that never meet, like BYDAY=2TU,MO
+        self._next(date(2000, 1, 1))
+
+    def __repr__(self):
+        return 'Rule(%r)' % self.text
+
+    def next_date(self, day):
+        if self.interval > 1:
+            day = self._skip(day, self.interval - 1)
+        day = self._next(day)
+        while day in self.exclude:
+            day = self._next(day)
+        return day
+
+    def dates(self, day, end):
+        """The days it falls on after ``day`` and before ``end``, assuming each is done that day."""
+        day = self.next_date(day)
+        while day < end:
+            yield day
+            day = self.next_date(day)
+
+    def _next(self, day):
+        if not self.monthly:
+            return day + timedelta(days=self._steps[day.weekday()])
+        year, month = day.year, day.month
+        for _ in range(MONTHS_AHEAD):
+            for number in self._month_matches(year, month):
+                if (year, month, number) > (day.year, day.month, day.day):
+                    return date(year, month, number)
+            year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+        raise ValueError('%s never falls on a day' % self.text)
+
+    # Days of the month the rule falls on, in order
+    def _month_matches(self, year, month):
+        first_weekday, length = calendar.monthrange(year, month)
+        days = {length + 1 + day if day < 0 else day for day in self.month_days}
+        for number, weekday in self.month_weekdays:
+            first = 1 + (weekday - first_weekday) % 7
+            if number > 0:
+                days.add(first + 7 * (number - 1))
+            else:
+                days.add(first + 7 * ((length - first) // 7 + number + 1))
+        matches = sorted(day for day in days if 1 <= day <= length)
+        if self.weekdays:
+            allowed = set(self.weekdays)
+            matches = [day for day in matches if (first_weekday + day - 1) % 7 in allowed]
+        return matches
+
+    def _skip(self, day, periods):
+        if self.freq == 'DAILY':
+            return day + timedelta(days=periods)
+        if self.freq == 'WEEKLY':
+            return day + timedelta(weeks=periods)
+        year, month = divmod(day.month - 1 + periods, 12)
+        year += day.year
+        month += 1
+        return date(year, month, min(day.day, calendar.monthrange(year, month)[1]))
+
+    def _format(self):
+        parts = ['FREQ=' + self.freq]
+        if self.interval > 1:
+            parts.append('INTERVAL=%d' % self.interval)
+        if self.weekdays or self.month_weekdays:
+            parts.append('BYDAY=' + ','.join(
+                ['%d%s' % (number, WEEKDAYS[weekday]) for number, weekday in self.month_weekdays]
+                + [WEEKDAYS[weekday] for weekday in self.weekdays]))
+        if self.month_days:
+            parts.append('BYMONTHDAY=' + ','.join(map(str, self.month_days)))
+        if self.exclude:
+            parts.append('EXDATE=' + ','.join(day.strftime('%Y%m%d') for day in sorted(self.exclude)))
+        return ';'.join(parts)
+
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def compile_rule(text):
+    """Compiles RRULE parts or a phrase (see the module docstring); ValueError if it is neither."""
+    if not isinstance(text, str) or not text.strip():
+        raise ValueError('empty repeat rule')
+    source = text.strip()
+    if source.upper().startswith('RRULE:'):
+        source = source[len('RRULE:'):]
+    if '=' in source:
+        return _parse_rrule(source)
+    return _parse_phrase(source.lower())
+
+
+def _parse_rrule(source):
+    parts = {}
+    for part in filter(None, source.split(';')):
+        key, separator, value = part.partition('=')
+        key = key.strip().upper()
+        if not separator or key not in RRULE_PARTS:
+            raise ValueError('unsupported rule part %r' % part)
+        parts[key] = value.strip()
+    weekdays, month_weekdays = [], []
+    for item in filter(None, parts.get('BYDAY', '').upper().split(',')):
+        match = _BYDAY.fullmatch(item.strip())
+        if match is None:
+            raise ValueError('bad BYDAY %r' % item)
+        weekday = WEEKDAYS.index(match.group(2))
+        if match.group(1):
+            month_weekdays.append((int(match.group(1)), weekday))
+        else:
+            weekdays.append(weekday)
+    try:
+        interval = int(parts.get('INTERVAL', 1))
+        month_days = [int(day) for day in filter(None, parts.get('BYMONTHDAY', '').split(','))]
+    except ValueError:
+        raise ValueError('INTERVAL and BYMONTHDAY must be numbers')
+    return Rule(parts.get('FREQ', '').upper(), interval, weekdays, month_weekdays, month_days,
+                _parse_dates(parts.get('EXDATE', '')))
+
+
+def _parse_phrase(source):
+    source, _, excluded = source.partition(' except ')
+    exclude = _parse_dates(excluded)
+    source = ' '.join(source.split())
+    if source in ('weekdays', 'every weekday', 'on weekdays'):
+        return Rule('WEEKLY', weekdays=range(5), exclude=exclude)
+    if source in ('weekends', 'every weekend', 'on weekends'):
+        return Rule('WEEKLY', weekdays=(5, 6), exclude=exclude)
+    match = _MONTH_WEEKDAY.fullmatch(source)
+    if match and _day_names(match.group(2)):
+        number = _ordinal(match.group(1))
+        if not 1 <= abs(number) <= 5:
+            raise ValueError('a weekday only comes up to five times a month')
+        return Rule('MONTHLY', month_weekdays=[(number, _day_names(match.group(2))[0])], exclude=exclude)
+    match = _MONTH_DAY.fullmatch(source)
+    if match:
+        return Rule('MONTHLY', month_days=[_ordinal(match.group(1))], exclude=exclude)
+    match = _EVERY_WEEKS.fullmatch(source)
+    if match and _day_names(match.group(2)):
+        return Rule('WEEKLY', int(match.group(1)), _day_names(match.group(2)), exclude=exclude)
+    match = _EVERY.fullmatch(source)
+    if match and _day_names(match.group(2)):
+        interval = _ordinal(match.group(1)) if match.group(1) else 1
+        return Rule('WEEKLY', interval, _day_names(match.group(2)), exclude=exclude)
+    raise ValueError('unknown repeat rule %r' % source)
+
+
+def _ordinal(word):
+    if word in ORDINAL_WORDS:
+        return ORDINAL_WORDS[word]
+    return int(word[:-2])
+
+
+# Weekday numbers of a list like "tuesday and fridays", empty if anything else is in it
+def _day_names(source):
+    days = []
+    for word in re.split(r'\s*,\s*|\s+and\s+|\s+', source.strip()):
+        word = word[:-1] if word.endswith('s') and word[:-1] in DAY_NAMES else word
+        if word not in DAY_NAMES:
+            return []
+        days.append(DAY_NAMES[word])
+    return days
+
+
+def _parse_dates(source):
+    days = []
+    for item in filter(None, (item.strip() for item in re.split(r',|\s+and\s+', source))):
+        digits = item.split('T')[0].replace('-', '')
+        try:
+            days.append(date(int(digits[:4]), int(digits[4:6]), int(digits[6:8])))
+        except ValueError:
+            raise ValueError('bad excluded date %r' % item)
+        if len(digits) != 8:
+            raise ValueError('bad excluded date %r' % item)
+    return days
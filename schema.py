@@ -0,0 +1,412 @@
+"""The canonical household document shared by app.py and chore_app.py.
+
+    schema: 2
+    members:
+    - {id, name, exclude?}
+    rooms:
+    - {id, name, frequency_days, assigned_to, order,
+       tasks: [{id, name, frequency_days, assigned_to, history, repeat?, effort?, auto?}]}
+
+``assigned_to`` holds a member id. ``frequency_days`` is None for one-off
+tasks. ``history`` lists completion times as ISO strings, oldest first;
+a task is done while its last completion is younger than its frequency.
+A task may have a ``repeat`` rule (see recurrence.py) in place of
+``frequency_days``, which is then None. ``effort`` (default 1) weighs a
+task for fair assignment, ``auto`` marks one that was assigned that way,
+and a member's ``exclude`` lists rooms and tasks they are never given
+automatically (see balance.py).
+Rooms are shown in ``order`` key order (see orderkeys.py).
+
+Documents without a ``schema`` tag are version 1, in one of two layouts:
+
+* app.py's: rooms and tasks in lists with uuid ids, ``frequency`` as
+  daily/weekly/monthly and a ``history`` list. Older files still have
+  ``family_members`` names with names in ``assigned_to``, and tasks with
+  ``last_completed`` in place of ``history``.
+* chore_app.py's: ``rooms``/``tasks``/``members`` maps keyed by
+  ``roomN``/``taskN``/``memberN``, a ``next_ids`` counter, and tasks with
+  ``done``, ``last_done`` (a date) and ``frequency_days``.
+
+``migrate`` upgrades a document when it is loaded, and the caller saves it
+once. ``python schema.py OLD.yaml [NEW.yaml]`` converts a file, reading
+and writing it one room at a time (see FileConverter).
+"""
+import argparse
+import sys
+import uuid
+from datetime import date, datetime
+
+import yaml
+
+from orderkeys import key_between
+from recurrence import compile_rule
+
+SCHEMA_VERSION = 2
+
+FREQUENCY_DAYS = {'daily': 1, 'weekly': 7, 'monthly': 30}
+FREQUENCY_NAMES = {days: name for name, days in FREQUENCY_DAYS.items()}
+# Fallback for unreadable frequencies in old files, which treated them as daily
+LEGACY_FREQUENCY_DAYS = 1
+
+# libyaml's loader when PyYAML was built with it, several times faster
+try:
+    _Loader = yaml.CSafeLoader
+except AttributeError:
+    _Loader = yaml.SafeLoader
+
+
+def load_yaml(stream):
+    """yaml.safe_load, through libyaml when it is installed."""
+    return yaml.load(stream, Loader=_Loader)
+
+
+def parse_frequency(value):
+    """Returns the number of days for a frequency name, a day count or ``'N days'``; None for no repeat."""
+    if value is None or value == '':
+        return None
+    if isinstance(value, str):
+        value = value.strip().lower()
+        if value in FREQUENCY_DAYS:
+            return FREQUENCY_DAYS[value]
+        if value.endswith(' days'):
+            value = value[:-len(' days')]
+    try:
+        days = int(value)
+    except (TypeError, ValueError):
+        raise ValueError('unknown frequency %r' % (value,))
+    if days < 1 or days != float(value):
+        raise ValueError('unknown frequency %r' % (value,))
+    return days
+
+
+def frequency_name(days):
+    """The inverse of parse_frequency: daily/weekly/monthly where possible."""
+    if days is None:
+        return None
+    return FREQUENCY_NAMES.get(days, '%d days' % days)
+
+
+def parse_schedule(value):
+    """Returns ``(frequency_days, repeat)`` for a frequency (see parse_frequency) or a repeat rule."""
+    try:
+        return parse_frequency(value), None
+    except ValueError:
+        if not isinstance(value, str):
+            raise
+    try:
+        return None, compile_rule(value).text
+    except ValueError:
+        raise ValueError('unknown frequency %r' % (value,))
+
+
+def schedule_name(record):
+    """A task's repeat rule, or its frequency as frequency_name gives it."""
+    return record.get('repeat') or frequency_name(record.get('frequency_days'))
+
+
+def timestamp(value):
+    """Normalises a datetime, date or ISO string to an ISO timestamp string."""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, date):
+        return datetime(value.year, value.month, value.day).isoformat()
+    return datetime.fromisoformat(str(value).strip()).isoformat()
+
+
+def new_id():
+    return str(uuid.uuid4())
+
+
+def empty_document():
+    return {'schema': SCHEMA_VERSION, 'members': [], 'rooms': []}
+
+
+def migrate(data):
+    """Brings ``data`` up to SCHEMA_VERSION. Returns ``(document, changed)``."""
+    version = data.get('schema', 1)
+    if version > SCHEMA_VERSION:
+        raise ValueError('document schema %r is newer than this code (%d)' % (version, SCHEMA_VERSION))
+    changed = False
+    while version < SCHEMA_VERSION:
+        data = MIGRATIONS[version](data)
+        version = data['schema']
+        changed = True
+    return data, changed
+
+
+def repair(data):
+    """Fills in record fields a hand edit may have left out. Returns True if anything changed."""
+    changed = False
+    last = max((room['order'] for room in data['rooms'] if room.get('order')), default=None)
+    for room in data['rooms']:
+        if not room.get('order'):
+            room['order'] = last = key_between(last, None)
+            changed = True
+        for task in room.setdefault('tasks', []):
+            if task.get('history') is None:
+                task['history'] = []
+                changed = True
+    return changed
+
+
+class Converter:
+    """Turns a version 1 document of either layout into canonical rooms and members.
+
+    ``rooms()`` is a generator, so a large document can be written out one
+    room at a time. ``members`` is complete once the rooms are consumed:
+    app.py's oldest files only name some assignees inside their tasks.
+    """
+
+    def __init__(self, data, now=None):
+        self.data = data
+        self.now = now or datetime.now()
+        self.by_name = not isinstance(data.get('rooms'), dict)
+        self.members = []
+        self._member_ids = set()
+        self._ids_by_name = {}
+        self._task_ids = set()
+        # Rooms without an order key go after the ones that have one
+        self._last_order = max(self._orders(), default=None) if self.by_name else None
+        members = data.get('members')
+        if isinstance(members, dict):
+            for member_id, member in members.items():
+                self._add_member(str(member_id), member['name'])
+        elif members is not None:
+            for member in members:
+                self._add_member(member['id'], member['name'])
+        for name in data.get('family_members') or []:
+            self._member(name)
+
+    def document(self):
+        rooms = list(self.rooms())
+        return {'schema': SCHEMA_VERSION, 'members': self.members, 'rooms': rooms}
+
+    def rooms(self):
+        if not self.by_name:
+            for room_id, room in self._room_items():
+                yield self._room(str(room_id), room, room.get('default_frequency_days'),
+                                 (self._map_task(str(task_id), task) for task_id, task in room['tasks'].items()))
+        else:
+            for room in self._room_items():
+                yield self._room(room.get('id') or new_id(), room, room.get('frequency'),
+                                 (self._list_task(task) for task in room.get('tasks') or []))
+
+    def write(self, f):
+        """Writes the canonical document as YAML, one room at a time."""
+        f.write('schema: %d\n' % SCHEMA_VERSION)
+        self._write_list(f, 'rooms', self.rooms())
+        self._write_list(f, 'members', self.members)
+
+    # The rooms as given: (id, room) pairs in chore_app.py's layout, rooms in app.py's
+    def _room_items(self):
+        rooms = self.data.get('rooms') or []
+        return rooms.items() if isinstance(rooms, dict) else rooms
+
+    # The order keys of app.py-layout rooms that have one
+    def _orders(self):
+        return [room['order'] for room in self.data.get('rooms') or [] if room.get('order')]
+
+    def _write_list(self, f, key, items):
+        f.write(key + ':')
+        empty = True
+        for item in items:
+            if empty:
+                f.write('\n')
+                empty = False
+            yaml.safe_dump([item], f, default_flow_style=False)
+        if empty:
+            f.write(' []\n')
+
+    def _room(self, room_id, room, frequency, tasks):
+        order = room.get('order')
+        if not order:
+            order = self._last_order = key_between(self._last_order, None)
+        return {
+            'id': room_id,
+            'name': room['name'],
+            'frequency_days': self._frequency(frequency),
+            'assigned_to': self._member(room.get('assigned_to')),
+            'order': order,
+            'tasks': list(tasks),
+        }
+
+    def _list_task(self, task):
+        history = task.get('history')
+        if history is None:
+            last_completed = task.get('last_completed')
+            history = [last_completed] if last_completed else []
+        return self._task(task.get('id'), task, task.get('frequency'), history)
+
+    def _map_task(self, task_id, task):
+        if task.get('last_done'):
+            history = [task['last_done']]
+        else:
+            history = [self.now] if task.get('done') else []
+        return self._task(task_id, task, task.get('frequency_days'), history)
+
+    def _task(self, task_id, task, frequency, history):
+        if not task_id or task_id in self._task_ids:
+            task_id = new_id()
+        self._task_ids.add(task_id)
+        return {
+            'id': task_id,
+            'name': task['name'],
+            'frequency_days': self._frequency(frequency),
+            'assigned_to': self._member(task.get('assigned_to')),
+            'history': sorted(timestamp(entry) for entry in history),
+        }
+
+    def _frequency(self, value):
+        try:
+            return parse_frequency(value)
+        except ValueError:
+            return LEGACY_FREQUENCY_DAYS
+
+    def _add_member(self, member_id, name):
+        self.members.append({'id': member_id, 'name': name})
+        self._member_ids.add(member_id)
+        self._ids_by_name.setdefault(name, member_id)
+        return member_id
+
+    # app.py files may name members directly; chore_app.py files only hold ids,
+    # and an id whose member was deleted means unassigned
+    def _member(self, value):
+        if not value:
+            return None
+        value = str(value)
+        if value in self._member_ids:
+            return value
+        if not self.by_name:
+            return None
+        return self._ids_by_name.get(value) or self._add_member(new_id(), value)
+
+
+class FileConverter(Converter):
+    """A Converter that reads a version 1 file one room at a time.
+
+    A first pass over the file keeps only the top-level ``schema``,
+    ``members`` and ``family_members`` and the rooms' order keys; the rooms
+    themselves are read again, one by one, as ``rooms()`` is consumed. Memory
+    stays at about one room on both the reading and the writing side.
+    """
+
+    def __init__(self, path, now=None):
+        self.path = path
+        self._room_orders = []
+        data = {}
+        with open(path) as f:
+            reader = _EventReader(f)
+            for key in reader.keys():
+                if key == 'rooms':
+                    data['rooms'] = {} if reader.check_event(yaml.MappingStartEvent) else []
+                    for room in reader.items():
+                        if isinstance(room, dict) and room.get('order'):
+                            self._room_orders.append(room['order'])
+                elif key in ('schema', 'members', 'family_members'):
+                    data[key] = reader.value()
+                else:
+                    reader.skip()
+        super().__init__(data, now)
+
+    def _room_items(self):
+        with open(self.path) as f:
+            reader = _EventReader(f)
+            for key in reader.keys():
+                if key != 'rooms':
+                    reader.skip()
+                    continue
+                yield from reader.items()
+                return
+
+    def _orders(self):
+        return self._room_orders
+
+
+class _EventReader(yaml.composer.Composer, yaml.constructor.SafeConstructor, yaml.resolver.Resolver):
+    """Builds values from a document's parser events one node at a time.
+
+    The events come from the C parser when libyaml is there; composing and
+    constructing are PyYAML's own, so tags, anchors and aliases work as in a
+    full load.
+    """
+
+    def __init__(self, stream):
+        yaml.composer.Composer.__init__(self)
+        yaml.constructor.SafeConstructor.__init__(self)
+        yaml.resolver.Resolver.__init__(self)
+        self._events = yaml.parse(stream, Loader=_Loader)
+        self._event = None
+
+    def peek_event(self):
+        if self._event is None:
+            self._event = next(self._events, None)
+        return self._event
+
+    def check_event(self, *choices):
+        event = self.peek_event()
+        return event is not None and (not choices or isinstance(event, choices))
+
+    def get_event(self):
+        event = self.peek_event()
+        self._event = None
+        return event
+
+    def value(self):
+        return self.construct_document(self.compose_node(None, None))
+
+    def skip(self):
+        # Composed all the same, so that later aliases find their anchors
+        self.compose_node(None, None)
+
+    def keys(self):
+        """The top-level keys, each to be followed by reading or skipping its value."""
+        self.get_event()
+        if self.check_event(yaml.StreamEndEvent):
+            return
+        self.get_event()
+        if self.check_event(yaml.ScalarEvent) and self.value() is None:
+            return
+        if not self.check_event(yaml.MappingStartEvent):
+            raise ValueError('not a YAML mapping')
+        self.get_event()
+        while not self.check_event(yaml.MappingEndEvent):
+            yield self.value()
+
+    def items(self):
+        """The entries of the list that is next, or the (key, value) pairs of the map; none for null."""
+        if not self.check_event(yaml.SequenceStartEvent, yaml.MappingStartEvent):
+            self.skip()
+            return
+        pairs = isinstance(self.get_event(), yaml.MappingStartEvent)
+        while not self.check_event(yaml.SequenceEndEvent, yaml.MappingEndEvent):
+            yield (self.value(), self.value()) if pairs else self.value()
+        self.get_event()
+
+
+def _migrate_v1(data):
+    return Converter(data).document()
+
+
+# version -> function returning the document at the next version
+MIGRATIONS = {1: _migrate_v1}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Converts an app.py or chore_app.py data file to the canonical schema.')
+    parser.add_argument('source')
+    parser.add_argument('dest', nargs='?', default='-')
+    args = parser.parse_args(argv)
+    try:
+        converter = FileConverter(args.source)
+    except ValueError as e:
+        parser.error('%s: %s' % (args.source, e))
+    if converter.data.get('schema', 1) != 1:
+        parser.error('%s is already at schema %s' % (args.source, converter.data['schema']))
+    out = sys.stdout if args.dest == '-' else open(args.dest, 'w')
+    with out:
+        converter.write(out)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
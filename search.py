@@ -0,0 +1,151 @@
+"""Trigram index over room and task names, for /search.
+
+Names are lowercased and split into words. Each word is padded the way
+PostgreSQL's pg_trgm pads it, two spaces in front and one behind, and cut
+into three-character trigrams; each trigram maps to the set of distinct
+names containing it. A name shared by many tasks ("Wipe counters" in every
+kitchen) is indexed once, together with the keys that carry it.
+
+A query word of three or more characters matches anywhere inside a word,
+and a shorter one only at the start of a word, through its padded
+trigrams. The candidates are the intersection of the query's posting
+sets, smallest first, and each one is checked against the query and
+ranked:
+
+    0  the whole name
+    1  the start of the name
+    2  the start of a word, for every query word
+    3  anywhere
+
+with shorter names first within a rank. The cost follows the number of
+distinct names matching, not the number of tasks.
+"""
+import heapq
+import itertools
+import re
+
+_WORD = re.compile(r'\w+')
+
+
+def normalize(name):
+    return ' '.join(_WORD.findall(name.casefold()))
+
+
+def trigrams(text):
+    """The padded trigrams of every word in normalized ``text``."""
+    grams = set()
+    for word in text.split():
+        padded = '  ' + word + ' '
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def matches(query, name):
+    """Whether ``name`` matches ``query`` the way a search for it would find it."""
+    words = normalize(query).split()
+    return bool(words) and _pattern(words, False).match(normalize(name)) is not None
+
+
+def query_trigrams(word):
+    if len(word) < 3:
+        padded = '  ' + word
+        return {padded[i:i + 3] for i in range(len(padded) - 2)}
+    return {word[i:i + 3] for i in range(len(word) - 2)}
+
+
+class TrigramIndex:
+    """Names by key, searchable by any part of their words; ``set`` and ``remove`` keep it current."""
+
+    def __init__(self):
+        # key -> normalized name
+        self._texts = {}
+        # normalized name -> keys carrying it
+        self._keys = {}
+        # trigram -> normalized names containing it
+        self._postings = {}
+
+    def __len__(self):
+        return len(self._texts)
+
+    def set(self, key, name):
+        text = normalize(name or '')
+        old = self._texts.get(key)
+        if old == text:
+            return
+        if old is not None:
+            self._unlink(key, old)
+        self._texts[key] = text
+        keys = self._keys.get(text)
+        if keys is None:
+            keys = self._keys[text] = set()
+            for gram in trigrams(text):
+                if gram in self._postings:
+                    self._postings[gram].add(text)
+                else:
+                    self._postings[gram] = {text}
+        keys.add(key)
+
+    def remove(self, key):
+        text = self._texts.pop(key, None)
+        if text is not None:
+            self._unlink(key, text)
+
+    def search(self, query, limit):
+        """The keys of the best ``limit`` matches for ``query``, and how many keys match in all."""
+        query = normalize(query)
+        words = query.split()
+        # Checked and ranked by regexes and str methods, so each name costs no Python-level loop
+        matched = self._matches(words)
+        total = sum(map(len, map(self._keys.__getitem__, matched)))
+        found = []
+        word_starts = _pattern(words, True).match
+        for test in (query.__eq__, lambda text: text.startswith(query), word_starts, None):
+            if test is None:
+                tier, matched = matched, []
+            else:
+                tier = list(filter(test, matched))
+                matched = list(itertools.filterfalse(test, matched))
+            for text in heapq.nsmallest(limit - len(found), tier, key=lambda text: (len(text), text)):
+                found.extend(heapq.nsmallest(limit - len(found), self._keys[text]))
+            if len(found) >= limit or not matched:
+                break
+        return found, total
+
+    def matching(self, query):
+        """The keys of every name matching ``query``, unranked."""
+        keys = set()
+        for text in self._matches(normalize(query).split()):
+            keys.update(self._keys[text])
+        return keys
+
+    # Every distinct name holding all of ``words``
+    def _matches(self, words):
+        if not words:
+            return []
+        postings = []
+        for gram in set().union(*map(query_trigrams, words)):
+            if gram not in self._postings:
+                return []
+            postings.append(self._postings[gram])
+        postings.sort(key=len)
+        return list(filter(_pattern(words, False).match, postings[0].intersection(*postings[1:])))
+
+    def _unlink(self, key, text):
+        keys = self._keys[text]
+        keys.discard(key)
+        if keys:
+            return
+        del self._keys[text]
+        for gram in trigrams(text):
+            texts = self._postings[gram]
+            texts.discard(text)
+            if not texts:
+                del self._postings[gram]
+
+
+# Matches names holding every query word, short ones (or all of them, with
+# ``word_starts``) at the start of a word; (?<![^ ]) is a word start
+def _pattern(words, word_starts):
+    return re.compile(''.join(
+        '(?=.*?%s%s)' % ('(?<![^ ])' if word_starts or len(word) < 3 else '', re.escape(word)) for word in words
+    ))
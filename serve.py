@@ -0,0 +1,275 @@
+"""Pre-fork production server for the chore apps.
+
+    python serve.py app:app --bind 0.0.0.0:8000 --threads 8
+
+The master imports the app and loads its data once, then forks workers that
+share the listening socket and the preloaded pages copy-on-write. Each worker
+runs a Werkzeug server with a fixed pool of request threads and no debugger
+or reloader.
+
+Signals to the master:
+    SIGHUP            reload the data snapshot, start fresh workers, then
+                      gracefully stop the old ones
+    SIGTERM / SIGINT  stop workers gracefully (in-flight requests finish and
+                      pending writes are flushed) and exit
+    SIGTTIN / SIGTTOU add / remove a worker
+
+One worker is the default, and the only safe setting for an app that takes
+writes. Every process keeps its own copy of the data and nothing locks
+load, change and save across processes, so two POSTs handled by different
+workers at once can lose one of the updates, snapshot or not. Run several
+workers (--workers N, or SIGTTIN) only for read-mostly load where that is
+acceptable, and then leave write-behind off (CHORES_FLUSH_MS unset). The
+others' writes reach each worker through the file watcher, and since each
+keeps its own Idempotency-Key cache, workers then refuse keyed requests. Set
+CHORES_SNAPSHOT to a file path (ideally on /dev/shm) to have workers share
+one memory-mapped snapshot: a worker that writes publishes it, and the others
+serve /data from it without parsing anything (see snapshot.py).
+"""
+import argparse
+import gc
+import importlib
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+
+SHARED_WRITES = 'several workers: writes handled by different workers at once can be lost'
+# Each worker keeps its own Idempotency-Key cache, which a retry on another worker would miss
+SINGLE_WORKER_KEYS = 'Idempotency-Key needs a single server worker (serve.py --workers 1)'
+
+
+class RequestHandler(WSGIRequestHandler):
+    # One request per connection: a keep-alive client would otherwise hold a
+    # pool thread for as long as it stays connected and starve everyone else
+    protocol_version = 'HTTP/1.0'
+    timeout = 30
+
+
+class PooledWSGIServer(BaseWSGIServer):
+    """Werkzeug server that hands connections to a fixed-size thread pool."""
+
+    multithread = True
+
+    def __init__(self, host, port, app, threads, fd=None):
+        super().__init__(host, port, app, handler=RequestHandler, fd=fd)
+        # Every worker wakes up for a new connection but only one wins the
+        # accept(); the rest must get EAGAIN rather than block in accept()
+        self.socket.setblocking(False)
+        self.pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='request')
+
+    def get_request(self):
+        conn, address = self.socket.accept()
+        conn.setblocking(True)
+        return conn, address
+
+    def process_request(self, request, client_address):
+        self.pool.submit(self._process_request, request, client_address)
+
+    def _process_request(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        if hasattr(self, 'pool'):
+            self.pool.shutdown(wait=True)
+
+
+def load_app(target):
+    """Imports ``module:attribute`` and returns ``(module, app)``."""
+    module_name, _, attribute = target.partition(':')
+    module = importlib.import_module(module_name)
+    return module, getattr(module, attribute or 'app')
+
+
+def preload(module):
+    """Loads the app's data in the master so workers inherit it."""
+    if hasattr(module, 'init_data'):
+        module.init_data()
+    if hasattr(module, 'load_data'):
+        module.load_data()
+
+
+def refresh(module):
+    """Re-reads the data file before a graceful reload."""
+    store = getattr(module, 'store', None)
+    if store is None:
+        preload(module)
+        return
+    store.reload()
+    # Have the new workers inherit the document ready to use (and the snapshot published)
+    if hasattr(module, 'load_data'):
+        module.load_data()
+
+
+def parse_bind(bind):
+    host, _, port = bind.rpartition(':')
+    return host or '127.0.0.1', int(port)
+
+
+def listen(host, port, backlog=2048):
+    family = socket.AF_INET6 if ':' in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def run_worker(app, host, port, fd, threads):
+    server = PooledWSGIServer(host, port, app, threads=threads, fd=fd)
+
+    def stop(signum, frame):
+        # shutdown() waits for serve_forever, so it can't run on this thread
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+    server.serve_forever()
+
+
+class Arbiter:
+    """Keeps ``workers`` forked worker processes running."""
+
+    def __init__(self, module, app, sock, workers, threads, graceful_timeout=30):
+        self.module = module
+        self.app = app
+        self.sock = sock
+        self.host, self.port = sock.getsockname()[:2]
+        self.workers = workers
+        self.threads = threads
+        self.graceful_timeout = graceful_timeout
+        self.children = {}
+        self.signals = []
+
+    def run(self):
+        for signum in (signal.SIGHUP, signal.SIGTERM, signal.SIGINT, signal.SIGTTIN, signal.SIGTTOU):
+            signal.signal(signum, lambda signum, frame: self.signals.append(signum))
+        log('listening on http://%s:%s (%d workers x %d threads)',
+            self.host, self.port, self.workers, self.threads)
+        if self.workers > 1:
+            log(SHARED_WRITES)
+        self.spawn_missing()
+        while True:
+            while self.signals:
+                signum = self.signals.pop(0)
+                if signum in (signal.SIGTERM, signal.SIGINT):
+                    self.stop(list(self.children))
+                    return
+                if signum == signal.SIGHUP:
+                    self.reload()
+                elif signum == signal.SIGTTIN:
+                    self.workers += 1
+                    log(SHARED_WRITES)
+                    if self.workers == 2:
+                        # The first worker took Idempotency-Keys; swap it for one that refuses them
+                        self.replace(list(self.children))
+                elif signum == signal.SIGTTOU and self.workers > 1:
+                    self.workers -= 1
+                    self.stop(list(self.children)[:1])
+            self.reap()
+            self.spawn_missing()
+            time.sleep(0.2)
+
+    def spawn_missing(self):
+        while len(self.children) < self.workers:
+            self.spawn()
+
+    def spawn(self):
+        # Freeze what the master has allocated so the collector in each worker
+        # doesn't touch (and un-share) the preloaded pages
+        gc.collect()
+        gc.freeze()
+        pid = os.fork()
+        if pid == 0:
+            for signum in (signal.SIGTTIN, signal.SIGTTOU):
+                signal.signal(signum, signal.SIG_IGN)
+            idempotency = getattr(self.module, 'idempotency', None)
+            if self.workers > 1 and idempotency is not None:
+                idempotency.refuse(SINGLE_WORKER_KEYS)
+            try:
+                run_worker(self.app, self.host, self.port, self.sock.fileno(), self.threads)
+            except BaseException:
+                traceback.print_exc()
+                os._exit(1)
+            # Leave through sys.exit so atexit hooks drain write-behind stores
+            sys.exit(0)
+        self.children[pid] = time.monotonic()
+        return pid
+
+    def reap(self):
+        while self.children:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                self.children.clear()
+                return
+            if pid == 0:
+                return
+            if self.children.pop(pid, None) is not None and status:
+                log('worker %d exited with status %d', pid, status)
+
+    def reload(self):
+        log('reloading')
+        old = list(self.children)
+        refresh(self.module)
+        self.replace(old)
+
+    def replace(self, old):
+        """Starts a full set of workers, then gracefully stops the ``old`` ones."""
+        for _ in range(self.workers):
+            self.spawn()
+        self.stop(old)
+
+    def stop(self, pids):
+        for pid in pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        deadline = time.monotonic() + self.graceful_timeout
+        while any(pid in self.children for pid in pids) and time.monotonic() < deadline:
+            self.reap()
+            time.sleep(0.05)
+        for pid in pids:
+            if pid in self.children:
+                os.kill(pid, signal.SIGKILL)
+                self.children.pop(pid)
+
+
+def log(message, *args):
+    print('[serve %d] %s' % (os.getpid(), message % args), file=sys.stderr, flush=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('target', nargs='?', default='app:app', help='module:attribute of the WSGI app')
+    parser.add_argument('-b', '--bind', default=os.environ.get('CHORES_BIND', '127.0.0.1:8000'))
+    parser.add_argument('-w', '--workers', type=int, default=int(os.environ.get('CHORES_WORKERS', '1')),
+                        help='worker processes (default 1; more can lose concurrent writes)')
+    parser.add_argument('-t', '--threads', type=int, default=int(os.environ.get('CHORES_THREADS', '8')))
+    parser.add_argument('--graceful-timeout', type=float, default=30)
+    args = parser.parse_args(argv)
+
+    module, app = load_app(args.target)
+    preload(module)
+    host, port = parse_bind(args.bind)
+    sock = listen(host, port)
+    Arbiter(module, app, sock, args.workers, args.threads, args.graceful_timeout).run()
+
+
+if __name__ == '__main__':
+    main()
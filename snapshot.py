@@ -0,0 +1,252 @@
+"""Immutable, memory-mapped snapshots of a household document.
+
+With several serve.py workers, every process used to keep its own parsed
+copy of the document and re-parse the YAML after each write made anywhere.
+With ``CHORES_SNAPSHOT`` set, the process that saves also publishes the
+document as a snapshot file with the next version number. The others map
+the file read-only and decode a room only when their cached /data fragment
+for it is out of date, so they never build a second copy of the document
+and their memory stays flat however many workers run. A process re-reads
+the whole document from a snapshot only when it makes a write itself.
+
+The same file makes cold starts cheap: opening a snapshot maps it and reads
+the header and the top-level keys, nothing else. Rooms and tasks are found
+through fixed-width offset tables and decoded on first access, so a fresh
+process serves /data without ever parsing the YAML
+(``benchmarks/bench_snapshot.py`` compares the two).
+
+Snapshots are never modified: a new one is written next to the old and
+renamed over it, so a mapping stays valid for as long as a reader holds it.
+Layout, little-endian::
+
+    header  magic, version (u64), head length (u32), room count (u32),
+            task count (u32), signature (inode, size, mtime_ns as 3 x u64)
+            of the YAML file the snapshot matches, all zero if that file was
+            not written yet
+    head    JSON object: every top-level key of the document except rooms
+    rooms   per room, in display order: id position (u64) and length (u16),
+            offset (u64), length (u32) and CRC-32 (u32) of its JSON
+    tasks   per task, sorted by id: id position (u64) and length (u16),
+            offset (u64) and length (u32) of its JSON, room number (u32)
+    ids     the UTF-8 ids the tables point at
+    data    one JSON object per room, each task's JSON inside its room's
+"""
+import fcntl
+import json
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import zlib
+
+from filewatch import stat_signature
+
+MAGIC = b'CHSNAP02'
+HEADER = struct.Struct('<8sQIII3Q')
+ROOM = struct.Struct('<QHQII')
+TASK = struct.Struct('<QHQII')
+
+
+def encode(value):
+    return json.dumps(value, separators=(',', ':')).encode()
+
+
+def encode_room(room):
+    """Returns the room's JSON and ``(task_id, offset, length)`` of each task within it."""
+    head = encode({key: value for key, value in room.items() if key != 'tasks'})
+    prefix = head[:-1] + (b',' if head != b'{}' else b'') + b'"tasks":['
+    blobs = [encode(task) for task in room['tasks']]
+    spans = []
+    position = len(prefix)
+    for task, blob in zip(room['tasks'], blobs):
+        spans.append((task['id'], position, len(blob)))
+        position += len(blob) + 1
+    return prefix + b','.join(blobs) + b']}', spans
+
+
+class Snapshot:
+    """One published snapshot, mapped read-only from the open file ``f``."""
+
+    def __init__(self, f):
+        st = os.fstat(f.fileno())
+        self.signature = (st.st_ino, st.st_size, st.st_mtime_ns)
+        self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.version, head_length, self.room_count, self.task_count, *source = HEADER.unpack_from(self._map)
+        if magic != MAGIC:
+            raise ValueError('%s is not a household snapshot' % f.name)
+        self.source = tuple(source) if any(source) else None
+        head = self._map[HEADER.size:HEADER.size + head_length]
+        self.head = json.loads(head)
+        self.head_checksum = zlib.crc32(head)
+        self._rooms_at = HEADER.size + head_length
+        self._tasks_at = self._rooms_at + ROOM.size * self.room_count
+        # Built from the room table on first use
+        self._room_ids = None
+        self._room_numbers = None
+
+    @property
+    def room_ids(self):
+        """Room ids in display order."""
+        if self._room_ids is None:
+            self._room_ids = [self._id(ROOM.unpack_from(self._map, self._rooms_at + ROOM.size * number))
+                              for number in range(self.room_count)]
+        return self._room_ids
+
+    def checksum(self, room_id):
+        """CRC-32 of the room's JSON, None if the room is not in this snapshot."""
+        entry = self._room_entry(room_id)
+        return entry[4] if entry else None
+
+    def room(self, room_id):
+        entry = self._room_entry(room_id)
+        if entry is None:
+            raise KeyError(room_id)
+        return json.loads(self._map[entry[2]:entry[2] + entry[3]])
+
+    def task(self, task_id):
+        """Returns ``(room_id, task)``, decoding nothing but that task; None if it is not here."""
+        key = task_id.encode()
+        low, high = 0, self.task_count
+        while low < high:
+            middle = (low + high) // 2
+            entry = TASK.unpack_from(self._map, self._tasks_at + TASK.size * middle)
+            found = self._map[entry[0]:entry[0] + entry[1]]
+            if found == key:
+                return self.room_ids[entry[4]], json.loads(self._map[entry[2]:entry[2] + entry[3]])
+            if found < key:
+                low = middle + 1
+            else:
+                high = middle
+        return None
+
+    def rooms(self):
+        for room_id in self.room_ids:
+            yield self.room(room_id)
+
+    def document(self):
+        return {**self.head, 'rooms': list(self.rooms())}
+
+    def _id(self, entry):
+        return self._map[entry[0]:entry[0] + entry[1]].decode()
+
+    def _room_entry(self, room_id):
+        if self._room_numbers is None:
+            self._room_numbers = {room_id: number for number, room_id in enumerate(self.room_ids)}
+        number = self._room_numbers.get(room_id)
+        if number is None:
+            return None
+        return ROOM.unpack_from(self._map, self._rooms_at + ROOM.size * number)
+
+
+class SnapshotFile:
+    """The snapshot at ``path``: ``current()`` maps the latest one, ``publish()`` replaces it."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._snapshot = None
+        # room id -> (token, encoded JSON, task spans) from the last publish
+        self._encoded = {}
+        self.publishes = 0
+        self.maps = 0
+
+    def current(self):
+        """Returns the latest Snapshot, or None if nothing has been published yet."""
+        signature = stat_signature(self.path)
+        with self._lock:
+            if signature is None:
+                return None
+            if self._snapshot is None or self._snapshot.signature != signature:
+                try:
+                    with open(self.path, 'rb') as f:
+                        self._snapshot = Snapshot(f)
+                except FileNotFoundError:
+                    return None
+                except (ValueError, struct.error):
+                    # Another format, or cut short: the next publish replaces it
+                    return None
+                self.maps += 1
+            return self._snapshot
+
+    def publish(self, head, rooms, token=None, source=None):
+        """Writes ``rooms`` (in display order) as the next version and returns its Snapshot.
+
+        ``token(room_id)`` may return a value that changes whenever the room
+        does; rooms whose token matches the last publish reuse their encoded
+        JSON. ``source`` is the signature of the YAML file this document was
+        written to, if it has been.
+        """
+        head = encode(head)
+        encoded = {}
+        for room in rooms:
+            room_id = room['id']
+            key = token(room_id) if token is not None else None
+            cached = self._encoded.get(room_id)
+            if key is not None and cached is not None and cached[0] == key:
+                encoded[room_id] = cached
+            else:
+                encoded[room_id] = (key, *encode_room(room))
+        self._encoded = encoded
+
+        room_ids = [room_id.encode() for room_id in encoded]
+        tasks = sorted((task_id.encode(), number, offset, length)
+                       for number, (_, _, spans) in enumerate(encoded.values())
+                       for task_id, offset, length in spans)
+        ids_at = HEADER.size + len(head) + ROOM.size * len(room_ids) + TASK.size * len(tasks)
+        data_at = ids_at + sum(map(len, room_ids)) + sum(len(task[0]) for task in tasks)
+        table = []
+        room_offsets = []
+        position, offset = ids_at, data_at
+        for room_id, (_, blob, _) in zip(room_ids, encoded.values()):
+            table.append(ROOM.pack(position, len(room_id), offset, len(blob), zlib.crc32(blob)))
+            room_offsets.append(offset)
+            position += len(room_id)
+            offset += len(blob)
+        for task_id, number, task_offset, length in tasks:
+            table.append(TASK.pack(position, len(task_id), room_offsets[number] + task_offset, length, number))
+            position += len(task_id)
+
+        directory = os.path.dirname(os.path.abspath(self.path))
+        with open(self.path + '.lock', 'a') as lock:
+            # Publishers in other processes take turns so versions only go up
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            version = self._published_version() + 1
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-', suffix='.snapshot')
+            try:
+                with os.fdopen(fd, 'w+b') as f:
+                    f.write(HEADER.pack(MAGIC, version, len(head), len(room_ids), len(tasks), *(source or (0, 0, 0))))
+                    f.write(head)
+                    f.writelines(table)
+                    f.writelines(room_ids)
+                    f.writelines(task[0] for task in tasks)
+                    f.writelines(blob for _, blob, _ in encoded.values())
+                    f.flush()
+                    os.replace(tmp_path, self.path)
+                    snapshot = Snapshot(f)
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.unlink(tmp_path)
+                raise
+        with self._lock:
+            self._snapshot = snapshot
+            self.publishes += 1
+        return snapshot
+
+    def stats(self):
+        snapshot = self._snapshot
+        return {
+            'version': snapshot.version if snapshot else 0,
+            'publishes': self.publishes,
+            'maps': self.maps,
+        }
+
+    def _published_version(self):
+        try:
+            with open(self.path, 'rb') as f:
+                header = f.read(HEADER.size)
+        except FileNotFoundError:
+            return 0
+        if len(header) < HEADER.size or header[:len(MAGIC)] != MAGIC:
+            return 0
+        return HEADER.unpack(header)[1]
@@ -0,0 +1,241 @@
+"""In-memory copy of a YAML data file, kept fresh by a file watcher."""
+import atexit
+import io
+import os
+import tempfile
+import threading
+import weakref
+
+import yaml
+
+from filewatch import FileWatcher, stat_signature
+from schema import load_yaml
+
+_stores = weakref.WeakSet()
+
+
+class YamlStore:
+    """Holds the parsed document for ``path`` and reloads it only when the file changes.
+
+    Requests read from memory; hand edits to the file are picked up by the
+    watcher thread. Writes made through ``save`` are recognised by their stat
+    signature so they do not trigger a reload of our own output.
+
+    With ``flush_interval`` (seconds) set, saves are write-behind: they only
+    mark the document dirty and a writer thread flushes it every
+    ``flush_interval`` seconds, or as soon as ``flush_every`` saves have piled
+    up. ``save(data, sync=True)`` still writes before returning.
+
+    A flush serialises the document under ``lock`` but writes, syncs and
+    renames the file outside it, so readers and writers of the document
+    only wait for the dump, not the disk.
+    """
+
+    def __init__(self, path, default, dump=yaml.safe_dump, watch=True,
+                 flush_interval=None, flush_every=None):
+        self.path = path
+        self.default = default
+        self.dump = dump
+        self.watch = watch
+        self.flush_interval = flush_interval
+        self.flush_every = flush_every
+        self.lock = threading.RLock()
+        self.version = 0
+        self._data = None
+        self._signature = None
+        self._watcher = None
+        self._listeners = []
+        self._pending = 0
+        # Saves so far, and the latest of them on disk and in _signature
+        self._saves = 0
+        self._written = 0
+        self._signed = 0
+        # Held while a temp file is written and renamed; never while taking ``lock``
+        self._file_lock = threading.Lock()
+        self._wake = threading.Condition(self.lock)
+        self._writer = None
+        self._closing = False
+        _stores.add(self)
+
+    @property
+    def loaded(self):
+        return self._data is not None
+
+    @property
+    def dirty(self):
+        return self._pending > 0
+
+    def load(self):
+        """Returns the live document, reading the file on first use."""
+        with self.lock:
+            if self._data is None:
+                self._data = self._read()
+            if self.watch and self._watcher is None:
+                self._watcher = FileWatcher(self.path, self._file_changed).start()
+            return self._data
+
+    def reload(self):
+        """Re-reads the file unconditionally, dropping any unflushed changes."""
+        with self.lock:
+            self._data = self._read()
+            self._pending = 0
+            self._changed(reloaded=True)
+            return self._data
+
+    def replace(self, data):
+        """Swaps in a document known to match the file, without reading or writing it."""
+        with self.lock:
+            self._data = data
+            self._signature = stat_signature(self.path)
+            self._changed(reloaded=True)
+
+    def save(self, data, sync=False):
+        """Replaces the document and writes it to disk, now or from the writer thread."""
+        with self.lock:
+            self._data = data
+            self._pending += 1
+            self._saves += 1
+            if sync or not self.flush_interval:
+                # Listeners see the file already written
+                self.flush()
+                self._changed(reloaded=False)
+                return
+            self._changed(reloaded=False)
+            self._start_writer()
+            if self.flush_every and self._pending >= self.flush_every:
+                self._wake.notify()
+
+    def flush(self):
+        """Atomically writes the document if there are unsaved changes."""
+        with self.lock:
+            if not self._pending:
+                return
+            buffer = io.StringIO()
+            self.dump(self._data, buffer)
+            saves = self._saves
+        with self._file_lock:
+            # A flush that started later may already have written a newer copy
+            if saves <= self._written:
+                return
+            directory = os.path.dirname(os.path.abspath(self.path))
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-', suffix='.yaml')
+            try:
+                with os.fdopen(fd, 'w') as f:
+                    os.chmod(tmp_path, self._file_mode())
+                    f.write(buffer.getvalue())
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, self.path)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+            self._written = saves
+            signature = stat_signature(self.path)
+        with self.lock:
+            if saves > self._signed:
+                self._signature = signature
+                self._signed = saves
+            # Saves made while the file was being written are still pending
+            self._pending = min(self._pending, self._saves - saves)
+
+    def subscribe(self, listener):
+        """Registers ``listener(store, reloaded)`` to run after every save or reload.
+
+        ``reloaded`` is true when the document was re-read from disk, so any
+        state derived from the old document should be thrown away.
+        """
+        self._listeners.append(listener)
+
+    def close(self):
+        """Stops the background threads after writing out anything still pending."""
+        with self.lock:
+            self._closing = True
+            self._wake.notify()
+        if self._writer is not None:
+            self._writer.join()
+            self._writer = None
+        self.flush()
+        if self._watcher is not None:
+            self._watcher.stop()
+            self._watcher = None
+
+    def _after_fork(self):
+        # Only the forking thread survives in the child: start over with fresh
+        # locks and let load()/save() bring the background threads back.
+        self.lock = threading.RLock()
+        self._file_lock = threading.Lock()
+        self._wake = threading.Condition(self.lock)
+        self._writer = None
+        if self._watcher is not None:
+            self._watcher.detach()
+            self._watcher = None
+
+    def _start_writer(self):
+        if self._writer is None:
+            # A store used again after close() gets a fresh writer
+            self._closing = False
+            self._writer = threading.Thread(target=self._write_behind, name='store-writer', daemon=True)
+            self._writer.start()
+
+    def _write_behind(self):
+        closing = False
+        while not closing:
+            with self.lock:
+                if not self._closing:
+                    self._wake.wait(self.flush_interval)
+                closing = self._closing
+            self.flush()
+
+    def _file_mode(self):
+        try:
+            return os.stat(self.path).st_mode & 0o777
+        except FileNotFoundError:
+            umask = os.umask(0)
+            os.umask(umask)
+            return 0o666 & ~umask
+
+    def _read(self):
+        signature = stat_signature(self.path)
+        if signature is None:
+            data = self.default()
+        else:
+            with open(self.path, 'r') as f:
+                data = load_yaml(f) or self.default()
+        self._signature = signature
+        return data
+
+    def _file_changed(self):
+        with self.lock:
+            if self._pending or stat_signature(self.path) == self._signature:
+                # Unflushed changes win over an outside edit; they will overwrite it shortly.
+                return
+            try:
+                data = self._read()
+            except yaml.YAMLError:
+                # Probably caught the file half-written; the next event will retry.
+                return
+            self._data = data
+            self._changed(reloaded=True)
+
+    def _changed(self, reloaded):
+        self.version += 1
+        for listener in self._listeners:
+            listener(self, reloaded)
+
+
+# Write out what the writer threads still hold; one handler for every store,
+# so closed and collected ones are not kept around until exit
+@atexit.register
+def _close_all():
+    for store in list(_stores):
+        if store._writer is not None:
+            store.close()
+
+
+def _reset_after_fork():
+    for store in list(_stores):
+        store._after_fork()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,54 @@
+import pytest
+
+from household import Household, sample_data
+from store import YamlStore
+
+
+@pytest.fixture
+def household(tmp_path):
+    household = Household(YamlStore(str(tmp_path / 'chores.yaml'), default=sample_data, watch=False))
+    household.load()
+    return household
+
+
+def history_lengths(household):
+    return [len(task['history']) for _, task in household.tasks_by_id.values()]
+
+
+@pytest.mark.parametrize('select', [{'roomid': 'x'}, {'bogus': 1}, 'x', {}, {'all': False}])
+def test_bulk_complete_rejects_bad_selectors(household, select):
+    with pytest.raises(ValueError):
+        household.bulk_complete({'select': select})
+    assert history_lengths(household) == [0, 0, 0]
+
+
+def test_bulk_complete_all_needs_saying(household):
+    assert household.bulk_complete({'select': {'all': True}}) == 3
+    assert history_lengths(household) == [1, 1, 1]
+
+
+@pytest.mark.parametrize('changes', [{'nmae': 'Scrub'}, {'name': 'Scrub', 'room_id': 'x'}, {}, ['name']])
+def test_bulk_update_rejects_unknown_fields(household, changes):
+    with pytest.raises(ValueError) as e:
+        household.bulk_update({'select': {'all': True}, 'set': changes})
+    if isinstance(changes, dict) and changes:
+        assert 'unsupported set field' in str(e.value)
+    names = [task['name'] for _, task in household.tasks_by_id.values()]
+    assert 'Scrub' not in names
+
+
+def test_bulk_update_sets_known_fields(household):
+    assert household.bulk_update({'select': {'all': True}, 'set': {'name': 'Scrub'}}) == 3
+    assert [task['name'] for _, task in household.tasks_by_id.values()] == ['Scrub'] * 3
+
+
+def test_bulk_complete_typo_is_a_400(tmp_path, monkeypatch):
+    import app
+
+    client = app.app.test_client()
+    monkeypatch.setattr(app.tenancy, 'default', Household(
+        YamlStore(str(tmp_path / 'chores.yaml'), default=sample_data, watch=False)))
+    response = client.post('/bulk_complete', json={'select': {'roomid': 'x'}})
+    assert response.status_code == 400
+    assert "unknown select key 'roomid'" in response.get_json()['error']
+    assert history_lengths(app.current_household()) == [0, 0, 0]
@@ -0,0 +1,110 @@
+import itertools
+from datetime import datetime, timedelta
+
+import pytest
+
+from household import Household
+from schema import SCHEMA_VERSION
+from store import YamlStore
+
+NOW = datetime(2026, 3, 4, 12, 0)
+
+
+def document():
+    # Tasks sharing due times (ties), already due, never done, one-off and repeat rules
+    tasks = []
+    for n in range(40):
+        frequency = (1, 2, 3, 7, None)[n % 5]
+        if n % 4 == 0:
+            history = []
+        else:
+            history = [(NOW - timedelta(days=n % 6, hours=(n % 3) * 5)).isoformat()]
+        tasks.append({'id': 't%02d' % n, 'name': 'Task %d' % n, 'frequency_days': frequency,
+                      'assigned_to': 'm%d' % (n % 2), 'history': history})
+    tasks.append({'id': 'rule', 'name': 'Bins', 'frequency_days': None, 'repeat': 'FREQ=WEEKLY;BYDAY=MO,TH',
+                  'assigned_to': 'm0', 'history': [(NOW - timedelta(days=1)).isoformat()]})
+    return {
+        'schema': SCHEMA_VERSION,
+        'members': [{'id': 'm0', 'name': 'Alice'}, {'id': 'm1', 'name': 'Bob'}],
+        'rooms': [{'id': 'r1', 'name': 'House', 'frequency_days': 7, 'assigned_to': None, 'order': 'M',
+                   'tasks': tasks}],
+    }
+
+
+@pytest.fixture
+def household(tmp_path):
+    household = Household(YamlStore(str(tmp_path / 'chores.yaml'), default=document, watch=False))
+    household.load()
+    return household
+
+
+def occurrences(household, days, person=None, limit=1000):
+    """Every (date, task id) over all pages, following the cursors."""
+    found = []
+    after = None
+    for _ in range(1000):
+        page = household.forecast(days, person, now=NOW, limit=limit, after=after)
+        found.extend((day['date'], task_id) for day in page['days'] for task_id in day['task_ids'])
+        after = page['next']
+        if after is None:
+            return found
+    raise AssertionError('forecast pages never ended')
+
+
+def expected(household, days):
+    """The frequency tasks' occurrences, worked out one task at a time."""
+    found = []
+    for _, task in household.tasks_by_id.values():
+        if task.get('repeat') or task['history'] and not task['frequency_days']:
+            continue
+        if not task['history']:
+            day = 0
+        else:
+            due = datetime.fromisoformat(task['history'][-1]) + timedelta(days=task['frequency_days'])
+            day = 0 if due <= NOW else (due.date() - NOW.date()).days
+        step = task['frequency_days'] or days
+        found.extend(((NOW.date() + timedelta(days=d)).isoformat(), task['id']) for d in range(day, days, step))
+    return sorted(found)
+
+
+@pytest.mark.parametrize('days', [1, 7, 30])
+@pytest.mark.parametrize('limit', [1, 3, 50])
+def test_pages_join_up_to_the_whole_forecast(household, days, limit):
+    whole = household.forecast(days, now=NOW, limit=10000)
+    assert whole['next'] is None
+    everything = [(day['date'], task_id) for day in whole['days'] for task_id in day['task_ids']]
+    assert occurrences(household, days, limit=limit) == everything
+    assert sorted(pair for pair in everything if pair[1] != 'rule') == expected(household, days)
+    bins = [datetime.fromisoformat(date).date() for date, task_id in everything if task_id == 'rule']
+    assert all(date.weekday() in (0, 3) for date in bins)
+    assert len(bins) == sum(1 for d in range(1, days) if (NOW + timedelta(days=d)).weekday() in (0, 3))
+
+
+def test_due_tasks_come_first_and_once(household):
+    page = household.forecast(7, now=NOW, limit=10000)
+    today = page['days'][0]['task_ids']
+    due_now = [task_id for task_id, task in page['tasks'].items() if task['due_now']]
+    assert today[:len(due_now)] == sorted(due_now, key=lambda task_id: (
+        household.next_due_index.time_of(task_id), task_id))
+    for day in page['days']:
+        assert len(set(day['task_ids'])) == len(day['task_ids'])
+
+
+def test_page_lists_only_its_own_days_and_tasks(household):
+    first = household.forecast(30, now=NOW, limit=5)
+    assert sum(len(day['task_ids']) for day in first['days']) == 5
+    assert set(first['tasks']) == set(itertools.chain.from_iterable(day['task_ids'] for day in first['days']))
+    second = household.forecast(30, now=NOW, limit=5, after=first['next'])
+    assert second['days'][0]['date'] >= first['days'][-1]['date']
+
+
+def test_person_filter_pages(household):
+    mine = occurrences(household, 14, 'Bob', limit=4)
+    everyone = occurrences(household, 14)
+    assert mine == [pair for pair in everyone if household.tasks_by_id[pair[1]][1]['assigned_to'] == 'm1']
+
+
+@pytest.mark.parametrize('kwargs', [{'after': 'not a cursor'}, {'limit': 0}, {'limit': 10001}, {'days': 0}])
+def test_bad_paging_arguments(household, kwargs):
+    with pytest.raises(ValueError):
+        household.forecast(**{'days': 7, **kwargs}, now=NOW)
@@ -0,0 +1,73 @@
+import pytest
+
+from household import Household, sample_data
+from store import YamlStore
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    import app
+
+    monkeypatch.setattr(app.tenancy, 'default', Household(
+        YamlStore(str(tmp_path / 'chores.yaml'), default=sample_data, watch=False)))
+    return app.app.test_client()
+
+
+def first_task(client):
+    room = client.get('/data').get_json()['rooms'][0]
+    return room['id'], room['tasks'][0]['id']
+
+
+def history(client, task_id):
+    return [task for room in client.get('/data').get_json()['rooms']
+            for task in room['tasks'] if task['id'] == task_id][0]['history']
+
+
+def test_refused_keys_do_not_run(client, monkeypatch):
+    import app
+
+    monkeypatch.setattr(app.idempotency, 'refused', 'one worker only')
+    room_id, task_id = first_task(client)
+    response = client.post('/complete_task', json={'room_id': room_id, 'task_id': task_id, 'completed': True},
+                           headers={'Idempotency-Key': 'k1'})
+    assert response.status_code == 400
+    assert response.get_json()['error'] == 'one worker only'
+    assert history(client, task_id) == []
+    response = client.post('/complete_task', json={'room_id': room_id, 'task_id': task_id, 'completed': True})
+    assert response.status_code == 200
+    assert len(history(client, task_id)) == 1
+
+
+def test_retry_replays_without_running_again(client):
+    room_id, task_id = first_task(client)
+    body = {'room_id': room_id, 'task_id': task_id, 'completed': True}
+    first = client.post('/complete_task', json=body, headers={'Idempotency-Key': 'k1'})
+    retry = client.post('/complete_task', json=body, headers={'Idempotency-Key': 'k1'})
+    assert retry.status_code == first.status_code == 200
+    assert retry.data == first.data
+    assert retry.headers['Idempotent-Replayed'] == 'true'
+    assert 'Idempotent-Replayed' not in first.headers
+    assert len(history(client, task_id)) == 1
+
+
+def test_key_reused_with_another_body_is_refused(client):
+    room_id, task_id = first_task(client)
+    body = {'room_id': room_id, 'task_id': task_id, 'completed': True}
+    client.post('/complete_task', json=body, headers={'Idempotency-Key': 'k1'})
+    response = client.post('/complete_task', json={**body, 'completed': False}, headers={'Idempotency-Key': 'k1'})
+    assert response.status_code == 422
+    assert len(history(client, task_id)) == 1
+
+
+def test_streamed_import_replay_compares_the_body(client):
+    row = b'{"room": "Hall", "task": "Sweep"}\n'
+    headers = {'Idempotency-Key': 'import-1', 'Content-Type': 'application/x-ndjson'}
+    first = client.post('/import', data=row, headers=headers)
+    assert first.status_code == 200 and first.get_json()['tasks'] == 1
+    retry = client.post('/import', data=row, headers=headers)
+    assert retry.headers['Idempotent-Replayed'] == 'true'
+    assert retry.get_json() == first.get_json()
+    other = client.post('/import', data=row.replace(b'Sweep', b'Mop'), headers=headers)
+    assert other.status_code == 422
+    names = [task['name'] for room in client.get('/data').get_json()['rooms'] for task in room['tasks']]
+    assert names.count('Sweep') == 1 and 'Mop' not in names
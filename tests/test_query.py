@@ -0,0 +1,65 @@
+import pytest
+
+from household import Household
+from schema import SCHEMA_VERSION
+from store import YamlStore
+
+# Effort counts as 1 when a task has none; one-off tasks have no frequency
+VALUES = {'frequency': lambda task: task['frequency_days'], 'effort': lambda task: task.get('effort') or 1}
+
+
+def document():
+    # Few distinct values, so most tasks tie with others, and some missing ones
+    rooms = []
+    for r in range(3):
+        tasks = [{'id': 'r%dt%02d' % (r, n), 'name': 'Task %d' % n, 'frequency_days': (1, 7, 7, None, 3)[n % 5],
+                  'effort': (None, 1, 2, 2)[(n + r) % 4], 'assigned_to': None, 'history': []}
+                 for n in range(40)]
+        rooms.append({'id': 'r%d' % r, 'name': 'Room %d' % r, 'frequency_days': 7, 'assigned_to': None,
+                      'order': 'CMU'[r], 'tasks': tasks})
+    return {'schema': SCHEMA_VERSION, 'members': [], 'rooms': rooms}
+
+
+@pytest.fixture(scope='module')
+def household(tmp_path_factory):
+    household = Household(YamlStore(str(tmp_path_factory.mktemp('query') / 'chores.yaml'),
+                                    default=document, watch=False))
+    household.load()
+    return household
+
+
+def reference(household, sort):
+    """Task ids fully sorted: missing frequencies last in either direction, ties in page order."""
+    def key(task):
+        parts = []
+        for term in sort:
+            field, _, direction = term.partition(' ')
+            value = VALUES[field](task)
+            parts.append((value is None, 0 if value is None else -value if direction == 'desc' else value))
+        return parts
+
+    page = [task for room in household.ordered_rooms() for task in room['tasks']]
+    return [task['id'] for task in sorted(page, key=key)]
+
+
+@pytest.mark.parametrize('sort', [['effort'], ['effort desc'], ['frequency desc', 'effort'],
+                                  ['effort', 'frequency desc'], ['frequency']])
+@pytest.mark.parametrize('limit', [1, 5, 17, 40, 119, 120, 500])
+def test_limit_takes_the_first_of_the_full_sort(household, sort, limit):
+    result = household.query({'sort': sort, 'limit': limit})
+    assert result['total'] == 120
+    assert [task['id'] for task in result['tasks']] == reference(household, sort)[:limit]
+
+
+def test_limit_with_a_filter(household):
+    result = household.query('effort >= 2 sort by frequency desc limit 7')
+    expected = [task_id for task_id in reference(household, ['frequency desc'])
+                if household.tasks_by_id[task_id][1]['effort'] == 2]
+    assert result['total'] == len(expected)
+    assert [task['id'] for task in result['tasks']] == expected[:7]
+
+
+@pytest.mark.parametrize('limit', [1, 7, 120])
+def test_limit_without_sort_keeps_page_order(household, limit):
+    result = household.query({'limit': limit})
+    assert [task['id'] for task in result['tasks']] == reference(household, [])[:limit]
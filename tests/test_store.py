@@ -0,0 +1,46 @@
+import os
+import threading
+
+import pytest
+
+import store
+from store import YamlStore
+
+
+def test_flush_syncs_the_file_outside_the_lock(tmp_path, monkeypatch):
+    yaml_store = YamlStore(str(tmp_path / 'chores.yaml'), default=dict, watch=False, flush_interval=60)
+    fsync = os.fsync
+    lock_free = []
+
+    def checked_fsync(fd):
+        def take_lock():
+            if yaml_store.lock.acquire(timeout=1):
+                lock_free.append(True)
+                yaml_store.lock.release()
+
+        other = threading.Thread(target=take_lock)
+        other.start()
+        other.join()
+        fsync(fd)
+
+    monkeypatch.setattr(store.os, 'fsync', checked_fsync)
+    yaml_store.save({'rooms': []})
+    assert yaml_store.dirty
+    yaml_store.flush()
+    assert lock_free == [True]
+    assert not yaml_store.dirty
+    yaml_store.close()
+    assert YamlStore(yaml_store.path, default=dict, watch=False).load() == {'rooms': []}
+
+
+def test_failed_flush_leaves_no_temp_file(tmp_path, monkeypatch):
+    yaml_store = YamlStore(str(tmp_path / 'chores.yaml'), default=dict, watch=False)
+
+    def chmod(path, mode):
+        raise PermissionError(path)
+
+    monkeypatch.setattr(store.os, 'chmod', chmod)
+    with pytest.raises(PermissionError):
+        yaml_store.save({'rooms': []})
+    assert os.listdir(tmp_path) == []
+    assert yaml_store.dirty
@@ -0,0 +1,65 @@
+import json
+
+import pytest
+
+from household import Household, sample_data
+from schema import empty_document
+from store import YamlStore
+from transfer import Importer, export_stream, import_stream, iter_lines, parse_rows
+
+
+@pytest.fixture
+def household(tmp_path):
+    household = Household(YamlStore(str(tmp_path / 'chores.yaml'), default=sample_data, watch=False))
+    household.load()
+    return household
+
+
+def ndjson(*rows):
+    return [b''.join((row if isinstance(row, str) else json.dumps(row)).encode() + b'\n' for row in rows)]
+
+
+def task_names(household):
+    return sorted(task['name'] for _, task in household.tasks_by_id.values())
+
+
+@pytest.mark.parametrize('row', [
+    {'room': 'Hall', 'task': 'Sweep', 'history': ['2025-01-01T00:00:00+00:00']},
+    {'room': 'Hall', 'task': 'Sweep', 'history': ['yesterday']},
+    {'room': 'Hall', 'task': 'Sweep', 'frequency': 'fortnightly-ish'},
+    {'task': 'Sweep'},
+    '{"room": "Hall"',
+])
+def test_import_rejects_bad_rows_without_touching_the_household(household, row):
+    before = task_names(household)
+    report = import_stream(household, ndjson(row, {'room': 'Hall', 'task': 'Mop'}))
+    assert report['rejected'] == 1
+    assert report['errors'][0]['line'] == 1
+    assert report['tasks'] == 1
+    assert task_names(household) == sorted(before + ['Mop'])
+    assert json.loads(household.render_data())['rooms'][-1]['name'] == 'Hall'
+
+
+def test_import_joins_a_room_by_name_when_its_id_is_unknown(household):
+    report = import_stream(household, ndjson({'room_id': 'nowhere', 'room': 'Kitchen', 'task': 'Mop'}))
+    assert report['rooms'] == 0 and report['tasks'] == 1
+    assert [room['name'] for room in household.load()['rooms']] == ['Kitchen', 'Living Room']
+    assert 'Mop' in [task['name'] for task in household.load()['rooms'][0]['tasks']]
+
+
+def test_import_streams_rows_split_across_chunks(household):
+    body = b''.join(ndjson(*({'room': 'Room %d' % (n % 3), 'task': 'Task %d' % n, 'frequency': 'daily',
+                              'assigned_to': 'Carol', 'history': ['2025-01-0%dT08:00:00' % (n % 9 + 1)]}
+                             for n in range(50))))
+    chunks = [body[offset:offset + 7] for offset in range(0, len(body), 7)]
+    report = Importer(household, chunk_rows=8).run(parse_rows(iter_lines(chunks)))
+    assert (report['rows'], report['rooms'], report['tasks'], report['members']) == (50, 3, 50, 1)
+    assert len(task_names(household)) == 53
+
+
+def test_csv_export_imports_back(household, tmp_path):
+    exported = b''.join(export_stream(household, 'csv'))
+    copy = Household(YamlStore(str(tmp_path / 'copy.yaml'), default=empty_document, watch=False))
+    report = import_stream(copy, [exported], 'csv')
+    assert report['rejected'] == 0
+    assert b''.join(export_stream(copy, 'csv')) == exported
@@ -0,0 +1,97 @@
+"""Hierarchical timing wheel of keyed timers."""
+import math
+import time
+
+# Slots per level as a power of two; every level is SLOTS times as coarse as the one below
+BITS = 6
+SLOTS = 1 << BITS
+MASK = SLOTS - 1
+# Seven levels of one-second ticks reach past a hundred thousand years
+LEVELS = 7
+
+
+class TimingWheel:
+    """Timers keyed by any hashable, with O(1) ``schedule`` and ``cancel``.
+
+    Time is counted in ticks of ``resolution`` seconds. Level ``n`` has
+    SLOTS slots, each SLOTS**n ticks wide. A timer sits in the lowest level
+    whose span covers its distance from the current tick, and drops a level
+    each time the level below wraps around, so ``advance`` only ever looks
+    at one slot per level per tick, and skips straight to the next wrap of
+    the lowest occupied level. Timers fire on the first tick at or after
+    their time, up to ``resolution`` late.
+    """
+
+    def __init__(self, resolution=1.0, now=None, levels=LEVELS):
+        self.resolution = resolution
+        self._tick = math.floor((time.time() if now is None else now) / resolution)
+        self._levels = [[{} for _ in range(SLOTS)] for _ in range(levels)]
+        self._counts = [0] * levels
+        # key -> (level, slot dict) holding it
+        self._slots = {}
+
+    def __len__(self):
+        return len(self._slots)
+
+    def __contains__(self, key):
+        return key in self._slots
+
+    def schedule(self, key, when):
+        """Sets ``key`` to fire at ``when`` (seconds since the epoch), replacing any earlier timer."""
+        self.cancel(key)
+        self._place(key, max(math.ceil(when / self.resolution), self._tick + 1))
+
+    def cancel(self, key):
+        entry = self._slots.pop(key, None)
+        if entry is not None:
+            level, slot = entry
+            del slot[key]
+            self._counts[level] -= 1
+
+    def advance(self, now):
+        """Moves the wheel up to ``now`` and returns the keys whose timers fired."""
+        target = math.floor(now / self.resolution)
+        fired = []
+        while self._tick < target and self._slots:
+            lowest = 0
+            while not self._counts[lowest]:
+                lowest += 1
+            if lowest:
+                span = 1 << (BITS * lowest)
+                self._tick = max(self._tick, min((self._tick // span + 1) * span - 1, target))
+                if self._tick == target:
+                    break
+            self._tick += 1
+            tick = self._tick
+            # Each level that the one below has just wrapped around hands
+            # its current slot down
+            level = 1
+            while level < len(self._levels) and not tick & ((1 << (BITS * level)) - 1):
+                self._cascade(level, (tick >> (BITS * level)) & MASK)
+                level += 1
+            slot = self._levels[0][tick & MASK]
+            if slot:
+                self._levels[0][tick & MASK] = {}
+                self._counts[0] -= len(slot)
+                for key in slot:
+                    del self._slots[key]
+                fired.extend(slot)
+        # Nothing left to fire on the ticks in between
+        self._tick = max(self._tick, target)
+        return fired
+
+    def _cascade(self, level, index):
+        slot = self._levels[level][index]
+        if slot:
+            self._levels[level][index] = {}
+            self._counts[level] -= len(slot)
+            for key, expiry in slot.items():
+                self._place(key, expiry)
+
+    def _place(self, key, expiry):
+        distance = expiry - self._tick
+        level = min(max(distance.bit_length() - 1, 0) // BITS, len(self._levels) - 1)
+        slot = self._levels[level][(expiry >> (BITS * level)) & MASK]
+        slot[key] = expiry
+        self._slots[key] = (level, slot)
+        self._counts[level] += 1
@@ -0,0 +1,223 @@
+"""Completions per day, week and month, as fixed-size rings of buckets.
+
+Every series (one overall, one per room, one per member) keeps three
+rings: the last DAYS days, WEEKS weeks (Monday to Sunday) and MONTHS
+calendar months. A completion is counted into its day, week and month at
+once, so the coarser buckets are always the rollup of the finer ones and
+outlive them. A ring only remembers the latest period written to it and
+clears the slots it passes over when a later one comes in, so nothing ever
+grows with history. Reading a range touches one slot per period returned.
+
+Writes land in the rings in any order with the same result, so they are
+first gathered per series and day (PENDING_LIMIT at most) and applied on
+the next read. Loading a household writes each day once per series rather
+than once per completion.
+
+CompletionSeries is fed task by task like LatenessStats (see lateness.py):
+a new completion adds one count, any other change to a task's history
+recounts that task alone, and a reassignment moves its counts between
+member series. Completions count towards the task's current room and
+assignee.
+"""
+from array import array
+from datetime import date
+
+# How many periods of each resolution a series remembers
+DAYS = 731
+WEEKS = 261
+MONTHS = 120
+RESOLUTIONS = ('day', 'week', 'month')
+# Completions gathered before they are written to the rings anyway
+PENDING_LIMIT = 100000
+
+
+# Period number of a day at each resolution, and the first day of a period
+def period(resolution, day):
+    if resolution == 'day':
+        return day.toordinal()
+    if resolution == 'week':
+        # date.fromordinal(1) is a Monday
+        return (day.toordinal() - 1) // 7
+    return day.year * 12 + day.month - 1
+
+
+def period_start(resolution, number):
+    if resolution == 'day':
+        return date.fromordinal(number)
+    if resolution == 'week':
+        return date.fromordinal(number * 7 + 1)
+    return date(number // 12, number % 12 + 1, 1)
+
+
+class BucketRing:
+    """Counts for the latest ``size`` periods written, in a ring of slots."""
+
+    __slots__ = ('counts', 'head')
+
+    def __init__(self, size):
+        self.counts = array('i', bytes(4 * size))
+        # The latest period written, None until the first
+        self.head = None
+
+    def add(self, number, count=1):
+        size = len(self.counts)
+        if self.head is None:
+            self.head = number
+        elif number > self.head:
+            # Clear the slots the newer periods take over
+            for passed in range(max(self.head + 1, number - size + 1), number + 1):
+                self.counts[passed % size] = 0
+            self.head = number
+        elif number <= self.head - size:
+            return
+        self.counts[number % size] += count
+
+    def get(self, number):
+        if self.head is None or number > self.head or number <= self.head - len(self.counts):
+            return 0
+        return self.counts[number % len(self.counts)]
+
+
+class Series:
+    """One ring per resolution."""
+
+    __slots__ = ('day', 'week', 'month')
+
+    def __init__(self):
+        self.day = BucketRing(DAYS)
+        self.week = BucketRing(WEEKS)
+        self.month = BucketRing(MONTHS)
+
+    def add(self, periods, count=1):
+        """Counts ``count`` completions on the day whose ``(day, week, month)`` numbers are ``periods``."""
+        day, week, month = periods
+        self.day.add(day, count)
+        self.week.add(week, count)
+        self.month.add(month, count)
+
+
+class CompletionSeries:
+    """Completion counts overall, per room and per member, kept up to date task by task.
+
+    ``update(task_id, room_id, member_id, task)`` is called whenever a task
+    may have changed and ``remove(task_id)`` when it goes.
+    """
+
+    def __init__(self):
+        self.overall = Series()
+        self.rooms = {}
+        self.members = {}
+        # The latest day counted anywhere, as an ordinal
+        self.latest = 0
+        # task id -> (room id, member id, history key, day ordinals)
+        self._tasks = {}
+        # Series -> {day ordinal: count} not yet written to it
+        self._pending = {}
+        self._pending_count = 0
+
+    def update(self, task_id, room_id, member_id, task):
+        history = task.get('history') or ()
+        key = (len(history), history[-1] if history else None)
+        entry = self._tasks.get(task_id)
+        if entry is None or entry[0] != room_id:
+            self.remove(task_id)
+            days = array('i', map(_day, history))
+            self._add(room_id, member_id, days)
+        else:
+            _, old_member, old_key, days = entry
+            if old_member != member_id:
+                self._add_member(old_member, days, -1)
+                self._add_member(member_id, days)
+            if key == old_key:
+                pass
+            elif key[0] == old_key[0] + 1 and (not old_key[0] or history[-2] == old_key[1]):
+                # One completion added at the end
+                added = array('i', [_day(history[-1])])
+                days.extend(added)
+                self._add(room_id, member_id, added)
+            else:
+                self._add(room_id, member_id, days, -1)
+                days = array('i', map(_day, history))
+                self._add(room_id, member_id, days)
+        self._tasks[task_id] = (room_id, member_id, key, days)
+
+    def remove(self, task_id):
+        entry = self._tasks.pop(task_id, None)
+        if entry is not None:
+            self._add(entry[0], entry[1], entry[3], -1)
+
+    def room(self, room_id):
+        self.flush()
+        return self.rooms.get(room_id)
+
+    def member(self, member_id):
+        self.flush()
+        return self.members.get(member_id)
+
+    def flush(self):
+        """Writes the gathered completions to the rings."""
+        periods = {}
+        for series, days in self._pending.items():
+            for day, count in days.items():
+                if count:
+                    if day not in periods:
+                        periods[day] = _periods(day)
+                    series.add(periods[day], count)
+        self._pending = {}
+        self._pending_count = 0
+
+    def window(self, resolution, start, end, today):
+        """Period numbers from ``start`` to ``end`` (days) that every series still remembers.
+
+        The rings reach back from today or the latest completion counted,
+        whichever is later.
+        """
+        self.flush()
+        latest = period(resolution, max(today, date.fromordinal(self.latest or 1)))
+        size = {'day': DAYS, 'week': WEEKS, 'month': MONTHS}[resolution]
+        return range(max(period(resolution, start), latest - size + 1), min(period(resolution, end), latest) + 1)
+
+    @staticmethod
+    def counts(series, resolution, numbers):
+        """The counts of ``series`` (None for an empty one) over the period numbers ``numbers``."""
+        if series is None:
+            return [0] * len(numbers)
+        ring = getattr(series, resolution)
+        return [ring.get(number) for number in numbers]
+
+    def _add_member(self, member_id, days, count=1):
+        if not days:
+            return
+        if member_id not in self.members:
+            self.members[member_id] = Series()
+        self._gather(self.members[member_id], days, count)
+
+    def _add(self, room_id, member_id, days, count=1):
+        if not days:
+            return
+        if room_id not in self.rooms:
+            self.rooms[room_id] = Series()
+        if member_id not in self.members:
+            self.members[member_id] = Series()
+        self.latest = max(self.latest, max(days))
+        for series in (self.overall, self.rooms[room_id], self.members[member_id]):
+            self._gather(series, days, count)
+
+    def _gather(self, series, days, count):
+        pending = self._pending.get(series)
+        if pending is None:
+            pending = self._pending[series] = {}
+        for day in days:
+            pending[day] = pending.get(day, 0) + count
+        self._pending_count += len(days)
+        if self._pending_count > PENDING_LIMIT:
+            self.flush()
+
+
+def _day(completed):
+    return date.fromisoformat(completed[:10]).toordinal()
+
+
+def _periods(ordinal):
+    day = date.fromordinal(ordinal)
+    return ordinal, (ordinal - 1) // 7, day.year * 12 + day.month - 1
@@ -0,0 +1,326 @@
+"""Streaming import and export of app.py households as NDJSON or CSV.
+
+    python transfer.py export --format csv > household.csv
+    python transfer.py import --format csv household.csv
+
+Both formats carry one row per task (a room without tasks gets one row with
+the task columns empty)::
+
+    room_id, room, room_frequency, room_assigned_to,
+    task_id, task, frequency, assigned_to, history
+
+``history`` is a list of ISO timestamps in NDJSON and ``;``-separated in
+CSV. Frequencies are daily/weekly/monthly or "N days", empty for a one-off
+task; a task's may also be a repeat rule (see recurrence.py). Assignees are written as member names. On import, ``room_id`` and
+``task_id`` are optional: a row joins the room with its ``room_id`` or else
+the room of the same name, creating it if needed, and assignees nobody knows
+yet are added as members. Rows that fail validation are skipped and
+reported with their line number; the rest are applied ``CHUNK_ROWS`` at a
+time, one save per chunk, so readers get the store lock between chunks.
+Export holds the lock for one room at a time and never builds the whole
+document.
+"""
+import argparse
+import codecs
+import csv
+import io
+import json
+import os
+import sys
+import uuid
+from datetime import datetime
+
+from household import Household
+from schema import empty_document, frequency_name, parse_frequency, parse_schedule, schedule_name
+from store import YamlStore
+
+MIMETYPES = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv'}
+FIELDS = ['room_id', 'room', 'room_frequency', 'room_assigned_to',
+          'task_id', 'task', 'frequency', 'assigned_to', 'history']
+# Every chunk rewrites the whole YAML file, so chunks are large
+CHUNK_ROWS = 5000
+# Ids are drawn from the OS random source this many at a time
+ID_BATCH = 256
+# Rejected rows listed in an import report; the rest are only counted
+MAX_REPORTED_ERRORS = 100
+READ_SIZE = 64 * 1024
+
+
+class RowError(ValueError):
+    """An import row that cannot be applied."""
+
+
+def new_ids(batch=ID_BATCH):
+    """Yields random (version 4) UUID strings, reading the entropy for ``batch`` at once."""
+    while True:
+        entropy = os.urandom(16 * batch)
+        for offset in range(0, len(entropy), 16):
+            yield str(uuid.UUID(bytes=entropy[offset:offset + 16], version=4))
+
+
+def iter_lines(chunks, encoding='utf-8'):
+    """Turns an iterable of byte chunks into text lines, keeping line endings."""
+    decoder = codecs.getincrementaldecoder(encoding)()
+    pending = ''
+    for chunk in chunks:
+        pending += decoder.decode(chunk)
+        lines = pending.splitlines(keepends=True)
+        # The last piece may still be waiting for its newline
+        pending = lines.pop() if lines and not lines[-1].endswith(('\n', '\r')) else ''
+        yield from lines
+    pending += decoder.decode(b'', final=True)
+    if pending:
+        yield pending
+
+
+def read_chunks(stream, size=READ_SIZE):
+    return iter(lambda: stream.read(size), b'')
+
+
+# --- Export ---
+
+def export_rows(household):
+    """Yields one row dict per task, room by room in display order."""
+    with household.store.lock:
+        household.load()
+        room_ids = [room_id for _, room_id in household.room_order]
+    for room_id in room_ids:
+        with household.store.lock:
+            household.load()
+            room = household.find_room(room_id)
+            if room is None:
+                continue
+            head = {
+                'room_id': room['id'],
+                'room': room['name'],
+                'room_frequency': frequency_name(room['frequency_days']),
+                'room_assigned_to': household.member_name(room.get('assigned_to')),
+            }
+            rows = [{
+                **head,
+                'task_id': task['id'],
+                'task': task['name'],
+                'frequency': schedule_name(task),
+                'assigned_to': household.member_name(task.get('assigned_to')),
+                'history': list(task['history']),
+            } for task in room['tasks']]
+        yield from rows or [{**head, 'task_id': None, 'task': None, 'frequency': None,
+                             'assigned_to': None, 'history': []}]
+
+
+def export_stream(household, fmt='ndjson'):
+    """Yields the export as encoded chunks, one per room."""
+    if fmt == 'ndjson':
+        for row in export_rows(household):
+            yield (json.dumps(row) + '\n').encode()
+        return
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, FIELDS)
+    writer.writeheader()
+    for row in export_rows(household):
+        writer.writerow({**row, 'history': ';'.join(row['history'])})
+        if buffer.tell() >= READ_SIZE:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode()
+
+
+# --- Import ---
+
+def parse_rows(lines, fmt='ndjson'):
+    """Yields ``(line_number, row)`` with ``row`` a dict, or a RowError for lines that do not parse."""
+    if fmt == 'csv':
+        reader = csv.DictReader(lines)
+        for row in reader:
+            yield reader.line_num, row
+        return
+    for line_number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield line_number, RowError('invalid JSON: %s' % e)
+            continue
+        yield line_number, row if isinstance(row, dict) else RowError('expected a JSON object')
+
+
+class Importer:
+    """Applies parsed rows to a Household in chunks and keeps the running report."""
+
+    def __init__(self, household, chunk_rows=CHUNK_ROWS):
+        self.household = household
+        self.chunk_rows = chunk_rows
+        self.ids = new_ids()
+        # Rooms matched or created by name during this import
+        self.rooms_by_name = None
+        self.report = {'rows': 0, 'rooms': 0, 'tasks': 0, 'members': 0, 'rejected': 0, 'errors': []}
+
+    def run(self, numbered_rows, sync=False):
+        chunk = []
+        for item in numbered_rows:
+            chunk.append(item)
+            if len(chunk) >= self.chunk_rows:
+                self.apply(chunk)
+                chunk = []
+        self.apply(chunk, sync=sync, last=True)
+        return self.report
+
+    def apply(self, chunk, sync=False, last=False):
+        household = self.household
+        with household.store.lock:
+            data = household.load()
+            if self.rooms_by_name is None:
+                self.rooms_by_name = {room['name']: room for room in data['rooms']}
+            changed = False
+            for line_number, row in chunk:
+                self.report['rows'] += 1
+                try:
+                    if isinstance(row, RowError):
+                        raise row
+                    changed = self.apply_row(data, row) or changed
+                except RowError as e:
+                    self.report['rejected'] += 1
+                    if len(self.report['errors']) < MAX_REPORTED_ERRORS:
+                        self.report['errors'].append({'line': line_number, 'error': str(e)})
+            if changed:
+                household.save(data, sync=sync and last)
+            elif last and sync:
+                household.store.flush()
+
+    def apply_row(self, data, row):
+        household = self.household
+        room = self.room_for(row)
+        task = None
+        # Validate the whole row before anything is added to data or the indexes
+        if room is None:
+            room = {
+                'id': text(row, 'room_id') or next(self.ids),
+                'name': text(row, 'room'),
+                'frequency_days': valid_frequency(row, 'room_frequency', default='weekly'),
+                'assigned_to': None,
+                'order': None,
+                'tasks': []
+            }
+        if text(row, 'task'):
+            task_id = text(row, 'task_id')
+            if task_id and task_id in household.tasks_by_id:
+                raise RowError('task %r already exists' % task_id)
+            frequency_days, repeat = valid_schedule(row, 'frequency')
+            task = {
+                'id': task_id or next(self.ids),
+                'name': text(row, 'task'),
+                'frequency_days': frequency_days,
+                'assigned_to': None,
+                'history': valid_history(row.get('history'))
+            }
+            if repeat:
+                task['repeat'] = repeat
+        created = room['order'] is None
+        if created:
+            room['assigned_to'] = self.member(data, text(row, 'room_assigned_to'))
+        if task is not None:
+            task['assigned_to'] = self.member(data, text(row, 'assigned_to'))
+        if created:
+            household.insert_room(data, room)
+            self.rooms_by_name.setdefault(room['name'], room)
+            self.report['rooms'] += 1
+        if task is not None:
+            household.insert_task(room, task)
+            self.report['tasks'] += 1
+        return created or task is not None
+
+    def room_for(self, row):
+        rooms_by_id = self.household.rooms_by_id
+        room_id = text(row, 'room_id')
+        if room_id and room_id in rooms_by_id:
+            return rooms_by_id[room_id]
+        name = text(row, 'room')
+        if not name:
+            raise RowError('room name is required')
+        room = self.rooms_by_name.get(name)
+        if room is not None and rooms_by_id.get(room['id']) is not room:
+            # The file was reloaded between chunks
+            self.rooms_by_name = {room['name']: room for room in rooms_by_id.values()}
+            room = self.rooms_by_name.get(name)
+        return room
+
+    def member(self, data, value):
+        if not value:
+            return None
+        household = self.household
+        if value in household.members_by_id or value in household.member_ids_by_name:
+            return household.member_id(value)
+        self.report['members'] += 1
+        return household.insert_member(data, {'id': next(self.ids), 'name': value})['id']
+
+
+def text(row, field):
+    value = row.get(field)
+    return str(value).strip() if value not in (None, '') else ''
+
+
+def valid_frequency(row, field, default=None):
+    try:
+        return parse_frequency(text(row, field) or default)
+    except ValueError:
+        raise RowError('%s must be daily, weekly, monthly or a number of days' % field)
+
+
+def valid_schedule(row, field):
+    try:
+        return parse_schedule(text(row, field) or None)
+    except ValueError:
+        raise RowError('%s must be daily, weekly, monthly, a number of days or a repeat rule' % field)
+
+
+def valid_history(value):
+    if not value:
+        return []
+    entries = value.split(';') if isinstance(value, str) else value
+    if not isinstance(entries, list):
+        raise RowError('history must be a list of timestamps')
+    try:
+        completed = [datetime.fromisoformat(str(entry).strip()) for entry in entries if entry]
+    except ValueError as e:
+        raise RowError('history: %s' % e)
+    # Due times are naive local time, which an offset cannot be compared with
+    for when in completed:
+        if when.tzinfo is not None:
+            raise RowError('history: %s has a UTC offset; give local time without one' % when.isoformat())
+    return sorted(when.isoformat() for when in completed)
+
+
+def import_stream(household, chunks, fmt='ndjson', sync=False):
+    """Imports an iterable of byte chunks and returns the report."""
+    return Importer(household).run(parse_rows(iter_lines(chunks), fmt), sync=sync)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('command', choices=('import', 'export'))
+    parser.add_argument('file', nargs='?', default='-', help='rows to import, or where to export (default: stdio)')
+    parser.add_argument('-f', '--format', choices=MIMETYPES, default='ndjson')
+    parser.add_argument('-d', '--data', default='chores.yaml', help='household data file')
+    args = parser.parse_intermixed_args(argv)
+
+    store = YamlStore(args.data, default=empty_document, watch=False)
+    household = Household(store)
+    if args.command == 'export':
+        out = sys.stdout.buffer if args.file == '-' else open(args.file, 'wb')
+        with out:
+            for chunk in export_stream(household, args.format):
+                out.write(chunk)
+        return 0
+    source = sys.stdin.buffer if args.file == '-' else open(args.file, 'rb')
+    with source:
+        report = import_stream(household, read_chunks(source), args.format, sync=True)
+    store.close()
+    json.dump(report, sys.stderr, indent=2)
+    sys.stderr.write('\n')
+    return 1 if report['rejected'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())